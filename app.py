@@ -1,56 +1,96 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-import pandas as pd
 import os
 from datetime import datetime, date
 import io
-from docx import Document
-from docx.shared import Inches
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import tempfile
+import itertools
+import click
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 from config import Config
 # إصلاح 1: إضافة النماذج الناقصة
-from models import db, Member, Payment, Project, Expense, Assistance, Spoilage, Asset
+from models import db, configure_sqlite, Member, Payment, Project, Expense, Assistance, Spoilage, Asset, Job
+from financial_summary import get_financial_totals, rebuild_financial_summary
+from asset_snapshots import DEPRECIATION_METHODS, asset_valuations, current_period, latest_snapshot_period, valuation_totals
+from reports import assistance_stats, spoilage_stats
+from search import SOURCES, SOURCES_BY_KIND, install_search_index, matching_ids, search
+from arrears import get_arrears_totals, get_top_arrears, ranked_arrears, rebuild_arrears
+from grid_changes import ChangeSet
+from fiscal_calendar import current_fiscal_year, get_fiscal_periods, get_period_keys
+from jobs import enqueue_job, get_results_folder, purge_finished_jobs, requeue_interrupted_jobs, work
+from perf import perf
+from http_cache import http_cache
+from data_version import track_data_versions
+from publish import publisher
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # تهيئة قاعدة البيانات
 db.init_app(app)
+configure_sqlite(app)
+# أرقام إصدار البيانات (لإبطال ذاكرة الصفحات وإعادة النشر)
+track_data_versions(app)
+# قياس تكلفة الطلبات (الاستعلامات وزمن القاعدة والقوالب)
+perf.init_app(app)
+# ذاكرة الصفحات العامة (ETag وإبطال برقم إصدار البيانات)
+http_cache.init_app(app)
+# نشر الصفحات العامة كملفات ثابتة (flask publish أو تلقائياً بعد كل commit)
+publisher.init_app(app)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'xlsx', 'xls'}
 
-def get_current_year_months():
-    """الحصول على الأشهر الحالية للسنة المالية"""
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-    
-    # تحديد السنة المالية (من نوفمبر إلى أكتوبر)
-    if current_month >= 11:  # نوفمبر وديسمبر
-        financial_year_start = current_year
-        financial_year_end = current_year + 1
-    else:  # يناير إلى أكتوبر
-        financial_year_start = current_year - 1
-        financial_year_end = current_year
-    
-    months = []
-    # أشهر السنة المالية
-    for month in [11, 12]:  # نوفمبر وديسمبر
-        months.append((f'شهر{month}', month, financial_year_start))
-    
-    for month in range(1, 11):  # يناير إلى أكتوبر
-        months.append((f'شهر{month}', month, financial_year_end))
+def wants_json():
+    """هل يطلب العميل استجابة JSON بدلاً من HTML"""
+    return request.args.get('format') == 'json' or request.headers.get('Content-Type') == 'application/json'
+
+def get_members_page(*options):
+    """قراءة معاملات الترقيم والفلترة وإرجاع (الصفحة، العدد الكلي، الفلاتر)"""
+    per_page = request.args.get('per_page', type=int, default=app.config['MEMBERS_PER_PAGE'])
+    filters = {
+        'village': request.args.get('village') or None,
+        'status': request.args.get('status') or None,
+        'per_page': max(1, min(per_page, app.config['MEMBERS_MAX_PER_PAGE'])),
+    }
+    query = Member.filtered(filters['village'], filters['status'])
+    total = query.count()
+    page = Member.keyset_page(query.options(*options), filters['per_page'],
+                              after=request.args.get('after', type=int),
+                              before=request.args.get('before', type=int))
+    return page, total, filters
+
+def get_collection_totals(query, periods):
+    """إجماليات التحصيل لكل المشتركين المطابقين للفلاتر (لا للصفحة المعروضة فقط) باستعلامي تجميع
     
-    return months
+    المتوقع لكل شهر هو مبلغ سطر الدفعة إن وُجد وإلا MONTHLY_PAYMENT_AMOUNT.
+    """
+    members, fees = query.with_entities(
+        db.func.count(Member.id), db.func.coalesce(db.func.sum(Member.membership_fee), 0)
+    ).one()
+    member_ids = query.with_entities(Member.id).scalar_subquery()
+    rows, amounts, paid = db.session.query(
+        db.func.count(Payment.id),
+        db.func.coalesce(db.func.sum(Payment.amount), 0),
+        db.func.coalesce(db.func.sum(db.case((Payment.is_paid == True, Payment.amount), else_=0)), 0),
+    ).filter(
+        Payment.member_id.in_(member_ids),
+        Payment.period.in_([year * 100 + month for month, year in periods])
+    ).one()
+    missing = members * len(periods) - rows
+    return {
+        'membership_fees': fees,
+        'monthly_payments': paid,
+        'expected_payments': amounts + missing * app.config['MONTHLY_PAYMENT_AMOUNT'],
+    }
+
+def get_villages():
+    """قائمة القرى المسجلة لفلاتر الصفحات"""
+    rows = db.session.query(Member.village).filter(Member.village.isnot(None), Member.village != '') \
+        .distinct().order_by(Member.village).all()
+    return [row[0] for row in rows]
 
 def admin_required(f):
     """ديكوريتر للتحقق من تسجيل دخول المدير"""
@@ -64,12 +104,14 @@ def admin_required(f):
     return decorated_function
 
 @app.route('/')
+@http_cache.cached
 def index():
     """الصفحة الرئيسية"""
     total_members = Member.query.count()
     total_projects = Project.query.count()
-    total_paid = db.session.query(db.func.sum(Payment.amount)).filter(Payment.is_paid == True).scalar() or 0
-    total_expenses = db.session.query(db.func.sum(Expense.amount)).scalar() or 0
+    totals = get_financial_totals()
+    total_paid = totals.collected
+    total_expenses = totals.expenses
     balance = total_paid - total_expenses
     
     recent_projects = Project.query.order_by(Project.created_date.desc()).limit(3).all()
@@ -83,13 +125,14 @@ def index():
                          recent_projects=recent_projects)
 
 @app.route('/members')
+@http_cache.cached
 def members():
     """صفحة المشتركين"""
-    members_list = Member.query.all()
+    page, total, filters = get_members_page(selectinload(Member.payments))
     
     # إعداد بيانات المدفوعات لكل عضو
     members_data = []
-    for member in members_list:
+    for member in page:
         member_info = {
             'id': member.id,
             'number': member.member_number,
@@ -108,15 +151,31 @@ def members():
             
         members_data.append(member_info)
     
-    return render_template('members.html', members=members_data)
+    if wants_json():
+        return jsonify({
+            'members': members_data,
+            'total': total,
+            'per_page': page.per_page,
+            'next_after': page.next_after,
+            'prev_before': page.prev_before
+        })
+    
+    return render_template('members.html',
+                         members=members_data,
+                         page=page,
+                         total_members=total,
+                         filters=filters,
+                         villages=get_villages())
 
 @app.route('/projects')
+@http_cache.cached
 def projects():
     """صفحة المشاريع"""
     projects_list = Project.query.order_by(Project.created_date.desc()).all()
     return render_template('projects.html', projects=projects_list)
 
 @app.route('/expenses')
+@http_cache.cached
 def expenses():
     """صفحة المصروفات"""
     expenses_list = Expense.query.order_by(Expense.date.desc()).all()
@@ -164,49 +223,92 @@ def admin_logout():
 @admin_required
 def admin_dashboard():
     """لوحة تحكم المدير"""
+    totals = get_financial_totals()
     stats = {
         'total_members': Member.query.count(),
         'total_projects': Project.query.count(),
-        'total_paid': db.session.query(db.func.sum(Payment.amount)).filter(Payment.is_paid == True).scalar() or 0,
-        'total_expenses': db.session.query(db.func.sum(Expense.amount)).scalar() or 0,
+        'total_paid': totals.collected,
+        'total_expenses': totals.expenses,
     }
     stats['balance'] = stats['total_paid'] - stats['total_expenses']
+    # آخر شهر محسوب (تقييم الشهر الجديد يُحسب بأمر snapshot-assets في بدايته)
+    stats['assets_value'] = valuation_totals(latest_snapshot_period()).value
     
-    # الأعضاء المتأخرين في الدفع
-    unpaid_members = []
-    for member in Member.query.all():
-        unpaid_months = member.get_unpaid_months()
-        if unpaid_months:
-            unpaid_members.append({
-                'name': member.name,
-                'unpaid_months': unpaid_months
-            })
+    # الأعضاء المتأخرين في الدفع (من فهرس المتأخرات)
+    unpaid_members = get_top_arrears(app.config['ARREARS_DASHBOARD_LIMIT'])
+    unpaid_count, unpaid_total = get_arrears_totals()
     
-    return render_template('admin/dashboard.html', stats=stats, unpaid_members=unpaid_members)
+    return render_template('admin/dashboard.html', stats=stats, unpaid_members=unpaid_members,
+                           unpaid_count=unpaid_count, unpaid_total=unpaid_total)
+
+@app.route('/admin/arrears')
+@admin_required
+def admin_arrears():
+    """قائمة المتأخرين في الدفع مرتبة بالمبلغ المستحق"""
+    page = request.args.get('page', type=int, default=1)
+    arrears = ranked_arrears().paginate(page=page, per_page=app.config['ARREARS_PER_PAGE'], error_out=False)
+    unpaid_count, unpaid_total = get_arrears_totals()
+    if wants_json():
+        return jsonify({
+            'arrears': [row.to_dict() for row in arrears.items],
+            'page': arrears.page,
+            'pages': arrears.pages,
+            'total': unpaid_count,
+            'total_owed': unpaid_total,
+        })
+    return render_template('admin/arrears.html', arrears=arrears,
+                           unpaid_count=unpaid_count, unpaid_total=unpaid_total)
 
 @app.route("/admin/members")
 @admin_required
 def admin_members():
     """إدارة المشتركين مع دعم السنوات"""
+    from payment_matrix import PaymentMatrix
     current_year = request.args.get('year', type=int, default=datetime.now().year)
-    members_list = Member.query.all()
+    page, total, filters = get_members_page()
+    matrix = PaymentMatrix.build(page.items, [(month, current_year) for month in range(1, 13)])
+    
+    if wants_json():
+        return jsonify({
+            'members': [{
+                'id': member.id,
+                'member_number': member.member_number,
+                'name': member.name,
+                'village': member.village,
+                'membership_fee': member.membership_fee,
+                'payments': {
+                    month: cell._asdict()
+                    for month, cell in ((month, matrix.cell(member.id, month, current_year)) for month in range(1, 13))
+                    if cell
+                }
+            } for member in page],
+            'year': current_year,
+            'total': total,
+            'per_page': page.per_page,
+            'next_after': page.next_after,
+            'prev_before': page.prev_before
+        })
     
     # إعداد بيانات المشتركين مع المدفوعات للسنة المحددة
     members_data = []
-    for member in members_list:
+    for member in page:
         member_info = {
             'id': member.id,
             'member_number': member.member_number,
             'name': member.name,
             'village': member.village,
-            'membership_fee': member.membership_fee,
-            'get_payment_for_month': member.get_payment_for_month
+            'membership_fee': member.membership_fee
         }
         members_data.append(member_info)
     
     return render_template('admin/members_manage.html', 
                          members=members_data, 
-                         current_year=current_year)
+                         current_year=current_year,
+                         matrix=matrix,
+                         page=page,
+                         total_members=total,
+                         filters=filters,
+                         villages=get_villages())
 
 @app.route("/admin/payments")
 @admin_required
@@ -215,21 +317,16 @@ def admin_payments():
     current_month = request.args.get('month', type=int, default=datetime.now().month)
     current_year = request.args.get('year', type=int, default=datetime.now().year)
 
-    members_list = Member.query.all()
+    # استعلام مجمّع واحد بدلاً من 2N+1 استعلام (دفعة الشهر + تحميل مدفوعات كل عضو)
+    rows = Member.query_payment_status(current_month, current_year).all()
     payment_data = []
     paid_count = 0
     unpaid_count = 0
     total_amount = 0
 
-    for member in members_list:
-        payment = Payment.query.filter_by(
-            member_id=member.id,
-            month=current_month,
-            year=current_year
-        ).first()
-
-        is_paid = payment.is_paid if payment else False
-        amount = payment.amount if payment else member.membership_fee / 12  # افتراض مبلغ شهري
+    for member, month_is_paid, month_amount, total_paid, months_paid in rows:
+        is_paid = bool(month_is_paid)
+        amount = month_amount if month_amount is not None else member.membership_fee / 12  # افتراض مبلغ شهري
 
         if is_paid:
             paid_count += 1
@@ -241,9 +338,9 @@ def admin_payments():
             'member': member,
             'is_paid': is_paid,
             'amount': amount,
-            'total_paid': member.get_total_paid(),
-            'months_paid': member.get_months_paid(),
-            'remaining_balance': member.get_remaining_balance()
+            'total_paid': total_paid,
+            'months_paid': months_paid,
+            'remaining_balance': max(0, member.membership_fee * 12 - total_paid)
         })
 
     return render_template('admin/payments_manage.html',
@@ -252,15 +349,38 @@ def admin_payments():
                            current_year=current_year,
                            paid_count=paid_count,
                            unpaid_count=unpaid_count,
-                           total_members=len(members_list),
+                           total_members=len(rows),
                            total_amount=total_amount)
 
+@app.route("/admin/payments/excel")
+@admin_required
+def admin_payments_excel():
+    """جدول المدفوعات بواجهة Excel لأشهر سنة مالية (الافتراضي: الحالية)"""
+    from payment_matrix import PaymentMatrix
+    fiscal_year = request.args.get('fiscal_year', type=int, default=current_fiscal_year())
+    page, total, filters = get_members_page()
+    periods = get_period_keys(fiscal_year)
+    matrix = PaymentMatrix.build(page.items, periods)
+    totals = get_collection_totals(Member.filtered(filters['village'], filters['status']), periods)
+    
+    return render_template('admin/payments_excel_enhanced.html',
+                         members=page.items,
+                         matrix=matrix,
+                         page=page,
+                         total_members=total,
+                         page_membership_fees=sum(member.membership_fee or 0 for member in page),
+                         total_membership_fees=totals['membership_fees'],
+                         total_monthly_payments=totals['monthly_payments'],
+                         total_collected=totals['membership_fees'] + totals['monthly_payments'],
+                         total_expected=totals['membership_fees'] + totals['expected_payments'],
+                         monthly_amount=app.config['MONTHLY_PAYMENT_AMOUNT'])
+
 @app.route("/admin/toggle_payment/<int:member_id>/<int:month>/<int:year>", methods=['POST'])
 @admin_required
 def admin_toggle_payment(member_id, month, year):
     """تبديل حالة دفع عضو لشهر معين"""
     try:
-        payment = Payment.query.filter_by(member_id=member_id, month=month, year=year).first()
+        payment = Payment.find(member_id, month, year)
         if payment:
             payment.is_paid = not payment.is_paid
             payment.payment_date = datetime.now() if payment.is_paid else None
@@ -339,13 +459,12 @@ def add_member():
         db.session.flush()
         
         # إنشاء المدفوعات الشهرية للسنة المالية الحالية
-        months = get_current_year_months()
-        for month_name, month_num, year in months:
+        for period in get_fiscal_periods(current_fiscal_year()):
             payment = Payment(
                 member_id=member.id,
-                month=month_num,
-                year=year,
-                amount=1000,
+                month=period.month,
+                year=period.year,
+                amount=app.config['MONTHLY_PAYMENT_AMOUNT'],
                 is_paid=False
             )
             db.session.add(payment)
@@ -426,18 +545,14 @@ def update_payment():
         is_paid = payment_data['is_paid']
         
         # البحث عن الدفعة أو إنشاؤها
-        payment = Payment.query.filter_by(
-            member_id=member_id,
-            month=month,
-            year=year
-        ).first()
+        payment = Payment.find(member_id, month, year)
         
         if not payment:
             payment = Payment(
                 member_id=member_id,
                 month=month,
                 year=year,
-                amount=1000,
+                amount=app.config['MONTHLY_PAYMENT_AMOUNT'],
                 is_paid=is_paid,
                 payment_date=datetime.now() if is_paid else None
             )
@@ -545,11 +660,13 @@ def expense_categories():
 @admin_required
 def expense_reports():
     """تقارير المصروفات"""
-    # تقرير شهري
-    monthly_expenses = db.session.query(
-        db.func.strftime('%Y-%m', Expense.date).label('month'),
-        db.func.sum(Expense.amount).label('total')
-    ).group_by(db.func.strftime('%Y-%m', Expense.date)).all()
+    # تقرير شهري (التجميع على عمود period المفهرس)
+    monthly_expenses = [
+        (f'{period // 100}-{period % 100:02d}', total)
+        for period, total in db.session.query(
+            Expense.period, db.func.sum(Expense.amount).label('total')
+        ).filter(Expense.period.isnot(None)).group_by(Expense.period).order_by(Expense.period)
+    ]
     
     # تقرير حسب الفئة
     category_expenses = db.session.query(
@@ -568,26 +685,27 @@ def expense_reports():
 @app.route('/admin/bulk_add_expenses', methods=['GET', 'POST'])
 @admin_required
 def bulk_add_expenses():
-    """إضافة مصروفات متعددة"""
+    """إضافة مصروفات متعددة (JSON من الواجهة أو ملف CSV/Excel) في مهمة خلفية مع أخطاء لكل صف
+    
+    الطلب يحفظ البيانات ويعيد المهمة (202)، والواجهة تستطلع حالتها حتى تظهر النتيجة.
+    """
     if request.method == 'POST':
         try:
-            expenses_data = request.get_json()
-            
-            for expense_data in expenses_data:
-                expense = Expense(
-                    description=expense_data['description'],
-                    amount=float(expense_data['amount']),
-                    category=expense_data.get('category', 'أخرى'),
-                    date=datetime.strptime(expense_data['date'], '%Y-%m-%d') if expense_data.get('date') else datetime.now()
-                )
-                db.session.add(expense)
-            
-            db.session.commit()
-            return jsonify({'success': True, 'message': 'تم إضافة المصروفات بنجاح'})
-            
+            name = f'expenses_{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}'
+            file = request.files.get('file')
+            if file and file.filename:
+                extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+                path = os.path.join(get_results_folder(app), f'{name}.{secure_filename(extension)}')
+                file.save(path)
+            else:
+                path = os.path.join(get_results_folder(app), f'{name}.json')
+                with open(path, 'wb') as f:
+                    f.write(request.get_data())
+            job = enqueue_job('import_expenses', path=path, dry_run=request.values.get('dry_run') == '1')
         except Exception as e:
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)})
+        return jsonify({**job.to_dict(), 'status_url': url_for('job_status', job_id=job.id, format='json')}), 202
     
     return render_template('admin/bulk_add_expenses.html')
 
@@ -603,9 +721,7 @@ def expense_search():
     expenses_query = Expense.query
     
     if query:
-        expenses_query = expenses_query.filter(
-            Expense.description.contains(query)
-        )
+        expenses_query = expenses_query.filter(Expense.id.in_(matching_ids(query, 'expense')))
     
     if category:
         expenses_query = expenses_query.filter(Expense.category == category)
@@ -635,53 +751,66 @@ def expense_search():
     
     return render_template('admin/expense_search.html', expenses=expenses)
 
+@app.route('/admin/search')
+@admin_required
+def admin_search():
+    """بحث نصي مرتب بالصلة في المصروفات والمساعدات والتوالف والمشاريع"""
+    query = request.args.get('q', '').strip()
+    kinds = [kind for kind in request.args.getlist('kind') if kind in SOURCES_BY_KIND]
+    page = request.args.get('page', type=int, default=1)
+    try:
+        results = search(query, kinds or None, page=page, per_page=app.config['SEARCH_PER_PAGE'])
+    except Exception as e:
+        db.session.rollback()
+        if wants_json():
+            return jsonify({'success': False, 'error': str(e)}), 500
+        flash(f'خطأ في البحث: {str(e)}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    if wants_json():
+        return jsonify({
+            'success': True,
+            'total': results.total,
+            'page': results.page,
+            'pages': results.pages,
+            'results': [{
+                'kind': hit.kind,
+                'id': hit.id,
+                'title': hit.title,
+                'summary': hit.summary,
+            } for hit in results.items]
+        })
+    return render_template('admin/search.html', query=query, kinds=kinds, sources=SOURCES, results=results)
+
 # إصلاح 2: نقل المسارات من أسفل الملف إلى هنا
 @app.route('/admin/save_changes', methods=['POST'])
 @admin_required
 def save_changes():
-    """حفظ التغييرات على المشتركين والمدفوعات"""
+    """حفظ تغييرات جدول المشتركين والمدفوعات دفعة واحدة مع نتيجة لكل تغيير"""
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        return jsonify({'success': False, 'error': 'قائمة التغييرات غير صالحة'}), 400
+    
     try:
-        data = request.get_json()
-        changes = data.get('changes', [])
-        
-        for change in changes:
-            if change['type'] == 'payment':
-                # تحديث حالة الدفع
-                payment = Payment.query.filter_by(
-                    member_id=change['member_id'],
-                    month=change['month'],
-                    year=change['year']
-                ).first()
-                
-                if not payment:
-                    # إنشاء دفعة جديدة
-                    payment = Payment(
-                        member_id=change['member_id'],
-                        month=change['month'],
-                        year=change['year'],
-                        amount=1000,
-                        is_paid=change['is_paid'],
-                        payment_date=datetime.now() if change['is_paid'] else None
-                    )
-                    db.session.add(payment)
-                else:
-                    payment.is_paid = change['is_paid']
-                    payment.payment_date = datetime.now() if change['is_paid'] else None
-                    
-            elif change['type'] == 'member':
-                # تحديث بيانات المشترك
-                member = Member.query.get(change['id'])
-                if member:
-                    member.name = change['name']
-                    member.village = change['village']
-                    member.membership_fee = change['membership_fee']
-        
+        change_set = ChangeSet(changes)
+        results = change_set.apply()
         db.session.commit()
-        return jsonify({'success': True})
-        
+    except IntegrityError:
+        # أضاف مدير آخر نفس الدفعة في نفس اللحظة
+        db.session.rollback()
+        return jsonify({'success': False, 'conflict': True,
+                        'error': 'تم تعديل البيانات من مستخدم آخر، يرجى إعادة تحميل الصفحة'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
+    
+    counts = change_set.counts()
+    failed = sum(count for status, count in counts.items() if status in ('conflict', 'not_found', 'invalid'))
+    response = {'success': not failed, 'results': results, 'counts': counts}
+    if failed:
+        response['error'] = f'لم يُحفظ {failed} تغيير بسبب تعارض أو بيانات غير صالحة'
+    return jsonify(response)
 
 # ===== مسارات إدارة المساعدات والمساهمات =====
 
@@ -795,37 +924,12 @@ def delete_assistance(assistance_id):
 @admin_required
 def assistance_report():
     """تقرير المساعدات"""
-    assistances = Assistance.query.order_by(Assistance.date_received.desc()).all()
-    
-    # إحصائيات المساعدات
-    stats = {
-        'total_count': len(assistances),
-        'total_amount': sum(assistance.amount for assistance in assistances),
-        'by_type': {},
-        'by_source': {},
-        'by_year': {}
-    }
-    
-    for assistance in assistances:
-        # حسب النوع
-        if assistance.assistance_type not in stats['by_type']:
-            stats['by_type'][assistance.assistance_type] = {'count': 0, 'amount': 0}
-        stats['by_type'][assistance.assistance_type]['count'] += 1
-        stats['by_type'][assistance.assistance_type]['amount'] += assistance.amount
-        
-        # حسب المصدر
-        if assistance.source not in stats['by_source']:
-            stats['by_source'][assistance.source] = {'count': 0, 'amount': 0}
-        stats['by_source'][assistance.source]['count'] += 1
-        stats['by_source'][assistance.source]['amount'] += assistance.amount
-        
-        # حسب السنة
-        year = assistance.date_received.year
-        if year not in stats['by_year']:
-            stats['by_year'][year] = {'count': 0, 'amount': 0}
-        stats['by_year'][year]['count'] += 1
-        stats['by_year'][year]['amount'] += assistance.amount
-    
+    stats = assistance_stats()
+    page = request.args.get('page', type=int, default=1)
+    assistances = Assistance.query.order_by(Assistance.date_received.desc(), Assistance.id.desc()) \
+        .paginate(page=page, per_page=app.config['REPORT_DETAIL_PER_PAGE'], error_out=False)
+    if wants_json():
+        return jsonify({'stats': stats, 'page': assistances.page, 'pages': assistances.pages})
     return render_template('admin/assistance_report.html', 
                          assistances=assistances, 
                          stats=stats)
@@ -850,8 +954,11 @@ def admin_spoilage():
             spoilage_by_category[spoilage.category] = []
         spoilage_by_category[spoilage.category].append(spoilage)
     
+    assets = db.session.query(Asset.id, Asset.name).order_by(Asset.name).all()
+    
     return render_template('admin/spoilage_manage.html', 
                          spoilages=spoilages,
+                         assets=assets,
                          total_spoilage=total_spoilage,
                          total_original=total_original,
                          spoilage_by_category=spoilage_by_category)
@@ -869,6 +976,9 @@ def add_spoilage():
         category = request.form.get('category')
         notes = request.form.get('notes')
         
+        # الأصل المختار من القائمة، أو أول أصل بنفس الاسم
+        asset_id = request.form.get('asset_id', type=int) or Asset.find_by_name(item_name)
+        
         spoilage = Spoilage(
             item_name=item_name,
             description=description,
@@ -876,17 +986,15 @@ def add_spoilage():
             spoilage_value=spoilage_value,
             spoilage_reason=spoilage_reason,
             category=category,
-            notes=notes
+            notes=notes,
+            asset_id=asset_id
         )
         
         db.session.add(spoilage)
         
-        # تحديث قيمة الأصل المقابل إذا وجد
-        asset = Asset.query.filter_by(name=item_name).first()
-        if asset:
-            asset.current_value = max(0, asset.current_value - spoilage_value)
-            if asset.current_value == 0:
-                asset.status = 'تالف'
+        # قيمة الأصل المقابل تُعاد حسابها مع التلف عند الحفظ، وتُحدَّث حالته إن أصبحت صفراً
+        if asset_id:
+            Asset.refresh_status(asset_id)
         
         db.session.commit()
         flash('تم إضافة التلف بنجاح وخصمه من الأصول', 'success')
@@ -903,7 +1011,7 @@ def edit_spoilage(spoilage_id):
     """تعديل تلف"""
     try:
         spoilage = Spoilage.query.get_or_404(spoilage_id)
-        old_value = spoilage.spoilage_value
+        old_asset_id = spoilage.asset_id
         
         spoilage.item_name = request.form.get('item_name')
         spoilage.description = request.form.get('description')
@@ -914,16 +1022,17 @@ def edit_spoilage(spoilage_id):
         spoilage.notes = request.form.get('notes')
         spoilage.status = request.form.get('status')
         
-        # تحديث قيمة الأصل المقابل
-        asset = Asset.query.filter_by(name=spoilage.item_name).first()
-        if asset:
-            # إعادة القيمة القديمة وخصم الجديدة
-            asset.current_value += old_value
-            asset.current_value = max(0, asset.current_value - spoilage.spoilage_value)
-            if asset.current_value == 0:
-                asset.status = 'تالف'
-            elif spoilage.status == 'مُصلح':
-                asset.status = 'فعال'
+        # الأصل المختار، أو حسب الاسم إن اختير ذلك أو لم يكن التلف مرتبطاً بأصل
+        if request.form.get('asset_id'):
+            spoilage.asset_id = request.form.get('asset_id', type=int)
+        elif 'asset_id' in request.form or old_asset_id is None:
+            spoilage.asset_id = Asset.find_by_name(spoilage.item_name)
+        
+        # حالة الأصل المقابل (والأصل السابق إن نُقل التلف) بعد إعادة حساب قيمته
+        if old_asset_id and old_asset_id != spoilage.asset_id:
+            Asset.refresh_status(old_asset_id, revive=True)
+        if spoilage.asset_id:
+            Asset.refresh_status(spoilage.asset_id, revive=spoilage.status == 'مُصلح')
         
         db.session.commit()
         flash('تم تحديث التلف بنجاح', 'success')
@@ -940,15 +1049,12 @@ def delete_spoilage(spoilage_id):
     """حذف تلف"""
     try:
         spoilage = Spoilage.query.get_or_404(spoilage_id)
-        
-        # إعادة القيمة للأصل المقابل
-        asset = Asset.query.filter_by(name=spoilage.item_name).first()
-        if asset:
-            asset.current_value += spoilage.spoilage_value
-            if asset.status == 'تالف' and asset.current_value > 0:
-                asset.status = 'فعال'
+        asset_id = spoilage.asset_id
         
         db.session.delete(spoilage)
+        # إعادة القيمة للأصل المقابل (تُحسب بدون التلف عند الحفظ)
+        if asset_id:
+            Asset.refresh_status(asset_id, revive=True)
         db.session.commit()
         flash('تم حذف التلف بنجاح وإعادة قيمته للأصول', 'success')
         
@@ -962,41 +1068,12 @@ def delete_spoilage(spoilage_id):
 @admin_required
 def spoilage_report():
     """تقرير التوالف"""
-    spoilages = Spoilage.query.order_by(Spoilage.spoilage_date.desc()).all()
-    
-    # إحصائيات التوالف
-    stats = {
-        'total_count': len(spoilages),
-        'total_original': sum(spoilage.original_value for spoilage in spoilages),
-        'total_spoilage': sum(spoilage.spoilage_value for spoilage in spoilages),
-        'by_category': {},
-        'by_reason': {},
-        'by_year': {}
-    }
-    
-    for spoilage in spoilages:
-        # حسب الفئة
-        if spoilage.category not in stats['by_category']:
-            stats['by_category'][spoilage.category] = {'count': 0, 'value': 0}
-        stats['by_category'][spoilage.category]['count'] += 1
-        stats['by_category'][spoilage.category]['value'] += spoilage.spoilage_value
-        
-        # حسب السبب
-        if spoilage.spoilage_reason not in stats['by_reason']:
-            stats['by_reason'][spoilage.spoilage_reason] = {'count': 0, 'value': 0}
-        stats['by_reason'][spoilage.spoilage_reason]['count'] += 1
-        stats['by_reason'][spoilage.spoilage_reason]['value'] += spoilage.spoilage_value
-        
-        # حسب السنة
-        year = spoilage.spoilage_date.year
-        if year not in stats['by_year']:
-            stats['by_year'][year] = {'count': 0, 'value': 0}
-        stats['by_year'][year]['count'] += 1
-        stats['by_year'][year]['value'] += spoilage.spoilage_value
-    
-    # حساب نسبة التلف
-    stats['spoilage_percentage'] = (stats['total_spoilage'] / stats['total_original'] * 100) if stats['total_original'] > 0 else 0
-    
+    stats = spoilage_stats()
+    page = request.args.get('page', type=int, default=1)
+    spoilages = Spoilage.query.order_by(Spoilage.spoilage_date.desc(), Spoilage.id.desc()) \
+        .paginate(page=page, per_page=app.config['REPORT_DETAIL_PER_PAGE'], error_out=False)
+    if wants_json():
+        return jsonify({'stats': stats, 'page': spoilages.page, 'pages': spoilages.pages})
     return render_template('admin/spoilage_report.html', 
                          spoilages=spoilages, 
                          stats=stats)
@@ -1006,27 +1083,56 @@ def spoilage_report():
 @app.route("/admin/assets")
 @admin_required
 def admin_assets():
-    """إدارة الأصول"""
-    assets = Asset.query.order_by(Asset.purchase_date.desc()).all()
-    
-    # حساب إجمالي الأصول
-    total_purchase_value = sum(asset.purchase_value for asset in assets)
-    total_current_value = sum(asset.get_current_value() for asset in assets)
-    total_depreciation = total_purchase_value - total_current_value
-    
-    return render_template('admin/assets_manage.html', 
-                         assets=assets,
-                         total_purchase_value=total_purchase_value,
-                         total_current_value=total_current_value,
-                         total_depreciation=total_depreciation)
+    """إدارة الأصول: التقييم في نهاية الشهر من أسطر asset_snapshots.py (الشهر الحالي افتراضياً)"""
+    period = current_period()
+    if request.args.get('month'):
+        try:
+            as_of = datetime.strptime(request.args['month'], '%Y-%m')
+            period = as_of.year * 100 + as_of.month
+        except ValueError:
+            flash('صيغة الشهر غير صحيحة (YYYY-MM)', 'error')
+    valuations = asset_valuations(period)
+    totals = valuation_totals(period)
+    computed = totals.count > 0 or not valuations
+    if wants_json():
+        return jsonify({
+            'period': period,
+            'computed': computed,
+            'totals': totals._asdict(),
+            'assets': [{'id': asset.id, 'name': asset.name, 'value': snapshot.value if snapshot else None}
+                       for asset, snapshot in valuations],
+        })
+    return render_template('admin/assets_manage.html',
+                         valuations=valuations,
+                         totals=totals,
+                         period=period,
+                         computed=computed,
+                         methods=DEPRECIATION_METHODS)
 
 # إصلاح 3: إضافة المسارات الناقصة لمنع الأخطاء
 @app.route('/export/members')
 @admin_required
 def export_members_excel():
-    # يمكنك إضافة منطق تصدير اكسل هنا لاحقاً
-    flash('ميزة التصدير إلى Excel قيد التطوير حالياً.', 'info')
-    return redirect(url_for('admin_members'))
+    """تصدير الأعضاء والمدفوعات إلى Excel كاستجابة متدفقة (الصفوف تُقرأ من المؤشر أثناء الإرسال)
+    
+    نفس الملف متاح كمهمة خلفية من صفحة المهام (export_members_excel).
+    """
+    from excel_utils import ExcelManager
+    chunks = ExcelManager.iter_members_xlsx(request.args.get('fiscal_year', type=int))
+    try:
+        # أول جزء يُولَّد هنا حتى تظهر أخطاء الاستعلام كرسالة بدلاً من ملف مقطوع
+        first = next(chunks)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'حدث خطأ في التصدير: {str(e)}', 'error')
+        return redirect(url_for('admin_members'))
+    
+    filename = f'members_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return Response(
+        stream_with_context(itertools.chain([first], chunks)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @app.route('/export/expenses')
 @admin_required
@@ -1045,23 +1151,39 @@ def edit_project(project_id):
 @app.route('/export/members_word')
 @admin_required
 def export_members_word():
-    """تصدير قائمة الأعضاء إلى ملف Word (قيد التطوير)"""
-    flash('ميزة التصدير إلى Word قيد التطوير حالياً.', 'info')
-    return redirect(url_for('admin_dashboard'))
+    """تصدير قائمة الأعضاء إلى ملف Word من القالب (يُعاد استخدام المستند إن لم تتغير البيانات)"""
+    from word_reports import word_reports
+    try:
+        entry = word_reports.get('members', request.args.get('fiscal_year', type=int))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'حدث خطأ في إنشاء ملف Word: {str(e)}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    return send_file(io.BytesIO(entry.body), mimetype=entry.content_type, as_attachment=True,
+                     download_name=f'members_{datetime.now().strftime("%Y%m%d")}.docx', etag=entry.etag, max_age=0)
 
 # ===== إضافة المسارات الناقصة من لوحة التحكم =====
 
+def send_pdf_report(name, kind):
+    """تقرير PDF من ذاكرة التقارير فوراً إن لم تتغير بياناته، وإلا يُولَّد في مهمة خلفية"""
+    from pdf_reports import pdf_reports
+    path = pdf_reports.cached(name, request.args.get('fiscal_year', type=int))
+    if path is None:
+        return start_background_job(kind)
+    return send_file(os.path.abspath(path), mimetype='application/pdf', as_attachment=True,
+                     download_name=f'{name}_{datetime.now().strftime("%Y%m%d")}.pdf', max_age=0)
+
 @app.route('/export/members_pdf')
 @admin_required
 def export_members_pdf():
-    flash('ميزة تصدير PDF قيد التطوير حالياً.', 'info')
-    return redirect(url_for('admin_dashboard'))
+    """تقرير المشتركين PDF: المدفوع في السنة المالية والمتأخرات"""
+    return send_pdf_report('members', 'export_members_pdf')
 
 @app.route('/export/payments_report')
 @admin_required
 def export_payments_report():
-    flash('ميزة تقرير المدفوعات قيد التطوير حالياً.', 'info')
-    return redirect(url_for('admin_dashboard'))
+    """تقرير المدفوعات PDF: المبلغ المدفوع لكل مشترك في كل شهر من السنة المالية"""
+    return send_pdf_report('payments', 'export_payments_pdf')
 
 @app.route('/export/expenses_report')
 @admin_required
@@ -1072,8 +1194,145 @@ def export_expenses_report():
 @app.route('/admin/upload_excel', methods=['POST'])
 @admin_required
 def upload_excel():
-    flash('ميزة رفع ملف Excel قيد التطوير حالياً.', 'info')
-    return redirect(url_for('admin_dashboard'))
+    """رفع ملف Excel واستيراده في مهمة خلفية"""
+    file = request.files.get('file')
+    if not file or not allowed_file(file.filename):
+        flash('يرجى اختيار ملف Excel صالح', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    try:
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        path = os.path.join(get_results_folder(app), f'import_{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}.{extension}')
+        file.save(path)
+        job = enqueue_job('import_excel', path=path, fiscal_year=request.form.get('fiscal_year', type=int))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'حدث خطأ في رفع الملف: {str(e)}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    flash('تم رفع الملف وبدأ الاستيراد في الخلفية', 'info')
+    return redirect(url_for('job_status', job_id=job.id))
+
+# ===== المهام الخلفية =====
+
+# أنواع المهام التي يمكن بدؤها مباشرة من الواجهة
+BACKGROUND_EXPORTS = {'export_members_excel', 'export_members_pdf', 'export_payments_pdf', 'snapshot_assets'}
+
+def start_background_job(kind):
+    """بدء مهمة تصدير للسنة المالية المطلوبة وتحويل المستخدم إلى صفحة حالتها"""
+    try:
+        job = enqueue_job(kind, fiscal_year=request.values.get('fiscal_year', type=int))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'تعذر بدء المهمة: {str(e)}', 'error')
+        return redirect(url_for('admin_jobs'))
+    if wants_json():
+        return jsonify(job.to_dict()), 202
+    return redirect(url_for('job_status', job_id=job.id))
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """قائمة آخر المهام الخلفية"""
+    jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+    if wants_json():
+        return jsonify({'jobs': [job.to_dict() for job in jobs]})
+    return render_template('admin/jobs.html', jobs=jobs)
+
+@app.route('/admin/perf')
+@admin_required
+def admin_perf():
+    """لوحة أداء المسارات: نسب الزمن وعدد الاستعلامات واشتباهات N+1"""
+    endpoint = request.args.get('route')
+    summary = perf.summary()
+    recent = perf.recent(endpoint) if endpoint else []
+    cache = http_cache.stats()
+    if wants_json():
+        return jsonify({'endpoints': summary, 'endpoint': endpoint, 'recent': recent, 'http_cache': cache})
+    return render_template('admin/perf.html', summary=summary, endpoint=endpoint, recent=recent, cache=cache)
+
+@app.route('/admin/perf/reset', methods=['POST'])
+@admin_required
+def admin_perf_reset():
+    """تفريغ سجلات الأداء"""
+    perf.reset()
+    flash('تم تفريغ سجلات الأداء', 'success')
+    return redirect(url_for('admin_perf'))
+
+@app.route('/admin/jobs/start/<kind>', methods=['POST'])
+@admin_required
+def start_job(kind):
+    """بدء مهمة تصدير في الخلفية"""
+    if kind not in BACKGROUND_EXPORTS:
+        flash('نوع المهمة غير مدعوم', 'error')
+        return redirect(url_for('admin_jobs'))
+    return start_background_job(kind)
+
+@app.route('/admin/jobs/<int:job_id>')
+@admin_required
+def job_status(job_id):
+    """حالة مهمة خلفية (HTML مع استطلاع دوري، أو JSON)"""
+    job = Job.query.get_or_404(job_id)
+    if wants_json():
+        return jsonify(job.to_dict())
+    return render_template('admin/job_status.html', job=job)
+
+@app.route('/admin/jobs/<int:job_id>/download')
+@admin_required
+def job_download(job_id):
+    """تنزيل ملف نتيجة المهمة"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'done' or not job.result_path or not os.path.exists(job.result_path):
+        flash('نتيجة المهمة غير متوفرة', 'error')
+        return redirect(url_for('job_status', job_id=job.id))
+    return send_file(os.path.abspath(job.result_path), as_attachment=True, download_name=job.result_name)
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='تنفيذ المهام المنتظرة ثم الخروج')
+@click.option('--requeue-before', default=None, help='إعادة المهام المنقطعة التي بدأت قبل هذا الوقت (ISO)')
+def run_jobs_command(once, requeue_before):
+    """تشغيل عامل المهام الخلفية في هذه العملية"""
+    if requeue_before:
+        requeue_interrupted_jobs(datetime.fromisoformat(requeue_before))
+    work(app, once=once)
+
+@app.cli.command('purge-jobs')
+@click.option('--hours', type=float, default=None, help='عمر المهام المحذوفة (الافتراضي JOB_RETENTION_HOURS)')
+def purge_jobs_command(hours):
+    """حذف المهام المنتهية القديمة وملفات نتائجها"""
+    count = purge_finished_jobs(app, hours)
+    print(f'تم حذف {count} مهمة منتهية')
+
+@app.cli.command('rebuild-summary')
+def rebuild_summary_command():
+    """إعادة بناء جدول الملخص المالي وفهرس المتأخرات من البيانات الأصلية"""
+    rebuild_financial_summary()
+    rebuild_arrears()
+    print('تمت إعادة بناء الملخص المالي وفهرس المتأخرات')
+
+@app.cli.command('snapshot-assets')
+@click.option('--months', default=12, show_default=True, help='عدد الأشهر المحسوبة حتى الشهر الحالي')
+def snapshot_assets_command(months):
+    """إعادة حساب تقييم الأصول الشهري (الاستهلاك والتوالف) لكل الأصول"""
+    from depreciation import rebuild_asset_snapshots
+    written = rebuild_asset_snapshots(months)
+    print(f'تم حساب {written} سطر تقييم لآخر {months} شهراً')
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """تثبيت فهرس البحث النصي ومشغلاته وإعادة تعبئته من الجداول الأصلية"""
+    install_search_index()
+    print('تمت إعادة بناء فهرس البحث')
+
+@app.cli.command('publish')
+@click.option('--force', is_flag=True, help='إعادة توليد كل الصفحات حتى لو لم تتغير جداولها')
+def publish_command(force):
+    """نشر الصفحات العامة كملفات ثابتة (مع gzip) في PUBLISH_DIR"""
+    published = publisher.publish(force=force)
+    if published:
+        print(f"تم نشر: {', '.join(published)} في {app.config['PUBLISH_DIR']}")
+    else:
+        print('لا توجد صفحات تغيرت منذ آخر نشر')
 
 
 # يجب أن يكون هذا الجزء هو آخر شيء في الملف
@@ -0,0 +1,75 @@
+from sqlalchemy import event, inspect
+from models import db, Payment, MemberArrears
+
+# حد عناصر جملة IN عند تحديث مجموعة كبيرة من المشتركين دفعة واحدة
+REFRESH_CHUNK_SIZE = 500
+
+ARREARS_COLUMNS = ('member_id', 'unpaid_count', 'oldest_period', 'amount_owed')
+
+def _arrears_select(member_ids=None):
+    """تجميع الأشهر غير المدفوعة لكل مشترك: العدد وأقدم شهر (YYYYMM) والمبلغ المستحق"""
+    query = db.select(
+        Payment.member_id,
+        db.func.count(Payment.id),
+        db.func.min(Payment.period),
+        db.func.coalesce(db.func.sum(Payment.amount), 0),
+    ).where(Payment.is_paid == False).group_by(Payment.member_id)
+    if member_ids is not None:
+        query = query.where(Payment.member_id.in_(member_ids))
+    return query
+
+def refresh_arrears(connection, member_ids=None):
+    """إعادة حساب أسطر المتأخرات لمشتركين محددين (أو للجميع) بجملتي DELETE و INSERT ... SELECT"""
+    table = MemberArrears.__table__
+    if member_ids is None:
+        connection.execute(table.delete())
+        connection.execute(table.insert().from_select(ARREARS_COLUMNS, _arrears_select()))
+        return
+    member_ids = sorted(member_ids)
+    for start in range(0, len(member_ids), REFRESH_CHUNK_SIZE):
+        chunk = member_ids[start:start + REFRESH_CHUNK_SIZE]
+        connection.execute(table.delete().where(table.c.member_id.in_(chunk)))
+        connection.execute(table.insert().from_select(ARREARS_COLUMNS, _arrears_select(chunk)))
+
+@event.listens_for(db.session, 'after_flush')
+def _update_arrears(session, flush_context):
+    """تحديث المتأخرات للمشتركين الذين تغيرت مدفوعاتهم في هذا الـ flush"""
+    member_ids = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Payment):
+            member_ids.add(obj.member_id)
+    for obj in session.dirty:
+        if isinstance(obj, Payment) and session.is_modified(obj, include_collections=False):
+            member_ids.add(obj.member_id)
+            # عند نقل الدفعة إلى مشترك آخر يتغير المشترك السابق أيضاً
+            member_ids.update(inspect(obj).attrs.member_id.history.deleted)
+    member_ids.discard(None)
+    if member_ids:
+        refresh_arrears(session.connection(), member_ids)
+
+def rebuild_arrears():
+    """إعادة بناء فهرس المتأخرات بالكامل (بعد الكتابة المجمعة أو للإصلاح)"""
+    refresh_arrears(db.session.connection())
+    db.session.commit()
+
+def _ensure_built():
+    """بناء الفهرس عند أول قراءة إن كان فارغاً رغم وجود أشهر غير مدفوعة"""
+    if db.session.query(MemberArrears.member_id).first() is None and \
+            db.session.query(Payment.id).filter(Payment.is_paid == False).first() is not None:
+        rebuild_arrears()
+
+def ranked_arrears():
+    """استعلام المتأخرين مرتباً بالمبلغ المستحق ثم عدد الأشهر (يستخدم فهرس ix_member_arrears_rank)"""
+    _ensure_built()
+    return MemberArrears.query.order_by(MemberArrears.amount_owed.desc(),
+                                        MemberArrears.unpaid_count.desc(),
+                                        MemberArrears.member_id.desc())
+
+def get_top_arrears(limit):
+    return ranked_arrears().limit(limit).all()
+
+def get_arrears_totals():
+    """(عدد المتأخرين، إجمالي المستحق) باستعلام واحد"""
+    count, owed = db.session.query(db.func.count(MemberArrears.member_id),
+                                   db.func.coalesce(db.func.sum(MemberArrears.amount_owed), 0)).one()
+    return count, owed
@@ -0,0 +1,85 @@
+"""أسطر تقييم الأصول الشهرية: القراءة للصفحات وإعادة الحساب عند تعديل أصل أو تلف
+
+الحساب نفسه في depreciation.py (NumPy) ويُستورد داخل ربط الـ flush عند الحاجة فقط، فلا يحمّل
+إقلاع التطبيق مكتبة NumPy.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import event, inspect
+from models import db, Asset, AssetSnapshot, Spoilage, period_key
+
+DECLINING_BALANCE = 'declining_balance'
+DEPRECIATION_METHODS = {'straight_line': 'قسط ثابت', DECLINING_BALANCE: 'قسط متناقص'}
+
+ValuationTotals = namedtuple('ValuationTotals', ['count', 'purchase_value', 'depreciation', 'spoilage', 'value'])
+
+def current_period():
+    return period_key(datetime.utcnow())
+
+def recent_periods(count, last=None):
+    """آخر count شهراً بصيغة YYYYMM منتهية بالشهر last (أو الحالي)"""
+    year, month = divmod(last or current_period(), 100)
+    periods = []
+    for _ in range(count):
+        periods.append(year * 100 + month)
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return periods[::-1]
+
+def snapshot_period_list():
+    """الأشهر التي لها أسطر تقييم محسوبة (تصاعدياً)"""
+    return [period for period, in db.session.execute(
+        db.select(AssetSnapshot.period).distinct().order_by(AssetSnapshot.period))]
+
+def latest_snapshot_period(period=None):
+    """آخر شهر محسوب حتى period (أو الحالي)، أو None إن لم يُحسب أي شهر"""
+    return db.session.execute(
+        db.select(db.func.max(AssetSnapshot.period)).where(AssetSnapshot.period <= (period or current_period()))
+    ).scalar()
+
+def asset_valuations(period=None):
+    """الأصول مع سطر تقييمها للشهر: [(Asset, AssetSnapshot أو None)] (قراءة فقط)"""
+    period = period or current_period()
+    return db.session.query(Asset, AssetSnapshot).outerjoin(
+        AssetSnapshot, (AssetSnapshot.asset_id == Asset.id) & (AssetSnapshot.period == period)
+    ).order_by(Asset.purchase_date.desc(), Asset.id.desc()).all()
+
+def valuation_totals(period=None):
+    """إجماليات الأصول في نهاية الشهر باستعلام تجميع واحد على أسطر التقييم (قراءة فقط)"""
+    period = period or current_period()
+    row = db.session.query(
+        db.func.count(AssetSnapshot.id),
+        *(db.func.coalesce(db.func.sum(column), 0)
+          for column in (AssetSnapshot.purchase_value, AssetSnapshot.depreciation,
+                         AssetSnapshot.spoilage, AssetSnapshot.value))
+    ).filter(AssetSnapshot.period == period).one()
+    return ValuationTotals(*row)
+
+@event.listens_for(db.session, 'after_flush')
+def _refresh_snapshots(session, flush_context):
+    """إعادة حساب أسطر التقييم والقيمة الحالية للأصول التي تغيرت هي أو توالفها في هذا الـ flush
+
+    تُحسب الأشهر المحسوبة مسبقاً فقط داخل نفس المعاملة، فتبقى الصفحات قراءة فقط. يُقفل سطر
+    الأصل أولاً (FOR UPDATE على PostgreSQL) حتى يرى كل تعديل متزامن توالف المعاملة الأخرى.
+    """
+    asset_ids, deleted_ids = set(), set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, (Asset, Spoilage)) or \
+                (obj in session.dirty and not session.is_modified(obj, include_collections=False)):
+            continue
+        if isinstance(obj, Asset):
+            (deleted_ids if obj in session.deleted else asset_ids).add(obj.id)
+        else:
+            asset_ids.add(obj.asset_id)
+            # عند نقل التلف إلى أصل آخر يتغير الأصل السابق أيضاً
+            asset_ids.update(inspect(obj).attrs.asset_id.history.deleted)
+    asset_ids -= deleted_ids | {None}
+    connection = session.connection()
+    table = AssetSnapshot.__table__
+    if deleted_ids:
+        connection.execute(table.delete().where(table.c.asset_id.in_(deleted_ids)))
+    if asset_ids:
+        asset_ids = sorted(asset_ids)
+        connection.execute(db.select(Asset.id).where(Asset.id.in_(asset_ids)).with_for_update())
+        periods = [period for period, in connection.execute(db.select(table.c.period).distinct())]
+        from depreciation import snapshot_periods
+        snapshot_periods(connection, periods, asset_ids)
@@ -0,0 +1,289 @@
+"""قياس أداء التطبيق على بيانات تركيبية بأحجام مختلفة
+
+الاستخدام:
+    python benchmark.py                          # الأحجام الافتراضية 500 / 5000 / 50000 مشترك
+    python benchmark.py --scales 500 5000 --repeat 10 --output bench.json
+    python benchmark.py --compare bench_old.json --output bench_new.json
+
+يُشغَّل كل حجم في عملية مستقلة على قاعدة SQLite مؤقتة (حتى تكون ذاكرة الذروة
+خاصة بذلك الحجم)، وتُكتب النتائج في ملف JSON لمقارنتها بين التشغيلات.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+DEFAULT_SCALES = [500, 5000, 50000]
+FISCAL_YEARS = 3
+SEED = 20240101
+
+ROUTES = [
+    '/',
+    '/members',
+    '/admin/payments',
+    '/admin/dashboard',
+    '/admin/expense_reports',
+    '/admin/assistance/report',
+    '/admin/spoilage/report',
+]
+
+VILLAGES = ['الشرف', 'بني حسن', 'الوادي', 'القرية العليا', 'السوق', 'المحجر']
+EXPENSE_CATEGORIES = ['وقود', 'صيانة', 'رواتب', 'قطع غيار', 'كهرباء', 'نقل']
+ASSET_CATEGORIES = ['ألواح شمسية', 'بطاريات', 'مضخات', 'كراسي', 'أنابيب']
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def seed_database(db, scale, rng):
+    """تعبئة القاعدة ببيانات تركيبية ثابتة لنفس البذرة"""
+    from sqlalchemy import insert
+    from models import Member, Payment, Expense, Assistance, Spoilage, Asset, Project
+    from fiscal_calendar import current_fiscal_year, get_fiscal_periods
+
+    first_year = current_fiscal_year() - FISCAL_YEARS + 1
+    periods = [period for fy in range(first_year, first_year + FISCAL_YEARS) for period in get_fiscal_periods(fy)]
+    start = datetime(first_year, periods[0].month, 1)
+    days = (datetime.now() - start).days or 1
+
+    members = [{
+        'id': number,
+        'member_number': number,
+        'name': f'مشترك {number}',
+        'village': rng.choice(VILLAGES),
+        'membership_fee': 5000.0,
+        'is_new_member': rng.random() < 0.2,
+        'join_date': start,
+    } for number in range(1, scale + 1)]
+    for chunk in _chunks(members, 10000):
+        db.session.execute(insert(Member), chunk)
+
+    for chunk in _chunks(members, 2000):
+        payments = []
+        for member in chunk:
+            # معظم المشتركين منتظمون وبعضهم متأخر بنسب متفاوتة
+            pay_ratio = rng.choice([0.95, 0.9, 0.8, 0.5, 0.2])
+            for period in periods:
+                is_paid = rng.random() < pay_ratio
+                payments.append({
+                    'member_id': member['id'],
+                    'month': period.month,
+                    'year': period.year,
+                    'amount': 1000.0,
+                    'is_paid': is_paid,
+                    'payment_date': datetime(period.year, period.month, rng.randint(1, 28)) if is_paid else None,
+                })
+        db.session.execute(insert(Payment), payments)
+
+    def random_date():
+        return start + timedelta(days=rng.randrange(days))
+
+    db.session.execute(insert(Expense), [{
+        'description': f'{category} رقم {i}',
+        'amount': round(rng.uniform(100, 50000), 2),
+        'date': random_date(),
+        'category': category,
+    } for i, category in ((i, rng.choice(EXPENSE_CATEGORIES)) for i in range(max(20, scale // 10)))])
+    db.session.execute(insert(Assistance), [{
+        'title': f'مساعدة {i}',
+        'source': rng.choice(['منظمة', 'مؤسسة حكومية', 'فاعل خير']),
+        'assistance_type': rng.choice(['أصول ثابتة', 'مبالغ مالية', 'مشاريع']),
+        'amount': round(rng.uniform(1000, 500000), 2),
+        'date_received': random_date(),
+    } for i in range(max(10, scale // 50))])
+    db.session.execute(insert(Spoilage), [{
+        'item_name': f'{category} {i}',
+        'original_value': 100000.0,
+        'spoilage_value': round(rng.uniform(1000, 50000), 2),
+        'spoilage_date': random_date(),
+        'category': category,
+        'spoilage_reason': rng.choice(['رياح', 'أمطار', 'استهلاك']),
+    } for i, category in ((i, rng.choice(ASSET_CATEGORIES)) for i in range(max(10, scale // 50)))])
+    db.session.execute(insert(Asset), [{
+        'name': f'{category} {i}',
+        'category': category,
+        'purchase_value': 100000.0,
+        'current_value': round(rng.uniform(10000, 100000), 2),
+        'purchase_date': random_date(),
+        'depreciation_rate': rng.choice([5.0, 10.0, 20.0]),
+    } for i, category in ((i, rng.choice(ASSET_CATEGORIES)) for i in range(max(5, scale // 100)))])
+    db.session.execute(insert(Project), [{
+        'title': f'مشروع {i}', 'description': 'مشروع تركيبي', 'cost': round(rng.uniform(1000, 1000000), 2),
+    } for i in range(20)])
+    db.session.commit()
+    return len(periods)
+
+def measure_route(app, client, path, repeat):
+    """تشغيل المسار عدة مرات وقراءة قياساته من سجل الأداء (perf)"""
+    from perf import perf
+    client.get(path).close()  # تسخين
+    perf.reset()
+    status = None
+    for _ in range(repeat):
+        response = client.get(path)
+        response.get_data()
+        status = response.status_code
+    rows = perf.summary()
+    tracemalloc.start()
+    client.get(path).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {'status': status, 'peak_memory_kb': round(peak / 1024, 1)}
+    if rows:
+        row = rows[0]
+        result.update({key: row[key] for key in (
+            'count', 'p50_ms', 'p95_ms', 'p99_ms', 'db_p50_ms', 'db_p95_ms',
+            'template_avg_ms', 'queries_avg', 'queries_max', 'size_avg', 'n_plus_one')})
+    return result
+
+def measure_import(db, excel_bytes):
+    """استيراد ملف التصدير نفسه (تحديث كل المشتركين) مع عدّ الاستعلامات وذاكرة الذروة"""
+    from sqlalchemy import event
+    from excel_utils import ExcelManager
+
+    queries = [0]
+    def count(*args):
+        queries[0] += 1
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(excel_bytes)
+    event.listen(db.engine, 'after_cursor_execute', count)
+    try:
+        started = time.perf_counter()
+        result = ExcelManager.import_from_excel(path)
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'after_cursor_execute', count)
+        # تشغيل ثانٍ لقياس الذاكرة فقط، لأن tracemalloc يبطئ pandas كثيراً
+        tracemalloc.start()
+        ExcelManager.import_from_excel(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if event.contains(db.engine, 'after_cursor_execute', count):
+            event.remove(db.engine, 'after_cursor_execute', count)
+        os.remove(path)
+    return {
+        'success': result.get('success'),
+        'error': result.get('error'),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': result.get('rows_per_second'),
+        'members_updated': result.get('updated'),
+        'queries': queries[0],
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def run_scale(scale, repeat):
+    """قياس حجم واحد (يُستدعى داخل عملية فرعية) على قاعدة في مجلد مؤقت يُحذف في النهاية"""
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'benchmark.db')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+        os.environ['PERF_ENABLED'] = '1'
+        os.environ.setdefault('PERF_N_PLUS_ONE_THRESHOLD', '10')
+        from app import app
+        from models import db
+        from financial_summary import rebuild_financial_summary
+        from excel_utils import ExcelManager
+        app.logger.disabled = True
+
+        result = {'scale': scale}
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            result['periods'] = seed_database(db, scale, random.Random(SEED))
+            rebuild_financial_summary()
+            result['seed_seconds'] = round(time.perf_counter() - started, 2)
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        result['routes'] = {path: measure_route(app, client, path, repeat) for path in ROUTES}
+
+        # التصدير يجري في مهمة خلفية، فيُقاس مولّد الملف نفسه
+        with app.app_context():
+            started = time.perf_counter()
+            excel_bytes = b''.join(ExcelManager.iter_members_xlsx())
+            result['export_excel'] = {'seconds': round(time.perf_counter() - started, 3),
+                                      'size_kb': round(len(excel_bytes) / 1024, 1)}
+            result['import_excel'] = measure_import(db, excel_bytes)
+        result['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        result['db_size_mb'] = round(os.path.getsize(db_path) / 1024 / 1024, 1)
+        return result
+
+def compare(previous, current):
+    """طباعة نسبة التغير في p50 وعدد الاستعلامات لكل مسار مقارنة بتشغيل سابق"""
+    for scale, data in current['scales'].items():
+        old = previous.get('scales', {}).get(scale)
+        if not old:
+            continue
+        print(f'\n== {scale} مشترك')
+        for path, route in data['routes'].items():
+            before = old['routes'].get(path)
+            if not before or not before.get('p50_ms') or not route.get('p50_ms'):
+                continue
+            ratio = route['p50_ms'] / before['p50_ms']
+            flag = '  <-- تراجع' if ratio > 1.2 or route['queries_avg'] > before['queries_avg'] else ''
+            print(f"{path:32} p50 {before['p50_ms']:>9} -> {route['p50_ms']:>9} ms (x{ratio:.2f})"
+                  f"  queries {before['queries_avg']} -> {route['queries_avg']}{flag}")
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء التطبيق على بيانات تركيبية')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='أعداد المشتركين')
+    parser.add_argument('--repeat', type=int, default=5, help='عدد مرات تكرار كل مسار')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='ملف نتائج سابق للمقارنة')
+    parser.add_argument('--run-scale', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(run_scale(args.run_scale, args.repeat), f, ensure_ascii=False)
+        return
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'scales': {},
+    }
+    for scale in args.scales:
+        print(f'قياس {scale} مشترك...', flush=True)
+        with tempfile.TemporaryDirectory() as directory:
+            result_file = os.path.join(directory, 'result.json')
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-scale', str(scale),
+                            '--repeat', str(args.repeat), '--result-file', result_file],
+                           cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+            with open(result_file, encoding='utf-8') as f:
+                report['scales'][str(scale)] = json.load(f)
+        for path, route in report['scales'][str(scale)]['routes'].items():
+            print(f"  {route['status']} {path:32} p50 {route.get('p50_ms')} ms, {route.get('queries_avg')} استعلام")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'تم حفظ النتائج في {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
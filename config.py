@@ -1,13 +1,98 @@
 import os
 
+def database_uri():
+    """رابط قاعدة البيانات (مع تصحيح postgres:// القديم الذي لا يقبله SQLAlchemy)"""
+    uri = os.environ.get('DATABASE_URL') or 'sqlite:///irrigation_association.db'
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+def engine_options(uri):
+    """خيارات محرك SQLAlchemy حسب نوع القاعدة"""
+    if uri.startswith('sqlite'):
+        # مهلة انتظار قفل الكتابة بدلاً من الفشل الفوري بـ "database is locked"
+        return {'connect_args': {'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT') or 15)}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+        'pool_timeout': 30,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        'pool_pre_ping': True,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'irrigation-association-secret-key-2024'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///irrigation_association.db'
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # إعدادات SQLite تُطبق على كل اتصال جديد (SQLITE_TUNING=0 لتعطيلها)
+    # WAL يسمح للقراءة بالتزامن مع الكتابة، و cache_size السالب بالكيلوبايت
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_KB') or 64000),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_BYTES') or 256 * 1024 * 1024),
+        'temp_store': 'MEMORY',
+    } if os.environ.get('SQLITE_TUNING', '1') != '0' else {}
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # مبلغ الاشتراك الشهري الافتراضي (دفعات الأعضاء الجدد والمتوقع للأشهر التي لا سطر لها)
+    MONTHLY_PAYMENT_AMOUNT = float(os.environ.get('MONTHLY_PAYMENT_AMOUNT') or 1000)
+    
+    # ترقيم صفحات قوائم المشتركين
+    MEMBERS_PER_PAGE = int(os.environ.get('MEMBERS_PER_PAGE') or 50)
+    MEMBERS_MAX_PER_PAGE = 500
+    
+    # المتأخرون في الدفع: العدد المعروض في لوحة التحكم وحجم صفحة القائمة الكاملة
+    ARREARS_DASHBOARD_LIMIT = 6
+    ARREARS_PER_PAGE = 50
+    
+    # حجم صفحة السجلات التفصيلية في تقارير المساعدات والتوالف
+    REPORT_DETAIL_PER_PAGE = 20
+    
+    # حجم دفعة الإدخال المجمع للمصروفات (كل دفعة في معاملة مستقلة)
+    EXPENSE_IMPORT_CHUNK_SIZE = int(os.environ.get('EXPENSE_IMPORT_CHUNK_SIZE') or 1000)
+    
+    # حجم صفحة نتائج البحث النصي (/admin/search)
+    SEARCH_PER_PAGE = 20
+    
+    # ذاكرة الصفحات العامة: LRU داخل كل عامل، ومجلد مشترك اختياري بين العمال
+    HTTP_CACHE_ENABLED = (os.environ.get('HTTP_CACHE_ENABLED') or '1') != '0'
+    HTTP_CACHE_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_BYTES') or 32 * 1024 * 1024)
+    HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR') or None
+    
+    # نشر الصفحات العامة كملفات ثابتة: التوليد التلقائي بعد كل commit، وتقديمها من gunicorn
+    PUBLISH_DIR = os.environ.get('PUBLISH_DIR') or 'published'
+    PUBLISH_ON_COMMIT = os.environ.get('PUBLISH_ON_COMMIT') == '1'
+    PUBLISH_SERVE = os.environ.get('PUBLISH_SERVE') == '1'
+    PUBLISH_DELAY = float(os.environ.get('PUBLISH_DELAY') or 2.0)  # ثوانٍ لتجميع دفعات الكتابة
+    
+    # تقارير PDF: الخط العربي (TTF) ومجلد التقارير المولدة وعدد صفوف كل جدول
+    PDF_FONT_PATH = os.environ.get('PDF_FONT_PATH') or None
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or 'pdf_cache'
+    REPORT_CHUNK_ROWS = int(os.environ.get('REPORT_CHUNK_ROWS') or 200)
+    
+    # تقارير Word: مجلد القوالب (<التقرير>.docx) وحد ذاكرة المستندات المولدة
+    WORD_TEMPLATE_DIR = os.environ.get('WORD_TEMPLATE_DIR') or 'templates/reports'
+    WORD_CACHE_MAX_BYTES = int(os.environ.get('WORD_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    
     # Admin credentials - يُنصح بتغييرها في الإنتاج
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME') or 'alqotabry'
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD') or '01100010'
-
+    
+    # المهام الخلفية (الاستيراد والتصدير والتقارير)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 1.0)
+    JOB_RESULTS_FOLDER = os.environ.get('JOB_RESULTS_FOLDER') or 'job_results'
+    # بدون عمليات عمال (flask run مثلاً) تُنفذ المهمة داخل الطلب الذي أضافها؛ gunicorn.conf.py يعطل
+    # ذلك بعد تشغيل العمال، ويمكن تعطيله يدوياً (JOBS_INLINE=0) عند تشغيل flask run-jobs بشكل مستقل
+    JOBS_INLINE = (os.environ.get('JOBS_INLINE') or '1') != '0'
+    # المهام المنتهية وملفات نتائجها تُحذف بعد هذه المدة (وكذلك الملفات اليتيمة في مجلد النتائج)
+    JOB_RETENTION_HOURS = float(os.environ.get('JOB_RETENTION_HOURS') or 24)
+    
+    # قياس أداء الطلبات (/admin/perf)
+    PERF_ENABLED = (os.environ.get('PERF_ENABLED') or '1') != '0'
+    PERF_BUFFER_SIZE = int(os.environ.get('PERF_BUFFER_SIZE') or 500)
+    PERF_N_PLUS_ONE_THRESHOLD = int(os.environ.get('PERF_N_PLUS_ONE_THRESHOLD') or 10)
@@ -0,0 +1,78 @@
+import hashlib
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, DataVersion, TableVersion
+
+# جداول لا تؤثر كتابتها على الصفحات العامة (تقدم المهام الخلفية يُحدَّث كثيراً)
+IGNORED_TABLES = {'job', DataVersion.__tablename__, TableVersion.__tablename__}
+_WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+RAW_SQL = '*'  # جملة SQL خام لا يُعرف جدولها
+
+def _track_write(conn, cursor, statement, parameters, context, executemany):
+    """تسجيل الجداول التي كُتب فيها على الاتصال حتى commit"""
+    compiled = getattr(context, 'compiled', None)
+    table = getattr(getattr(compiled, 'statement', None), 'table', None)
+    if table is not None:
+        if context.isinsert or context.isupdate or context.isdelete:
+            name = table.name
+        else:
+            return
+    elif statement.lstrip()[:6].upper() in _WRITE_VERBS:
+        name = RAW_SQL
+    else:
+        return
+    if name not in IGNORED_TABLES:
+        conn.info.setdefault('written_tables', set()).add(name)
+
+def _discard_writes(conn):
+    conn.info.pop('written_tables', None)
+
+def _bump(conn, table, where, values, row):
+    if not conn.execute(table.update().where(where).values(values)).rowcount:
+        conn.execute(table.insert().values(row))
+
+def _bump_versions(conn):
+    """زيادة الإصدار العام وإصدار كل جدول كُتب فيه، داخل نفس المعاملة قبل تنفيذ commit"""
+    tables = conn.info.pop('written_tables', None)
+    if not tables:
+        return
+    now = datetime.utcnow()
+    data, per_table = DataVersion.__table__, TableVersion.__table__
+    _bump(conn, data, data.c.id == 1, {'version': data.c.version + 1, 'updated_at': now},
+          {'id': 1, 'version': 1, 'updated_at': now})
+    for name in sorted(tables):  # ترتيب ثابت لتجنب تعارض الأقفال بين المعاملات
+        _bump(conn, per_table, per_table.c.name == name, {'version': per_table.c.version + 1},
+              {'name': name, 'version': 1})
+
+def track_data_versions(app):
+    """ربط أحداث المحرك التي تحدّث أرقام الإصدار (تشمل ORM والكتابة المجمعة و Core)"""
+    with app.app_context():
+        engine = db.engine
+    for model in (DataVersion, TableVersion):
+        try:
+            # الجداول مطلوبة قبل أول commit (القواعد القديمة قبل init_db)؛ قد ينشئها عامل آخر بالتزامن
+            model.__table__.create(engine, checkfirst=True)
+        except SQLAlchemyError:
+            pass
+    event.listen(engine, 'before_cursor_execute', _track_write)
+    event.listen(engine, 'commit', _bump_versions)
+    event.listen(engine, 'rollback', _discard_writes)
+
+def current_version():
+    """(الإصدار العام، وقت آخر كتابة) باستعلام واحد صغير"""
+    row = db.session.execute(db.select(DataVersion.version, DataVersion.updated_at)
+                             .where(DataVersion.id == 1)).first()
+    if row is None:
+        return 0, datetime(2000, 1, 1)
+    return row
+
+def table_versions():
+    """{اسم الجدول: الإصدار} لكل الجداول التي كُتب فيها"""
+    return dict(db.session.execute(db.select(TableVersion.name, TableVersion.version)).all())
+
+def tables_signature(tables):
+    """بصمة قصيرة لإصدارات جداول محددة (مع الكتابات الخام) لتسمية الملفات المولدة منها"""
+    versions = table_versions()
+    signature = ','.join(f'{table}={versions.get(table, 0)}' for table in (*tables, RAW_SQL))
+    return hashlib.sha1(signature.encode()).hexdigest()[:16]
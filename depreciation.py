@@ -0,0 +1,125 @@
+"""تقييم الأصول بمصفوفات NumPy: الاستهلاك المتراكم والتوالف لكل الأصول في نهاية كل شهر
+
+تُستورد عند أول حساب فقط (أمر snapshot-assets أو المهمة الخلفية أو ربط asset_snapshots عند تعديل
+أصل أو تلف)، والصفحات تقرأ الأسطر المحسوبة عبر asset_snapshots.
+"""
+from datetime import datetime
+import numpy as np
+from models import db, Asset, AssetSnapshot, Spoilage
+from asset_snapshots import DECLINING_BALANCE, current_period, recent_periods
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+def depreciation_amounts(purchase, rate, years, declining):
+    """الاستهلاك المتراكم لمصفوفات الأصول دفعة واحدة
+
+    القسط الثابت: الشراء × المعدل × السنوات، والمتناقص: الشراء × (1 - (1 - المعدل) ^ السنوات)،
+    ولا يتجاوز الاستهلاك قيمة الشراء.
+    """
+    purchase = np.asarray(purchase, dtype=float)
+    rate = np.clip(np.asarray(rate, dtype=float) / 100, 0, 1)
+    years = np.maximum(np.asarray(years, dtype=float), 0)
+    straight = purchase * rate * years
+    declining_balance = purchase * (1 - (1 - rate) ** years)
+    return np.clip(np.where(np.asarray(declining, dtype=bool), declining_balance, straight), 0, purchase)
+
+def period_end(period):
+    """بداية الشهر التالي لـ YYYYMM (التقييم يشمل كل ما قبلها)"""
+    year, month = divmod(period, 100)
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _load(connection, asset_ids=None):
+    """الأصول والتوالف كمصفوفات NumPy (استعلامان فقط مهما كان عدد الأصول)"""
+    query = db.select(Asset.id, Asset.purchase_value, Asset.depreciation_rate, Asset.depreciation_method,
+                      Asset.purchase_date).order_by(Asset.id)
+    spoilage = db.select(Spoilage.asset_id, Spoilage.spoilage_date, Spoilage.spoilage_value) \
+        .where(Spoilage.asset_id.isnot(None))
+    if asset_ids is not None:
+        query = query.where(Asset.id.in_(asset_ids))
+        spoilage = spoilage.where(Spoilage.asset_id.in_(asset_ids))
+    rows = connection.execute(query).all()
+    ids, purchase, rate, method, purchased = zip(*rows) if rows else ((),) * 5
+    assets = {
+        'id': np.array(ids, dtype=np.int64),
+        'purchase_value': np.array(purchase, dtype=float),
+        'rate': np.array([value or 0 for value in rate], dtype=float),
+        'declining': np.array([value == DECLINING_BALANCE for value in method], dtype=bool),
+        'purchase_date': np.array(purchased, dtype='datetime64[s]'),
+    }
+    rows = connection.execute(spoilage).all()
+    spoiled_ids, dates, values = zip(*rows) if rows else ((),) * 3
+    spoilages = {
+        'index': np.searchsorted(assets['id'], np.array(spoiled_ids, dtype=np.int64)),
+        'date': np.array(dates, dtype='datetime64[s]'),
+        'value': np.array(values, dtype=float),
+    }
+    return assets, spoilages
+
+def compute_valuations(assets, spoilages, period):
+    """تقييم كل الأصول في نهاية الشهر period بعمليات متجهة
+
+    يعيد مصفوفات (id, purchase_value, depreciation, spoilage, value) للأصول المشتراة قبل نهاية الشهر.
+    """
+    as_of = np.datetime64(period_end(period), 's')
+    purchased = np.where(np.isnat(assets['purchase_date']), as_of, assets['purchase_date'])
+    years = (as_of - purchased).astype(float) / SECONDS_PER_YEAR
+    depreciation = depreciation_amounts(assets['purchase_value'], assets['rate'], years, assets['declining'])
+
+    # التلف بلا تاريخ يُخصم دائماً
+    counted = np.isnat(spoilages['date']) | (spoilages['date'] < as_of)
+    spoiled = np.bincount(spoilages['index'][counted], weights=spoilages['value'][counted],
+                          minlength=len(assets['id']))
+
+    value = np.maximum(0, assets['purchase_value'] - depreciation - spoiled)
+    owned = np.isnat(assets['purchase_date']) | (assets['purchase_date'] < as_of)
+    return {
+        'asset_id': assets['id'][owned],
+        'purchase_value': assets['purchase_value'][owned],
+        'depreciation': depreciation[owned],
+        'spoilage': spoiled[owned],
+        'value': value[owned],
+    }
+
+def snapshot_periods(connection, periods, asset_ids=None):
+    """حساب وحفظ أسطر التقييم لأشهر محددة مع القيمة الحالية للأصول (بدون commit)
+
+    تُحذف الأسطر السابقة لنفس الأصول في هذه الأشهر، وتُكتب current_value للأصول بتقييم
+    الشهر الحالي من نفس المعادلات فلا تختلف عن أسطر التقييم.
+    """
+    assets, spoilages = _load(connection, asset_ids)
+    table = AssetSnapshot.__table__
+    delete = table.delete().where(table.c.period.in_(list(periods)))
+    if asset_ids is not None:
+        delete = delete.where(table.c.asset_id.in_(asset_ids))
+    connection.execute(delete)
+    rows = []
+    for period in periods:
+        valuations = compute_valuations(assets, spoilages, period)
+        rows += [{'asset_id': int(asset_id), 'period': period, 'purchase_value': float(purchase),
+                  'depreciation': float(depreciation), 'spoilage': float(spoiled), 'value': float(value)}
+                 for asset_id, purchase, depreciation, spoiled, value in zip(*valuations.values())]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+    # الأصول المشتراة بعد نهاية الشهر الحالي تبقى بقيمة شرائها
+    current = compute_valuations(assets, spoilages, current_period())
+    values = dict(zip(current['asset_id'].tolist(), current['value'].tolist()))
+    if len(assets['id']):
+        table = Asset.__table__
+        connection.execute(
+            table.update().where(table.c.id == db.bindparam('asset_id')).values(current_value=db.bindparam('value')),
+            [{'asset_id': int(asset_id), 'value': values.get(int(asset_id), float(purchase))}
+             for asset_id, purchase in zip(assets['id'], assets['purchase_value'])]
+        )
+    return len(rows)
+
+def rebuild_asset_snapshots(months=12):
+    """إعادة حساب تقييم كل الأصول لآخر months شهراً (أمر flask snapshot-assets أو مهمة خلفية)
+
+    يُشغَّل في بداية كل شهر (cron) حتى يتوفر تقييم الشهر الجديد للصفحات التي تقرأ الأسطر فقط.
+    """
+    db.session.execute(AssetSnapshot.__table__.delete())
+    written = snapshot_periods(db.session.connection(), recent_periods(months))
+    db.session.commit()
+    return written
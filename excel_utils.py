@@ -1,97 +1,153 @@
 import pandas as pd
-import numpy as np
 from datetime import datetime
+from flask import current_app
 from models import db, Member, Payment
-import os
+from financial_summary import get_monthly_summary, rebuild_financial_summary
+from arrears import rebuild_arrears
+from fiscal_calendar import current_fiscal_year, get_fiscal_periods, resolve_month_columns
+from xlsx_stream import iter_xlsx
+import time
 
 class ExcelManager:
     """مدير العمليات المتعلقة بملفات Excel"""
     
+    # عدد الصفوف في كل دفعة كتابة (معاملة مستقلة)
+    IMPORT_CHUNK_SIZE = 2000
+    
+    @staticmethod
+    def _normalize_sheet(df, fiscal_year):
+        """تحويل الورقة إلى جدولين: الأعضاء والمدفوعات (بعمليات pandas متجهة دون iterrows)"""
+        df.columns = df.columns.astype(str).str.strip()
+        
+        # تجاهل الصفوف الفارغة وصفوف الإجماليات
+        names = df['الاســـــــــــم'].astype(str).str.strip()
+        numbers = pd.to_numeric(df['الرقم'], errors='coerce')
+        keep = numbers.notna() & ~names.str.startswith('الجمالــــــــــــــــــــــــــي')
+        df, names, numbers = df[keep], names[keep], numbers[keep].astype(int)
+        
+        if 'رسوم العضوية' in df.columns:
+            fees = pd.to_numeric(df['رسوم العضوية'], errors='coerce').fillna(5000.0)
+        else:
+            fees = pd.Series(5000.0, index=df.index)
+        
+        if 'Unnamed: 12' in df.columns:
+            notes = df['Unnamed: 12'].astype(str).str.strip().where(df['Unnamed: 12'].notna(), None)
+        else:
+            notes = pd.Series(None, index=df.index, dtype=object)
+        
+        members = pd.DataFrame({
+            'member_number': numbers,
+            'name': names,
+            'membership_fee': fees.astype(float),
+            'notes': notes
+        }).drop_duplicates('member_number', keep='last')
+        
+        # تحويل أعمدة الأشهر إلى صفوف (member_number, month, year, amount)
+        month_columns = resolve_month_columns(df.columns, fiscal_year)
+        payments = df[list(month_columns)].assign(member_number=numbers).melt(
+            id_vars='member_number', var_name='column', value_name='amount')
+        payments['amount'] = pd.to_numeric(payments['amount'], errors='coerce')
+        payments = payments.dropna(subset=['amount'])
+        payments['month'] = payments['column'].map({col: month for col, (month, _) in month_columns.items()})
+        payments['year'] = payments['column'].map({col: year for col, (_, year) in month_columns.items()})
+        payments['is_paid'] = payments['amount'] > 0
+        payments['amount'] = payments['amount'].where(payments['is_paid'], current_app.config['MONTHLY_PAYMENT_AMOUNT'])
+        payments = payments.drop(columns='column').drop_duplicates(['member_number', 'year', 'month'], keep='last')
+        
+        return members, payments
+    
+    @staticmethod
+    def _records(df):
+        """تحويل DataFrame إلى قواميس بأنواع Python الأصلية (None بدلاً من NaN)"""
+        return df.astype(object).where(df.notna(), None).to_dict('records')
+    
     @staticmethod
-    def import_from_excel(file_path):
-        """استيراد البيانات من ملف Excel"""
+    def _write_chunks(method, mapper, df, chunk_size):
+        """كتابة السجلات على دفعات، كل دفعة في معاملة مستقلة"""
+        rows = ExcelManager._records(df)
+        for start in range(0, len(rows), chunk_size):
+            method(mapper, rows[start:start + chunk_size])
+            db.session.commit()
+    
+    @staticmethod
+    def import_from_excel(file_path, chunk_size=None, progress=None, fiscal_year=None):
+        """استيراد البيانات من ملف Excel
+        
+        تُقرأ الورقة وتُنظف بعمليات متجهة، ثم يُجلب الأعضاء الموجودون ومدفوعات أعضاء الورقة فقط،
+        وتُحسب الإضافات والتحديثات كفروقات مجموعات وتُكتب بالإدخال/التحديث المجمّع.
+        progress: دالة اختيارية (النسبة، الرسالة) لتقارير التقدم في المهام الخلفية.
+        fiscal_year: السنة المالية لأعمدة الأشهر التي لا تحمل سنة (الافتراضي: الحالية).
+        """
+        chunk_size = chunk_size or ExcelManager.IMPORT_CHUNK_SIZE
+        progress = progress or (lambda value, message: None)
+        started = time.perf_counter()
         try:
-            # قراءة الملف
-            df = pd.read_excel(file_path)
+            members, payments = ExcelManager._normalize_sheet(
+                pd.read_excel(file_path), fiscal_year or current_fiscal_year())
+            now = datetime.now()
+            progress(20, f'تمت قراءة {len(members)} صف')
             
-            # تنظيف أسماء الأعمدة
-            df.columns = df.columns.str.strip()
+            # الأعضاء الموجودون (استعلام 1)
+            existing = pd.DataFrame(
+                db.session.query(Member.member_number, Member.id).all(),
+                columns=['member_number', 'id']
+            )
+            members = members.merge(existing, on='member_number', how='left')
+            new_members = members[members['id'].isna()].drop(columns='id')
+            old_members = members[members['id'].notna()].astype({'id': int})
             
-            imported_count = 0
-            updated_count = 0
+            ExcelManager._write_chunks(db.session.bulk_insert_mappings, Member,
+                                       new_members, chunk_size)
+            ExcelManager._write_chunks(db.session.bulk_update_mappings, Member,
+                                       old_members.drop(columns='member_number'), chunk_size)
             
-            for index, row in df.iterrows():
-                # تجاهل الصفوف التي تحتوي على الإجماليات
-                if pd.isna(row.get('الرقم')) or str(row.get('الاســـــــــــم', '')).startswith('الجمالــــــــــــــــــــــــــي'):
-                    continue
-                
-                member_number = int(row['الرقم'])
-                name = str(row['الاســـــــــــم']).strip()
-                membership_fee = float(row.get('رسوم العضوية', 5000))
-                notes = str(row.get('Unnamed: 12', '')).strip() if pd.notna(row.get('Unnamed: 12')) else None
-                
-                # البحث عن العضو أو إنشاؤه
-                member = Member.query.filter_by(member_number=member_number).first()
-                if not member:
-                    member = Member(
-                        member_number=member_number,
-                        name=name,
-                        membership_fee=membership_fee,
-                        notes=notes
-                    )
-                    db.session.add(member)
-                    imported_count += 1
-                else:
-                    member.name = name
-                    member.membership_fee = membership_fee
-                    member.notes = notes
-                    updated_count += 1
-                
-                # معالجة المدفوعات الشهرية
-                months_mapping = {
-                    'شهر11 ': (11, 2024),
-                    'شهر12 ': (12, 2024),
-                    'شهر 1': (1, 2025),
-                    'شهر2': (2, 2025),
-                    'شهر 3': (3, 2025),
-                    'شهر 4': (4, 2025),
-                    'شهر 5': (5, 2025),
-                    'شهر 6': (6, 2025),
-                    'شهر7': (7, 2025)
-                }
-                
-                for col_name, (month, year) in months_mapping.items():
-                    if col_name in row and pd.notna(row[col_name]):
-                        amount = float(row[col_name])
-                        is_paid = amount > 0
-                        
-                        # البحث عن الدفعة أو إنشاؤها
-                        payment = Payment.query.filter_by(
-                            member_id=member.id,
-                            month=month,
-                            year=year
-                        ).first()
-                        
-                        if not payment:
-                            payment = Payment(
-                                member_id=member.id,
-                                month=month,
-                                year=year,
-                                amount=amount if is_paid else 1000,
-                                is_paid=is_paid,
-                                payment_date=datetime.now() if is_paid else None
-                            )
-                            db.session.add(payment)
-                        else:
-                            payment.amount = amount if is_paid else 1000
-                            payment.is_paid = is_paid
-                            payment.payment_date = datetime.now() if is_paid else None
+            progress(50, 'تم حفظ الأعضاء')
             
-            db.session.commit()
+            # معرفات جميع أعضاء الورقة بعد إدخال الجدد
+            if len(new_members):
+                existing = pd.DataFrame(
+                    db.session.query(Member.member_number, Member.id).all(),
+                    columns=['member_number', 'id']
+                )
+            payments = payments.merge(existing.rename(columns={'id': 'member_id'}), on='member_number')
+            
+            # المدفوعات الموجودة لأعضاء الورقة في سنواتها (استعلام لكل دفعة من الأعضاء)
+            years = [int(year) for year in payments['year'].unique()]
+            member_ids = [int(member_id) for member_id in payments['member_id'].unique()]
+            existing_payments = pd.DataFrame([
+                row for start in range(0, len(member_ids), chunk_size)
+                for row in db.session.query(Payment.member_id, Payment.year, Payment.month, Payment.id).filter(
+                    Payment.member_id.in_(member_ids[start:start + chunk_size]), Payment.year.in_(years))
+            ], columns=['member_id', 'year', 'month', 'id'])
+            payments = payments.merge(existing_payments, on=['member_id', 'year', 'month'], how='left')
+            payments['payment_date'] = pd.Series(now, index=payments.index, dtype=object).where(payments['is_paid'], None)
+            payments = payments.drop(columns='member_number')
+            
+            new_payments = payments[payments['id'].isna()].drop(columns='id')
+            old_payments = payments[payments['id'].notna()].astype({'id': int})
+            
+            ExcelManager._write_chunks(db.session.bulk_insert_mappings, Payment,
+                                       new_payments, chunk_size)
+            ExcelManager._write_chunks(db.session.bulk_update_mappings, Payment,
+                                       old_payments.drop(columns=['member_id', 'year', 'month']),
+                                       chunk_size)
+            
+            progress(90, 'تم حفظ المدفوعات')
+            
+            # الكتابة المجمعة لا تمر بأحداث الجلسة، لذا يُعاد بناء الملخص المالي والمتأخرات
+            rebuild_financial_summary()
+            rebuild_arrears()
+            
+            imported_count = len(new_members)
+            updated_count = len(old_members)
+            elapsed = time.perf_counter() - started
             return {
                 'success': True,
                 'imported': imported_count,
                 'updated': updated_count,
+                'payments_inserted': len(new_payments),
+                'payments_updated': len(old_payments),
+                'rows_per_second': round(len(members) / elapsed, 1) if elapsed > 0 else None,
                 'message': f'تم استيراد {imported_count} عضو جديد وتحديث {updated_count} عضو موجود'
             }
             
@@ -102,73 +158,72 @@ class ExcelManager:
                 'message': f'خطأ في الاستيراد: {str(e)}'
             }
     
+    # عدد الصفوف التي تُجلب من المؤشر في كل دفعة
+    EXPORT_FETCH_SIZE = 1000
+    
     @staticmethod
-    def export_to_excel(file_path=None):
+    def _paid_in(month, year):
+        """مبلغ الدفعة إن كانت مدفوعة في الشهر المحدد وإلا 0 (لاستخدامه داخل SUM)"""
+        return db.case(
+            (db.and_(Payment.month == month, Payment.year == year, Payment.is_paid == True), Payment.amount),
+            else_=0
+        )
+    
+    @staticmethod
+    def members_rows(fiscal_year=None):
+        """صفوف ورقة الأعضاء (العناوين ثم الأعضاء ثم الإجماليات) من مؤشر يُقرأ على دفعات
+        
+        كل صف عضو يأتي من استعلام واحد يحوّل أشهر المدفوعات إلى أعمدة، والإجماليات
+        تُحسب باستعلامات SUM، فلا تُحمّل قائمة الأعضاء كاملة في الذاكرة.
+        """
+        months = get_fiscal_periods(fiscal_year or current_fiscal_year())
+        yield ['الرقم', 'الاســـــــــــم', 'رسوم العضوية'] + [period.label for period in months] + ['ملاحظات']
+        
+        rows = db.session.query(
+            Member.member_number, Member.name, Member.membership_fee, Member.notes,
+            *[db.func.coalesce(db.func.sum(ExcelManager._paid_in(period.month, period.year)), 0) for period in months]
+        ).outerjoin(Payment, Payment.member_id == Member.id) \
+            .group_by(Member.id).order_by(Member.member_number) \
+            .execution_options(yield_per=ExcelManager.EXPORT_FETCH_SIZE)
+        
+        for member_number, name, membership_fee, notes, *monthly in rows:
+            yield [member_number, name, membership_fee] + list(monthly) + [notes or '']
+        
+        # صف الإجماليات
+        total_fees = db.session.query(db.func.sum(Member.membership_fee)).scalar() or 0
+        monthly_totals = db.session.query(
+            *[db.func.coalesce(db.func.sum(ExcelManager._paid_in(period.month, period.year)), 0) for period in months]
+        ).filter(Payment.year.in_({period.year for period in months})).one()
+        yield [None, 'الجمالــــــــــــــــــــــــــي', total_fees] + list(monthly_totals) + [None]
+    
+    @staticmethod
+    def iter_members_xlsx(fiscal_year=None):
+        """ملف Excel للأعضاء كمولّد أجزاء بايت: الصفوف تُقرأ من المؤشر أثناء إرسال الملف"""
+        return iter_xlsx(ExcelManager.members_rows(fiscal_year), sheet_name='الأعضاء')
+    
+    @staticmethod
+    def save_members_xlsx(file_path, fiscal_year=None):
+        """كتابة ملف Excel للأعضاء إلى مسار وإرجاع عدد الأعضاء"""
+        with open(file_path, 'wb') as f:
+            for chunk in ExcelManager.iter_members_xlsx(fiscal_year):
+                f.write(chunk)
+        return Member.query.count()
+    
+    @staticmethod
+    def export_to_excel(file_path=None, fiscal_year=None):
         """تصدير البيانات إلى ملف Excel"""
         try:
-            members = Member.query.order_by(Member.member_number).all()
-            
-            # إعداد البيانات للتصدير
-            data = []
-            
-            for member in members:
-                row = {
-                    'الرقم': member.member_number,
-                    'الاســـــــــــم': member.name,
-                    'رسوم العضوية': member.membership_fee
-                }
-                
-                # إضافة المدفوعات الشهرية
-                months_mapping = [
-                    ('شهر11 ', 11, 2024),
-                    ('شهر12 ', 12, 2024),
-                    ('شهر 1', 1, 2025),
-                    ('شهر2', 2, 2025),
-                    ('شهر 3', 3, 2025),
-                    ('شهر 4', 4, 2025),
-                    ('شهر 5', 5, 2025),
-                    ('شهر 6', 6, 2025),
-                    ('شهر7', 7, 2025)
-                ]
-                
-                for col_name, month, year in months_mapping:
-                    payment = member.get_payment_for_month(month, year)
-                    if payment:
-                        row[col_name] = payment.amount if payment.is_paid else 0
-                    else:
-                        row[col_name] = 0
-                
-                # إضافة الملاحظات
-                row['ملاحظات'] = member.notes or ''
-                
-                data.append(row)
-            
-            # إنشاء DataFrame
-            df = pd.DataFrame(data)
-            
-            # إضافة صف الإجماليات
-            totals_row = {'الاســـــــــــم': 'الجمالــــــــــــــــــــــــــي'}
-            
-            for col in df.columns:
-                if col.startswith('شهر') or col == 'رسوم العضوية':
-                    totals_row[col] = df[col].sum()
-                elif col not in ['الرقم', 'الاســـــــــــم', 'ملاحظات']:
-                    totals_row[col] = ''
-            
-            # إضافة صف الإجماليات
-            df = pd.concat([df, pd.DataFrame([totals_row])], ignore_index=True)
-            
             # حفظ الملف
             if not file_path:
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 file_path = f'تصدير_البيانات_{timestamp}.xlsx'
             
-            df.to_excel(file_path, index=False, engine='openpyxl')
+            count = ExcelManager.save_members_xlsx(file_path, fiscal_year)
             
             return {
                 'success': True,
                 'file_path': file_path,
-                'message': f'تم تصدير {len(members)} عضو بنجاح'
+                'message': f'تم تصدير {count} عضو بنجاح'
             }
             
         except Exception as e:
@@ -178,47 +233,35 @@ class ExcelManager:
             }
     
     @staticmethod
-    def get_financial_summary():
-        """حساب الملخص المالي"""
+    def get_financial_summary(fiscal_year=None):
+        """حساب الملخص المالي لسنة مالية (الافتراضي: الحالية)"""
         try:
-            members = Member.query.all()
+            total_members = Member.query.count()
             
             summary = {
-                'total_members': len(members),
-                'total_membership_fees': sum(member.membership_fee for member in members),
+                'total_members': total_members,
+                'total_membership_fees': db.session.query(db.func.sum(Member.membership_fee)).scalar() or 0,
                 'monthly_totals': {},
                 'total_collected': 0,
                 'total_expected': 0
             }
             
-            # حساب المدفوعات الشهرية
-            months_mapping = [
-                ('شهر11 ', 11, 2024),
-                ('شهر12 ', 12, 2024),
-                ('شهر 1', 1, 2025),
-                ('شهر2', 2, 2025),
-                ('شهر 3', 3, 2025),
-                ('شهر 4', 4, 2025),
-                ('شهر 5', 5, 2025),
-                ('شهر 6', 6, 2025),
-                ('شهر7', 7, 2025)
-            ]
-            
-            for col_name, month, year in months_mapping:
-                monthly_total = 0
-                for member in members:
-                    payment = member.get_payment_for_month(month, year)
-                    if payment and payment.is_paid:
-                        monthly_total += payment.amount
+            # قراءة الأشهر من جدول الملخص المالي بدلاً من المرور على كل عضو
+            periods = get_fiscal_periods(fiscal_year or current_fiscal_year())
+            monthly = get_monthly_summary([(period.month, period.year) for period in periods])
+            for period in periods:
+                row = monthly[(period.month, period.year)]
+                monthly_total = row.collected if row else 0
                 
-                summary['monthly_totals'][col_name] = monthly_total
+                summary['monthly_totals'][period.label] = monthly_total
                 summary['total_collected'] += monthly_total
             
             # إضافة رسوم العضوية للمجموع
             summary['total_collected'] += summary['total_membership_fees']
             
-            # حساب المتوقع (12 شهر × 1000 ريال × عدد الأعضاء + رسوم العضوية)
-            summary['total_expected'] = (len(members) * 12 * 1000) + summary['total_membership_fees']
+            # حساب المتوقع (12 شهر × القسط الشهري × عدد الأعضاء + رسوم العضوية)
+            monthly_amount = current_app.config['MONTHLY_PAYMENT_AMOUNT']
+            summary['total_expected'] = (total_members * 12 * monthly_amount) + summary['total_membership_fees']
             
             return summary
             
@@ -0,0 +1,148 @@
+from collections import defaultdict
+from datetime import datetime
+import pandas as pd
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Expense
+from financial_summary import TOTAL_KEY, apply_deltas
+from search import index_inserted
+
+DEFAULT_CATEGORY = 'أخرى'
+DESCRIPTION_MAX_LENGTH = Expense.__table__.c.description.type.length
+CATEGORY_MAX_LENGTH = Expense.__table__.c.category.type.length
+
+# عناوين الأعمدة المقبولة في ملفات CSV/XLSX (بالعربية كما في جدول الواجهة أو بالإنجليزية)
+COLUMN_ALIASES = {
+    'الوصف': 'description', 'البيان': 'description',
+    'المبلغ': 'amount',
+    'الفئة': 'category', 'التصنيف': 'category',
+    'التاريخ': 'date',
+}
+COLUMNS = ('description', 'amount', 'category', 'date')
+UPLOAD_EXTENSIONS = {'csv', 'xlsx', 'xls'}
+
+def frame_from_json(items):
+    """قائمة قواميس JSON إلى DataFrame بالأعمدة المعروفة"""
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('يجب أن تكون البيانات قائمة من المصروفات')
+    return pd.DataFrame(items, columns=COLUMNS, dtype=object)
+
+def frame_from_upload(file, filename=None):
+    """قراءة ملف CSV أو Excel (مرفوع أو مسار محفوظ) إلى DataFrame بالأعمدة المعروفة"""
+    filename = filename or file.filename
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in UPLOAD_EXTENSIONS:
+        raise ValueError('نوع الملف غير مدعوم (CSV أو Excel فقط)')
+    if extension == 'csv':
+        df = pd.read_csv(file, dtype=object, keep_default_na=False, encoding='utf-8-sig')
+    else:
+        df = pd.read_excel(file, dtype=object)
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.rename(columns=lambda column: COLUMN_ALIASES.get(column, column.lower()))
+    if 'description' not in df.columns or 'amount' not in df.columns:
+        raise ValueError('الملف يجب أن يحتوي على عمودي الوصف والمبلغ')
+    return df.reindex(columns=COLUMNS)
+
+def _text(series):
+    """نص منظف، مع تحويل الفراغات و NaN إلى None"""
+    text = series.astype(object).where(series.notna(), '').astype(str).str.strip()
+    return text.where(text != '', None)
+
+def validate_expenses(df, first_row=1):
+    """التحقق من كل الصفوف دفعة واحدة بعمليات متجهة
+
+    يعيد (السجلات الصالحة مع أرقام صفوفها، الأخطاء [{'row', 'errors'}]).
+    first_row: رقم أول صف بيانات كما يراه المستخدم (2 في الملفات بعد سطر العناوين).
+    """
+    df = df.reset_index(drop=True)
+    rows = pd.Series(range(first_row, first_row + len(df)))
+    problems = pd.DataFrame(index=df.index)
+
+    descriptions = _text(df['description'])
+    problems['الوصف مطلوب'] = descriptions.isna()
+    problems[f'الوصف أطول من {DESCRIPTION_MAX_LENGTH} حرفاً'] = descriptions.str.len() > DESCRIPTION_MAX_LENGTH
+
+    raw_amounts = _text(df['amount'])
+    amounts = pd.to_numeric(raw_amounts, errors='coerce')
+    problems['المبلغ مطلوب'] = raw_amounts.isna()
+    problems['المبلغ غير صالح'] = raw_amounts.notna() & amounts.isna()
+    problems['المبلغ يجب أن يكون أكبر من صفر'] = amounts <= 0
+
+    categories = _text(df['category']).fillna(DEFAULT_CATEGORY)
+    problems[f'الفئة أطول من {CATEGORY_MAX_LENGTH} حرفاً'] = categories.str.len() > CATEGORY_MAX_LENGTH
+
+    # التاريخ بصيغة YYYY-MM-DD (أو خلية تاريخ في Excel)، والفارغ يعني اليوم
+    raw_dates = _text(df['date'])
+    dates = pd.to_datetime(raw_dates, errors='coerce', format='ISO8601')
+    problems['التاريخ غير صالح (YYYY-MM-DD)'] = raw_dates.notna() & dates.isna()
+    dates = dates.fillna(pd.Timestamp(datetime.now()))
+
+    invalid = problems.any(axis=1)
+    errors = [{'row': int(rows[index]), 'errors': [name for name, failed in flags.items() if failed]}
+              for index, flags in problems[invalid].iterrows()]
+
+    valid = pd.DataFrame({
+        'row': rows,
+        'description': descriptions,
+        'amount': amounts.astype(float),
+        'category': categories,
+        'date': dates,
+        'period': dates.dt.year * 100 + dates.dt.month,
+    })[~invalid]
+    return valid, errors
+
+def _summary_deltas(chunk):
+    """فروقات الملخص المالي لدفعة مصروفات (الإدخال المجمع لا يمر بأحداث الجلسة)"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for period, total in chunk.groupby('period')['amount'].sum().items():
+        deltas[(int(period) // 100, int(period) % 100)]['expenses'] += float(total)
+        deltas[TOTAL_KEY]['expenses'] += float(total)
+    return deltas
+
+def insert_expenses(valid, chunk_size):
+    """إدخال الصفوف الصالحة على دفعات، كل دفعة في معاملة مستقلة مع تحديث الملخص المالي
+
+    يعيد (عدد المُدخل، مجموع مبالغه، أخطاء الدفعات التي فشلت في القاعدة).
+    """
+    inserted, amount, errors = 0, 0.0, []
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid.iloc[start:start + chunk_size]
+        records = chunk.drop(columns='row').to_dict('records')
+        for record in records:
+            record['date'] = record['date'].to_pydatetime()
+            record['period'] = int(record['period'])
+        try:
+            db.session.bulk_insert_mappings(Expense, records)
+            connection = db.session.connection()
+            apply_deltas(connection, _summary_deltas(chunk))
+            index_inserted(connection, Expense, len(records))
+            db.session.commit()
+            inserted += len(records)
+            amount += float(chunk['amount'].sum())
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.extend({'row': int(row), 'errors': [f'خطأ في الحفظ: {e.__class__.__name__}']}
+                          for row in chunk['row'])
+    return inserted, amount, errors
+
+def result_message(result, dry_run=False):
+    if dry_run:
+        return f"الفحص: {result['valid']} صف صالح من {result['total']}"
+    if result['failed']:
+        return f"تم حفظ {result['inserted']} مصروف، وفشل {result['failed']} صف"
+    return f"تم حفظ {result['inserted']} مصروف بنجاح"
+
+def import_expenses(df, chunk_size, first_row=1, dry_run=False):
+    """التحقق ثم الإدخال المجمع؛ الصفوف الخاطئة لا تمنع حفظ الصفوف الصالحة"""
+    valid, errors = validate_expenses(df, first_row)
+    inserted, amount = 0, float(valid['amount'].sum())
+    if not dry_run:
+        inserted, amount, failed = insert_expenses(valid, chunk_size)
+        errors = sorted(errors + failed, key=lambda error: error['row'])
+    return {
+        'total': len(df),
+        'valid': len(valid),
+        'inserted': inserted,
+        'failed': len(errors),
+        'amount': round(amount, 2),
+        'errors': errors,
+    }
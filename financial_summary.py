@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect
+from models import db, Payment, Expense, Assistance, Spoilage, FinancialSummary
+
+# مفتاح سطر الإجمالي العام في جدول الملخص
+TOTAL_KEY = (0, 0)
+
+SUMMARY_FIELDS = ('collected', 'expected', 'paid_count', 'expenses', 'assistance', 'spoilage')
+
+def _period(value):
+    value = value or datetime.utcnow()
+    return (value.year, value.month)
+
+def _contribution(model, get):
+    """مساهمة سجل واحد من النموذج model في الملخص: ((year, month), {الحقل: القيمة})"""
+    if issubclass(model, Payment):
+        amount = get('amount') or 0
+        is_paid = bool(get('is_paid'))
+        return (get('year'), get('month')), {
+            'collected': amount if is_paid else 0,
+            'expected': amount,
+            'paid_count': 1 if is_paid else 0
+        }
+    if issubclass(model, Expense):
+        return _period(get('date')), {'expenses': get('amount') or 0}
+    if issubclass(model, Assistance):
+        return _period(get('date_received')), {'assistance': get('amount') or 0}
+    if issubclass(model, Spoilage):
+        return _period(get('spoilage_date')), {'spoilage': get('spoilage_value') or 0}
+    return None
+
+def _current_getter(obj):
+    return lambda name: getattr(obj, name)
+
+def _previous_getter(obj):
+    """قراءة القيم كما كانت قبل التعديل الحالي"""
+    state = inspect(obj)
+    def get(name):
+        history = state.attrs[name].history
+        if history.deleted:
+            return history.deleted[0]
+        return getattr(obj, name)
+    return get
+
+def _add(deltas, contribution, sign):
+    if contribution is None:
+        return
+    key, values = contribution
+    for target in (key, TOTAL_KEY):
+        for field, value in values.items():
+            deltas[target][field] += sign * value
+
+def _apply_row(connection, year, month, values):
+    table = FinancialSummary.__table__
+    return connection.execute(
+        table.update()
+        .where(table.c.year == year, table.c.month == month)
+        .values({field: table.c[field] + value for field, value in values.items()})
+    ).rowcount
+
+def apply_deltas(connection, deltas):
+    """تطبيق الفروقات بجمل UPDATE ذرية (col = col + delta) مع إنشاء سطر الشهر عند الحاجة
+    
+    إذا لم يوجد سطر الإجمالي فالجدول لم يُبنَ بعد (قاعدة قديمة قبل init_db أو flask rebuild-summary)،
+    فلا يُطبق شيء.
+    """
+    table = FinancialSummary.__table__
+    total = dict(deltas.pop(TOTAL_KEY, {}))
+    if not total or not _apply_row(connection, *TOTAL_KEY, total):
+        return
+    for (year, month), values in deltas.items():
+        values = {field: value for field, value in values.items() if value}
+        if values and not _apply_row(connection, year, month, values):
+            row = {field: 0 for field in SUMMARY_FIELDS}
+            row.update(values)
+            connection.execute(table.insert().values(year=year, month=month, **row))
+
+@event.listens_for(FinancialSummary.__table__, 'after_create')
+def _create_total_row(target, connection, **kw):
+    """سطر الإجمالي يُنشأ مع الجدول الجديد (والجداول الأخرى فارغة حينها) فيبدأ التحديث التدريجي منه"""
+    connection.execute(target.insert().values(year=TOTAL_KEY[0], month=TOTAL_KEY[1],
+                                              **{field: 0 for field in SUMMARY_FIELDS}))
+
+@event.listens_for(db.session, 'after_flush')
+def _update_summary(session, flush_context):
+    """تحديث الملخص تدريجياً بعد كل flush يغير مدفوعات أو مصروفات أو مساعدات أو توالف"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for obj in session.new:
+        _add(deltas, _contribution(type(obj), _current_getter(obj)), 1)
+    for obj in session.deleted:
+        _add(deltas, _contribution(type(obj), _previous_getter(obj)), -1)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            _add(deltas, _contribution(type(obj), _previous_getter(obj)), -1)
+            _add(deltas, _contribution(type(obj), _current_getter(obj)), 1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def apply_inserted(connection, model, rows):
+    """تحديث الملخص لسجلات أُدخلت بالإدخال المجمع (قواميس أعمدة) لأنها لا تمر بأحداث الجلسة"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        _add(deltas, _contribution(model, row.get), 1)
+    if deltas:
+        apply_deltas(connection, deltas)
+
+def rebuild_financial_summary():
+    """إعادة بناء جدول الملخص بالكامل من الجداول الأصلية (للإصلاح)"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    
+    paid_amount = db.case((Payment.is_paid == True, Payment.amount), else_=0)
+    paid_flag = db.case((Payment.is_paid == True, 1), else_=0)
+    for year, month, collected, expected, paid_count in db.session.query(
+        Payment.year, Payment.month,
+        db.func.sum(paid_amount), db.func.sum(Payment.amount), db.func.sum(paid_flag)
+    ).group_by(Payment.year, Payment.month):
+        _add(deltas, ((year, month), {
+            'collected': collected or 0, 'expected': expected or 0, 'paid_count': paid_count or 0
+        }), 1)
+    
+    for period_column, amount_column, field in (
+        (Expense.period, Expense.amount, 'expenses'),
+        (Assistance.period, Assistance.amount, 'assistance'),
+        (Spoilage.period, Spoilage.spoilage_value, 'spoilage'),
+    ):
+        for period, total in db.session.query(
+            period_column, db.func.sum(amount_column)
+        ).filter(period_column.isnot(None)).group_by(period_column):
+            _add(deltas, ((period // 100, period % 100), {field: total or 0}), 1)
+    
+    deltas[TOTAL_KEY]  # سطر الإجمالي موجود دائماً حتى لو كانت القاعدة فارغة
+    
+    FinancialSummary.query.delete()
+    db.session.execute(db.insert(FinancialSummary), [
+        {'year': year, 'month': month, **{field: values.get(field, 0) for field in SUMMARY_FIELDS}}
+        for (year, month), values in deltas.items()
+    ])
+    db.session.commit()
+
+def get_financial_totals():
+    """الإجمالي العام (سطر واحد، قراءة فقط)
+
+    الجدول يُبنى بـ init_db أو flask rebuild-summary؛ إن لم يُبنَ بعد تُعرض أصفار بدلاً من
+    إعادة البناء داخل طلب قراءة.
+    """
+    totals = FinancialSummary.query.filter_by(year=TOTAL_KEY[0], month=TOTAL_KEY[1]).first()
+    if totals is None:
+        totals = FinancialSummary(year=TOTAL_KEY[0], month=TOTAL_KEY[1], **{field: 0 for field in SUMMARY_FIELDS})
+    return totals
+
+def get_monthly_summary(periods):
+    """سطور الملخص لأشهر محددة [(month, year), ...] كقاموس مفتاحه (month, year)"""
+    years = {year for _, year in periods}
+    rows = FinancialSummary.query.filter(FinancialSummary.year.in_(years)).all()
+    by_period = {(row.month, row.year): row for row in rows}
+    return {period: by_period.get(period) for period in periods}
@@ -0,0 +1,67 @@
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# السنة المالية للجمعية تبدأ في نوفمبر وتنتهي في أكتوبر من السنة التالية
+FISCAL_START_MONTH = 11
+
+# شهر واحد من السنة المالية؛ key = (month, year) كما في جدول المدفوعات
+FiscalPeriod = namedtuple('FiscalPeriod', ['month', 'year', 'index', 'label'])
+
+# تطبيع عناوين الأعمدة: إزالة التطويل والمسافات وتحويل الأرقام العربية الهندية
+_TATWEEL = 'ـ'
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+_MONTH_HEADER = re.compile(r'^شهر\s*(\d{1,2})(?:\s*[/\-]?\s*(\d{4}))?$')
+
+def fiscal_year_for(value=None):
+    """السنة المالية (سنة البداية) لتاريخ معين أو لليوم"""
+    value = value or datetime.now()
+    return value.year if value.month >= FISCAL_START_MONTH else value.year - 1
+
+def current_fiscal_year():
+    return fiscal_year_for(datetime.now())
+
+def period_year(month, fiscal_year):
+    """السنة الميلادية لشهر ما داخل سنة مالية"""
+    return fiscal_year if month >= FISCAL_START_MONTH else fiscal_year + 1
+
+@lru_cache(maxsize=32)
+def get_fiscal_periods(fiscal_year):
+    """أشهر السنة المالية الاثنا عشر بالترتيب (من نوفمبر إلى أكتوبر)"""
+    months = list(range(FISCAL_START_MONTH, 13)) + list(range(1, FISCAL_START_MONTH))
+    return tuple(
+        FiscalPeriod(month, period_year(month, fiscal_year), index, f'شهر{month} {period_year(month, fiscal_year)}')
+        for index, month in enumerate(months)
+    )
+
+def get_period_keys(fiscal_year):
+    """مفاتيح (month, year) لأشهر السنة المالية"""
+    return [(period.month, period.year) for period in get_fiscal_periods(fiscal_year)]
+
+def normalize_header(header):
+    """تطبيع عنوان عمود (مثل 'شهر11 ' أو 'شـهر ١' أو 'شهر 3/2025')"""
+    return re.sub(r'\s+', ' ', str(header).replace(_TATWEEL, '').translate(_DIGITS)).strip()
+
+def match_month_column(header, fiscal_year):
+    """تحويل عنوان عمود شهر إلى (month, year) أو None إن لم يكن عمود شهر
+    
+    إن احتوى العنوان على سنة تُستخدم، وإلا تُحسب من السنة المالية المعطاة.
+    """
+    match = _MONTH_HEADER.match(normalize_header(header))
+    if not match:
+        return None
+    month = int(match.group(1))
+    if not 1 <= month <= 12:
+        return None
+    year = int(match.group(2)) if match.group(2) else period_year(month, fiscal_year)
+    return (month, year)
+
+def resolve_month_columns(columns, fiscal_year):
+    """ربط أعمدة الورقة بأشهرها: {اسم العمود: (month, year)}"""
+    resolved = {}
+    for column in columns:
+        period = match_month_column(column, fiscal_year)
+        if period:
+            resolved[column] = period
+    return resolved
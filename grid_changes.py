@@ -0,0 +1,137 @@
+from datetime import datetime
+from flask import current_app
+from models import db, Member, Payment, PaymentLookup
+from financial_summary import apply_inserted
+from arrears import refresh_arrears
+
+# حقول المشترك القابلة للتعديل من جدول الإدارة
+MEMBER_FIELDS = ('name', 'village', 'membership_fee')
+
+class ChangeSet:
+    """تغييرات جدول المدفوعات والمشتركين تُطبق دفعة واحدة
+
+    - التغييرات المكررة لنفس الخلية تُدمج: الحالة الأصلية من أول تغيير والقيمة من آخر تغيير.
+    - المدفوعات والمشتركون الحاليون يُجلبون باستعلامين (IN) مع قفل الصفوف حيث تدعمه القاعدة،
+      والدفعات الجديدة تُدخل بجملة مجمعة واحدة والتعديلات تُجمع في flush واحد.
+    - التزامن التفاؤلي: يرسل العميل القيمة التي رآها (was_paid / original)، فإن تغيرت في
+      القاعدة إلى قيمة أخرى غير المطلوبة يُرفض التغيير بحالة conflict مع القيمة الحالية.
+    """
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.results = [None] * len(changes)
+        self.payments = {}  # (member_id, year, month) -> [الفهارس]
+        self.members = {}  # member_id -> [الفهارس]
+        for index, change in enumerate(changes):
+            try:
+                key = self._key(change)
+            except (KeyError, TypeError, ValueError):
+                self.results[index] = {'status': 'invalid'}
+                continue
+            group = self.payments if change['type'] == 'payment' else self.members
+            group.setdefault(key, []).append(index)
+
+    @staticmethod
+    def _key(change):
+        if change['type'] == 'payment':
+            if not isinstance(change.get('is_paid'), bool) or not 1 <= int(change['month']) <= 12:
+                raise ValueError('payment')
+            return int(change['member_id']), int(change['year']), int(change['month'])
+        if change['type'] == 'member':
+            if not str(change['name']).strip():
+                raise ValueError('name')
+            float(change['membership_fee'])
+            return int(change['id'])
+        raise ValueError(change['type'])
+
+    def _set(self, indexes, status, **extra):
+        """النتيجة لآخر تغيير في المجموعة، وما قبله superseded"""
+        for index in indexes[:-1]:
+            self.results[index] = {'status': 'superseded'}
+        self.results[indexes[-1]] = {'status': status, **extra}
+
+    def _load(self):
+        member_ids = set(self.members) | {member_id for member_id, _, _ in self.payments}
+        if not member_ids:
+            return {}, PaymentLookup()
+        members = {member.id: member for member in
+                   Member.query.filter(Member.id.in_(member_ids)).with_for_update()}
+        payments = PaymentLookup.load({member_id for member_id, _, _ in self.payments},
+                                      {year for _, year, _ in self.payments}, for_update=True)
+        return members, payments
+
+    def apply(self):
+        """تطبيق التغييرات في الجلسة الحالية (بدون commit) وإرجاع نتيجة لكل تغيير"""
+        members, payments = self._load()
+        now = datetime.now()
+        amount = current_app.config['MONTHLY_PAYMENT_AMOUNT']
+        new_payments = []
+
+        for key, indexes in self.payments.items():
+            first, last = self.changes[indexes[0]], self.changes[indexes[-1]]
+            member_id, year, month = key
+            if member_id not in members:
+                self._set(indexes, 'not_found')
+                continue
+            payment = payments.get(member_id, month, year)
+            current = bool(payment and payment.is_paid)
+            wanted = bool(last['is_paid'])
+            if current == wanted:
+                self._set(indexes, 'unchanged', is_paid=current)
+                continue
+            if 'was_paid' in first and bool(first['was_paid']) != current:
+                self._set(indexes, 'conflict', is_paid=current)
+                continue
+            if payment is None:
+                new_payments.append({'member_id': member_id, 'month': month, 'year': year, 'amount': amount,
+                                     'is_paid': wanted, 'payment_date': now if wanted else None})
+                self._set(indexes, 'inserted', is_paid=wanted)
+            else:
+                payment.is_paid = wanted
+                payment.payment_date = now if wanted else None
+                self._set(indexes, 'updated', is_paid=wanted)
+
+        for member_id, indexes in self.members.items():
+            member = members.get(member_id)
+            if member is None:
+                self._set(indexes, 'not_found')
+                continue
+            original = self.changes[indexes[0]].get('original') or {}
+            last = self.changes[indexes[-1]]
+            wanted = {'name': str(last['name']).strip(), 'village': last.get('village') or None,
+                      'membership_fee': float(last['membership_fee'])}
+            current = {field: getattr(member, field) for field in MEMBER_FIELDS}
+            changed = [field for field in MEMBER_FIELDS if current[field] != wanted[field]]
+            if not changed:
+                self._set(indexes, 'unchanged', values=current)
+                continue
+            # تعارض إذا عدّل مدير آخر حقلاً نريد تغييره منذ أن حُمّلت الصفحة
+            if any(field in original and _differs(original[field], current[field]) for field in changed):
+                self._set(indexes, 'conflict', values=current)
+                continue
+            for field in changed:
+                setattr(member, field, wanted[field])
+            self._set(indexes, 'updated', values=wanted)
+
+        if new_payments:
+            # الإدخال المجمع لا يمر بأحداث الجلسة، فيُحدَّث الملخص والمتأخرات في نفس المعاملة
+            db.session.execute(db.insert(Payment), new_payments)
+            connection = db.session.connection()
+            apply_inserted(connection, Payment, new_payments)
+            refresh_arrears(connection, {row['member_id'] for row in new_payments})
+        return self.results
+
+    def counts(self):
+        counts = {}
+        for result in self.results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return counts
+
+def _differs(original, current):
+    """مقارنة قيمة العميل (نص من حقل الإدخال غالباً) بالقيمة المخزنة"""
+    if isinstance(current, float):
+        try:
+            return float(original) != current
+        except (TypeError, ValueError):
+            return True
+    return (str(original).strip() or None) != current
@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+from config import Config
+
+# عمال بخيوط (gthread): عملية لكل نواة (+1) وخيوط لكل عملية لتداخل انتظار I/O
+# مع SQLite تبقى الكتابة متسلسلة لكن القراءة تتزامن معها بفضل WAL
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() + 1)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 120)  # التصدير والتقارير الكبيرة
+keepalive = 5
+# إعادة تشغيل العامل دورياً للحد من تضخم الذاكرة بعد الاستيراد والتصدير الكبير
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def when_ready(server):
+    """تشغيل عمليات المهام الخلفية بجانب عمال gunicorn"""
+    if Config.JOB_WORKERS > 0:
+        from jobs import start_worker_pool
+        server.job_workers = start_worker_pool(Config.JOB_WORKERS)
+        # عمال الويب يُنشؤون بعد when_ready ويقرؤون Config عند استيراد التطبيق: المهام للعمال لا للطلب
+        Config.JOBS_INLINE = False
+        server.log.info('Started %d background job workers', Config.JOB_WORKERS)
+
+
+def on_exit(server):
+    for process in getattr(server, 'job_workers', []):
+        process.terminate()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+from functools import wraps
+from flask import Response, make_response, request, session
+from data_version import current_version
+from memory_store import CacheEntry, MemoryStore
+
+
+class FileStore:
+    """مخزن ملفات مشترك بين عمال gunicorn: ملف لكل صفحة يبدأ اسمه برقم الإصدار"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, version, key):
+        return os.path.join(self.directory, f'{version}-{hashlib.sha1(key.encode()).hexdigest()}.page')
+
+    def get(self, version, key):
+        try:
+            with open(self._path(version, key), 'rb') as f:
+                meta = json.loads(f.readline())
+                return CacheEntry(f.read(), meta['etag'], meta['content_type'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, version, key, entry):
+        path = self._path(version, key)
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                f.write(json.dumps({'etag': entry.etag, 'content_type': entry.content_type}).encode() + b'\n')
+                f.write(entry.body)
+            os.replace(temp, path)  # كتابة ذرية: لا يقرأ عامل آخر ملفاً ناقصاً
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def purge(self, version):
+        """حذف صفحات الإصدارات السابقة (أفضل جهد، قد يحذفها عامل آخر في نفس الوقت)"""
+        prefix = f'{version}-'
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.page') and not name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class HttpCache:
+    """ذاكرة الصفحات العامة مع ETag و Last-Modified ورقم إصدار للبيانات
+
+    رقم الإصدار (data_version.py) يزداد داخل كل معاملة تكتب بيانات في أي عملية، ومفتاح الصفحة
+    يتضمنه فلا تُعرض صفحة قديمة بعد أي حفظ.
+    """
+
+    def __init__(self, app=None):
+        self.memory = None
+        self.files = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HTTP_CACHE_ENABLED', True)
+        app.config.setdefault('HTTP_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.config.setdefault('HTTP_CACHE_DIR', None)
+        app.extensions['http_cache'] = self
+        self.enabled = app.config['HTTP_CACHE_ENABLED']
+        if not self.enabled:
+            return
+        self.memory = MemoryStore(app.config['HTTP_CACHE_MAX_BYTES'])
+        if app.config['HTTP_CACHE_DIR']:
+            self.files = FileStore(app.config['HTTP_CACHE_DIR'])
+
+    # --- تخزين الصفحات ---
+
+    @staticmethod
+    def cacheable():
+        """الصفحات العامة للزوار فقط: المدير يرى روابط إضافية ورسائل flash تخص جلسته"""
+        return request.method == 'GET' and not session.get('admin_logged_in') and not session.get('_flashes')
+
+    @staticmethod
+    def key():
+        # format=json ضمن المعاملات، ونوع المحتوى يغيّر الاستجابة أيضاً (wants_json)
+        args = sorted(request.args.items(multi=True))
+        return json.dumps([request.endpoint, args, request.headers.get('Content-Type')], ensure_ascii=False)
+
+    def _lookup(self, version, key):
+        if version != self.version:
+            # إصدار جديد: كل ما في الذاكرة أصبح قديماً
+            self.memory.clear()
+            if self.files:
+                self.files.purge(version)
+            self.version = version
+        entry = self.memory.get(key)
+        if entry is None and self.files:
+            entry = self.files.get(version, key)
+            if entry is not None:
+                self.memory.put(key, entry)
+        return entry
+
+    def _store(self, version, key, response):
+        body = response.get_data()
+        entry = CacheEntry(body, hashlib.sha1(body).hexdigest(), response.content_type)
+        self.memory.put(key, entry)
+        if self.files:
+            self.files.put(version, key, entry)
+        return entry
+
+    def cached(self, view):
+        """مزخرف للمسارات العامة: يعيد الصفحة المخزنة أو 304 إن لم تتغير لدى المتصفح"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or not self.cacheable():
+                return view(*args, **kwargs)
+            version, modified = current_version()
+            key = self.key()
+            entry = self._lookup(version, key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = self._store(version, key, response)
+                self.misses += 1
+                status = 'MISS'
+            else:
+                self.hits += 1
+                status = 'HIT'
+            response = Response(entry.body, content_type=entry.content_type)
+            response.set_etag(entry.etag)
+            response.last_modified = modified
+            response.cache_control.no_cache = True  # يُعاد التحقق في كل مرة عبر ETag
+            response.vary.add('Cookie')
+            response.headers['X-Cache'] = status
+            return response.make_conditional(request)
+        return wrapper
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.memory.entries) if self.memory else 0,
+            'bytes': self.memory.size if self.memory else 0,
+            'file_store': bool(self.files),
+        }
+
+
+http_cache = HttpCache()
@@ -1,11 +1,78 @@
 from flask import Flask
+from sqlalchemy import inspect
 from config import Config
-from models import db, Member, Payment, Project, Expense
+from models import db, configure_sqlite, Member, Payment, Project, Expense, Asset, Spoilage, PERIOD_DATE_COLUMNS
+from financial_summary import rebuild_financial_summary
+from arrears import rebuild_arrears
+from depreciation import rebuild_asset_snapshots
+from search import install_search_index
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
+configure_sqlite(app)
 
 with app.app_context():
     db.create_all()
+    # إضافة عمود period (YYYYMM) للجداول الموجودة مسبقاً وتعبئته
+    for model in (Payment, *PERIOD_DATE_COLUMNS):
+        table = model.__table__
+        columns = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+        if 'period' not in columns:
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN period INTEGER')
+        if model is Payment:
+            value = table.c.year * 100 + table.c.month
+        else:
+            date_column = table.c[PERIOD_DATE_COLUMNS[model]]
+            value = db.extract('year', date_column) * 100 + db.extract('month', date_column)
+        db.session.execute(table.update().where(table.c.period.is_(None)).values(period=value))
+        db.session.commit()
+    
+    # عمود طريقة الاستهلاك للأصول الموجودة مسبقاً (القسط الثابت افتراضياً)
+    columns = {column['name'] for column in inspect(db.engine).get_columns('asset')}
+    if 'depreciation_method' not in columns:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("ALTER TABLE asset ADD COLUMN depreciation_method VARCHAR(20) DEFAULT 'straight_line'")
+    
+    # ربط التوالف بأصولها: عمود asset_id يُعبأ من الاسم بجملة UPDATE واحدة (أول أصل بنفس الاسم)
+    columns = {column['name'] for column in inspect(db.engine).get_columns('spoilage')}
+    if 'asset_id' not in columns:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ALTER TABLE spoilage ADD COLUMN asset_id INTEGER REFERENCES asset(id)')
+    first_asset = db.select(db.func.min(Asset.id)).where(Asset.name == Spoilage.item_name).scalar_subquery()
+    db.session.execute(Spoilage.__table__.update().where(Spoilage.asset_id.is_(None)).values(asset_id=first_asset))
+    db.session.commit()
+    
+    # حذف الدفعات المكررة لنفس العضو والشهر قبل إنشاء الفهرس الفريد (كان الإصدار القديم يسمح بها):
+    # يبقى أقدم سطر ويأخذ حالة الدفع ومبلغ وتاريخ أي سطر مدفوع من المكررات
+    if 'ix_payment_member_period' not in {index['name'] for index in inspect(db.engine).get_indexes('payment')}:
+        table = Payment.__table__
+        duplicates = db.session.execute(
+            db.select(table.c.member_id, table.c.year, table.c.month)
+            .group_by(table.c.member_id, table.c.year, table.c.month).having(db.func.count() > 1)
+        ).all()
+        removed = 0
+        for member_id, year, month in duplicates:
+            rows = db.session.execute(db.select(table).where(
+                table.c.member_id == member_id, table.c.year == year, table.c.month == month
+            ).order_by(table.c.id)).all()
+            keep, paid = rows[0], [row for row in rows if row.is_paid]
+            if paid and not keep.is_paid:
+                db.session.execute(table.update().where(table.c.id == keep.id).values(
+                    is_paid=True, amount=paid[0].amount, payment_date=paid[0].payment_date))
+            db.session.execute(table.delete().where(table.c.id.in_([row.id for row in rows[1:]])))
+            removed += len(rows) - 1
+        db.session.commit()
+        if removed:
+            print(f"Removed {removed} duplicate payment rows")
+
+    # إنشاء الفهارس الجديدة على الجداول الموجودة مسبقاً
+    for model in (Payment, *PERIOD_DATE_COLUMNS, Asset):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    rebuild_financial_summary()
+    rebuild_arrears()
+    install_search_index()
+    rebuild_asset_snapshots()
     print("Database created successfully!")
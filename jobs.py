@@ -0,0 +1,255 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from models import db, Job
+
+# سجل معالجات المهام: نوع المهمة -> دالة تنفيذها
+JOB_HANDLERS = {}
+
+# الفاصل بين مرات تنظيف المهام القديمة في حلقة العامل (بالثواني)
+PURGE_INTERVAL = 600
+
+def job_handler(kind):
+    """تسجيل دالة كمعالج لنوع مهمة خلفية
+    
+    يستقبل المعالج (job, **params) ويعيد قاموساً اختيارياً فيه message و result
+    و file = (المسار، اسم التنزيل).
+    """
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue_job(kind, **params):
+    """إضافة مهمة إلى الطابور وإرجاعها
+    
+    مع JOBS_INLINE (لا توجد عمليات عمال) تُنفذ المهمة فوراً في نفس العملية حتى لا تبقى منتظرة.
+    """
+    from flask import current_app
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'نوع مهمة غير معروف: {kind}')
+    job = Job(kind=kind, params=json.dumps(params, ensure_ascii=False), message='في الانتظار')
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config['JOBS_INLINE']:
+        job.status, job.started_at, job.message = 'running', datetime.utcnow(), 'قيد التنفيذ'
+        db.session.commit()
+        run_job(job)
+        purge_finished_jobs(current_app)
+    return job
+
+def report_progress(job, progress, message=None):
+    """تحديث نسبة إنجاز المهمة (يُنفذ commit للجلسة الحالية)"""
+    job.progress = max(0, min(100, int(progress)))
+    if message:
+        job.message = message
+    db.session.commit()
+
+def get_results_folder(app):
+    folder = app.config['JOB_RESULTS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def purge_finished_jobs(app, max_age_hours=None):
+    """حذف المهام المنتهية الأقدم من JOB_RETENTION_HOURS مع ملفات نتائجها، والملفات اليتيمة القديمة
+    
+    تُحذف الملفات داخل مجلد النتائج فقط (ملفات ذاكرة التقارير تبقى)، ولا يُحذف ملف مرفوع لمهمة
+    لم تنتهِ بعد. يعيد عدد المهام المحذوفة.
+    """
+    max_age = timedelta(hours=max_age_hours or app.config['JOB_RETENTION_HOURS'])
+    cutoff = datetime.utcnow() - max_age
+    folder = os.path.abspath(get_results_folder(app))
+    expired = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff)
+    for (path,) in expired.with_entities(Job.result_path).filter(Job.result_path.isnot(None)):
+        if os.path.dirname(os.path.abspath(path)) == folder and os.path.exists(path):
+            os.remove(path)
+    count = expired.delete(synchronize_session=False)
+    db.session.commit()
+    
+    # الملفات التي لا تخص مهمة باقية: نتائج مهام حُذفت أو ملفات مرفوعة توقفت مهامها
+    keep = {os.path.abspath(path) for (path,) in
+            db.session.query(Job.result_path).filter(Job.result_path.isnot(None))}
+    for (params,) in db.session.query(Job.params).filter(Job.status.in_(('queued', 'running'))):
+        path = json.loads(params or '{}').get('path')
+        if path:
+            keep.add(os.path.abspath(path))
+    oldest = time.time() - max_age.total_seconds()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if path not in keep and os.path.getmtime(path) < oldest:
+                os.remove(path)
+        except OSError:
+            pass  # قد يحذفه عامل آخر في نفس الوقت
+    return count
+
+def claim_next_job():
+    """حجز أقدم مهمة منتظرة بشكل ذري (UPDATE مشروط) حتى لا تنفذها عمليتان"""
+    while True:
+        candidate = db.session.query(Job.id).filter_by(status='queued').order_by(Job.id).first()
+        if candidate is None:
+            return None
+        claimed = Job.query.filter_by(id=candidate.id, status='queued').update(
+            {'status': 'running', 'started_at': datetime.utcnow(), 'message': 'قيد التنفيذ'},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id)
+
+def run_job(job):
+    """تنفيذ مهمة محجوزة وتسجيل نتيجتها أو خطئها"""
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        outcome = handler(job, **json.loads(job.params or '{}')) or {}
+        job.status = 'done'
+        job.progress = 100
+        job.message = outcome.get('message') or 'تمت المهمة بنجاح'
+        if 'result' in outcome:
+            job.result = json.dumps(outcome['result'], ensure_ascii=False, default=str)
+        if 'file' in outcome:
+            job.result_path, job.result_name = outcome['file']
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.message = str(e)[:500]
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+def requeue_interrupted_jobs(started_before):
+    """إعادة المهام التي توقفت عمليتها (مثلاً عند إعادة التشغيل) إلى الطابور"""
+    count = Job.query.filter(Job.status == 'running', Job.started_at < started_before).update(
+        {'status': 'queued', 'message': 'أعيدت إلى الطابور بعد إعادة التشغيل'},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return count
+
+def work(app, once=False):
+    """حلقة العامل: حجز المهام وتنفيذها، مع الانتظار عند فراغ الطابور وتنظيف المهام القديمة"""
+    with app.app_context():
+        purged_at = None
+        while True:
+            if purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL:
+                try:
+                    purge_finished_jobs(app)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.warning('تعذر تنظيف المهام القديمة: %s', e)
+                purged_at = time.monotonic()
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                # مثلاً قاعدة البيانات مقفلة أو لم تُهيأ بعد: المحاولة لاحقاً
+                db.session.rollback()
+                app.logger.warning('تعذر حجز مهمة: %s', e)
+                job = None
+            if job is None:
+                if once:
+                    return
+                time.sleep(app.config['JOB_POLL_INTERVAL'])
+                continue
+            run_job(job)
+            db.session.remove()
+
+def start_worker_pool(processes):
+    """تشغيل عمليات العمال (تُستدعى من gunicorn.conf.py عند جاهزية الخادم)
+    
+    كل عامل عملية مستقلة تنفذ أمر flask run-jobs، والعامل الأول يعيد المهام
+    التي انقطعت قبل هذا التشغيل إلى الطابور.
+    """
+    started_before = datetime.utcnow().isoformat()
+    pool = []
+    for index in range(processes):
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run-jobs']
+        if index == 0:
+            command += ['--requeue-before', started_before]
+        pool.append(subprocess.Popen(command))
+    return pool
+
+# ===== معالجات المهام =====
+
+@job_handler('import_excel')
+def import_excel_job(job, path, fiscal_year=None):
+    """استيراد ملف Excel مرفوع"""
+    from excel_utils import ExcelManager
+    try:
+        result = ExcelManager.import_from_excel(
+            path, progress=lambda progress, message: report_progress(job, progress, message),
+            fiscal_year=fiscal_year)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    if not result['success']:
+        raise RuntimeError(result['message'])
+    return {'message': result['message'], 'result': result}
+
+@job_handler('import_expenses')
+def import_expenses_job(job, path, dry_run=False):
+    """إدخال مصروفات متعددة من ملف CSV/Excel مرفوع أو من جدول الواجهة (ملف JSON)
+    
+    النتيجة بنفس شكل استجابة الإدخال المجمع (مع أخطاء كل صف) لتعرضها الواجهة.
+    """
+    from flask import current_app
+    from expense_import import frame_from_json, frame_from_upload, import_expenses, result_message
+    try:
+        if path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                payload = json.load(f)
+            # الصف 1 في جدول الواجهة هو أول مصروف، وفي الملفات بعد سطر العناوين
+            df, first_row = frame_from_json(payload.get('expenses') if isinstance(payload, dict) else payload), 1
+        else:
+            df, first_row = frame_from_upload(path, os.path.basename(path)), 2
+        report_progress(job, 20, f'تمت قراءة {len(df)} صف')
+        result = import_expenses(df, current_app.config['EXPENSE_IMPORT_CHUNK_SIZE'], first_row, dry_run)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    message = result_message(result, dry_run)
+    outcome = {'success': not result['failed'], 'message': message, **result}
+    if result['failed']:
+        outcome['error'] = message
+    return {'message': message, 'result': outcome}
+
+@job_handler('export_members_excel')
+def export_members_excel_job(job, fiscal_year=None):
+    """تصدير الأعضاء والمدفوعات إلى ملف Excel للتنزيل"""
+    from flask import current_app
+    from excel_utils import ExcelManager
+    report_progress(job, 10, 'جاري كتابة الملف')
+    path = os.path.join(get_results_folder(current_app), f'job_{job.id}.xlsx')
+    count = ExcelManager.save_members_xlsx(path, fiscal_year)
+    return {
+        'message': f'تم تصدير {count} عضو بنجاح',
+        'file': (path, f'members_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
+    }
+
+@job_handler('snapshot_assets')
+def snapshot_assets_job(job, fiscal_year=None, months=12):
+    """إعادة حساب تقييم الأصول الشهري لآخر months شهراً (مثل flask snapshot-assets)"""
+    from depreciation import rebuild_asset_snapshots
+    written = rebuild_asset_snapshots(months)
+    return {'message': f'تم حساب {written} سطر تقييم لآخر {months} شهراً'}
+
+def _pdf_report_job(job, name, fiscal_year):
+    """توليد التقرير في ذاكرة التقارير؛ التنزيل من ملف الذاكرة نفسه بدون نسخة في مجلد النتائج"""
+    from pdf_reports import pdf_reports
+    report_progress(job, 10, 'جاري إنشاء التقرير')
+    return {
+        'message': 'تم إنشاء التقرير بنجاح',
+        'file': (pdf_reports.get(name, fiscal_year), f'{name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf')
+    }
+
+@job_handler('export_members_pdf')
+def export_members_pdf_job(job, fiscal_year=None):
+    """تقرير المشتركين PDF في الخلفية"""
+    return _pdf_report_job(job, 'members', fiscal_year)
+
+@job_handler('export_payments_pdf')
+def export_payments_pdf_job(job, fiscal_year=None):
+    """تقرير المدفوعات PDF في الخلفية"""
+    return _pdf_report_job(job, 'payments', fiscal_year)
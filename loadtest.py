@@ -0,0 +1,180 @@
+"""اختبار حمل يقارن الإعداد الافتراضي بالإعداد المضبوط لـ gunicorn و SQLite
+
+الاستخدام:
+    python loadtest.py                       # 2000 مشترك، 20 عميلاً متزامناً، 20 ثانية لكل إعداد
+    python loadtest.py --members 5000 --clients 40 --duration 30 --output loadtest.json
+
+يُنشئ قاعدة SQLite تركيبية (عبر benchmark.py) ثم يشغّل gunicorn مرتين على نسخة منها:
+  - baseline: عامل sync واحد بدون PRAGMA (كما كان Procfile سابقاً)
+  - tuned: gunicorn.conf.py (عمال gthread بعدد الأنوية) مع WAL وبقية SQLITE_PRAGMAS
+ويرسل مزيجاً من القراءات والكتابات (تحديث حالة دفعة) ثم يطبع الإنتاجية وزمن الاستجابة.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+READ_PATHS = ['/', '/members', '/admin/dashboard', '/admin/payments', '/admin/expense_reports',
+              '/admin/assistance/report']
+WRITE_SHARE = 0.2  # نسبة طلبات الكتابة
+
+CONFIGURATIONS = {
+    # gunicorn يقرأ ./gunicorn.conf.py تلقائياً، لذلك يُمرَّر ملف فارغ للإعداد الافتراضي
+    'baseline': {'args': ['-c', os.devnull], 'env': {'SQLITE_TUNING': '0'}},
+    'tuned': {'args': ['-c', 'gunicorn.conf.py'], 'env': {'SQLITE_TUNING': '1'}},
+}
+
+
+def seed(path, members):
+    """إنشاء القاعدة التركيبية في عملية مستقلة (بدون PRAGMA حتى تبقى بنمط journal الافتراضي)"""
+    code = (
+        'import random, benchmark\n'
+        'from app import app\n'
+        'from models import db\n'
+        'from financial_summary import rebuild_financial_summary\n'
+        'from arrears import rebuild_arrears\n'
+        'with app.app_context():\n'
+        '    db.create_all()\n'
+        f'    benchmark.seed_database(db, {members}, random.Random(benchmark.SEED))\n'
+        '    rebuild_financial_summary()\n'
+        '    rebuild_arrears()\n'
+    )
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, SQLITE_TUNING='0', PERF_ENABLED='0')
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True)
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=10).read()
+            return
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.3)
+    raise RuntimeError('لم يبدأ الخادم في الوقت المحدد')
+
+def login(base_url):
+    """جلسة مدير مستقلة لكل عميل"""
+    from config import Config
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'username': Config.ADMIN_USERNAME, 'password': Config.ADMIN_PASSWORD}).encode()
+    opener.open(base_url + '/admin/login', data=data, timeout=30).read()
+    return opener
+
+def client_loop(base_url, members, periods, deadline, seed_value, results):
+    rng = random.Random(seed_value)
+    opener = login(base_url)
+    while time.time() < deadline:
+        if rng.random() < WRITE_SHARE:
+            month, year = rng.choice(periods)
+            body = json.dumps({'member_id': rng.randint(1, members), 'month': month, 'year': year,
+                               'is_paid': rng.random() < 0.5}).encode()
+            request = urllib.request.Request(base_url + '/admin/update_payment', data=body, method='POST',
+                                             headers={'Content-Type': 'application/json'})
+            kind = 'write'
+        else:
+            request = urllib.request.Request(base_url + rng.choice(READ_PATHS))
+            kind = 'read'
+        started = time.perf_counter()
+        try:
+            with opener.open(request, timeout=60) as response:
+                content = response.read()
+                # update_payment يعيد 200 مع success=false عند الفشل (مثل database is locked)
+                ok = response.status < 500 and (kind == 'read' or json.loads(content).get('success'))
+        except urllib.error.HTTPError as error:
+            ok = error.code < 500
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            ok = False
+        results.append((kind, ok, time.perf_counter() - started))
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run_configuration(name, template_db, members, clients, duration, port):
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'loadtest.db')
+    shutil.copy(template_db, db_path)
+    config = CONFIGURATIONS[name]
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, JOB_WORKERS='0', PERF_ENABLED='0', **config['env'])
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(['gunicorn', *config['args'], '--bind', f'127.0.0.1:{port}', 'app:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=True)
+    try:
+        wait_until_up(base_url)
+        from fiscal_calendar import current_fiscal_year, get_period_keys
+        periods = get_period_keys(current_fiscal_year())
+        results = []
+        deadline = time.time() + duration
+        threads = [threading.Thread(target=client_loop, args=(base_url, members, periods, deadline, i, results))
+                   for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {'requests': len(results), 'requests_per_second': round(len(results) / duration, 1),
+               'errors': sum(1 for _, ok, _ in results if not ok)}
+    for kind in ('read', 'write'):
+        latencies = [elapsed * 1000 for k, ok, elapsed in results if k == kind and ok]
+        summary[kind] = {
+            'count': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) or 0, 1),
+            'p95_ms': round(percentile(latencies, 95) or 0, 1),
+            'p99_ms': round(percentile(latencies, 99) or 0, 1),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='اختبار حمل: الإعداد الافتراضي مقابل المضبوط')
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=20, help='عدد العملاء المتزامنين')
+    parser.add_argument('--duration', type=int, default=20, help='مدة كل إعداد بالثواني')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument('--output', default='loadtest_results.json')
+    args = parser.parse_args()
+
+    template_dir = tempfile.mkdtemp()
+    template_db = os.path.join(template_dir, 'template.db')
+    print(f'إنشاء قاعدة تركيبية بـ {args.members} مشترك...', flush=True)
+    seed(template_db, args.members)
+
+    report = {'created_at': datetime.now().isoformat(timespec='seconds'), 'cpu_count': os.cpu_count(),
+              'members': args.members, 'clients': args.clients, 'duration': args.duration, 'results': {}}
+    try:
+        for name in args.configs:
+            print(f'تشغيل {name}...', flush=True)
+            result = run_configuration(name, template_db, args.members, args.clients, args.duration, args.port)
+            report['results'][name] = result
+            print(f"  {result['requests_per_second']} طلب/ثانية، أخطاء {result['errors']}، "
+                  f"قراءة p95 {result['read']['p95_ms']} ms، كتابة p95 {result['write']['p95_ms']} ms")
+    finally:
+        shutil.rmtree(template_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'تم حفظ النتائج في {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""ذاكرة LRU داخل العملية للاستجابات المولدة (الصفحات العامة وتقارير Word)"""
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'content_type'])
+
+
+class MemoryStore:
+    """ذاكرة LRU داخل العملية محدودة بمجموع أحجام الأجسام بالبايت"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self.entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
@@ -1,8 +1,40 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 
+def configure_sqlite(app):
+    """تطبيق SQLITE_PRAGMAS على كل اتصال SQLite جديد (يُستدعى بعد db.init_app)"""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def period_key(value):
+    """مفتاح الشهر بصيغة YYYYMM (عدد صحيح قابل للفهرسة والتجميع على أي قاعدة بيانات)"""
+    return value.year * 100 + value.month
+
+def _period_default(date_column):
+    """قيمة period الافتراضية عند الإدراج (تعمل أيضاً مع الإدراج المجمع)"""
+    def default(context):
+        value = context.get_current_parameters().get(date_column)
+        return period_key(value or datetime.utcnow())
+    return default
+
+def _payment_period_default(context):
+    params = context.get_current_parameters()
+    return params['year'] * 100 + params['month']
+
 class Member(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     member_number = db.Column(db.Integer, unique=True, nullable=False)
@@ -79,6 +111,52 @@ class Member(db.Model):
                 unpaid.append(f"{payment.month}/{payment.year}")
         return unpaid
     
+    @classmethod
+    def filtered(cls, village=None, payment_status=None):
+        """استعلام المشتركين مع فلترة القرية وحالة الدفع (paid / unpaid)"""
+        query = cls.query
+        if village:
+            query = query.filter(cls.village == village)
+        if payment_status in ('paid', 'unpaid'):
+            has_unpaid = db.exists().where(db.and_(Payment.member_id == cls.id, Payment.is_paid == False))
+            query = query.filter(has_unpaid if payment_status == 'unpaid' else ~has_unpaid)
+        return query
+    
+    @classmethod
+    def keyset_page(cls, query, per_page, after=None, before=None):
+        """صفحة من المشتركين مرتبة حسب رقم العضو باستخدام ترقيم المفتاح (keyset)
+        
+        after: آخر رقم عضو في الصفحة السابقة، before: أول رقم عضو في الصفحة التالية.
+        """
+        if before is not None:
+            rows = query.filter(cls.member_number < before).order_by(
+                cls.member_number.desc()).limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            return KeysetPage(list(reversed(rows[:per_page])), per_page, has_next=True, has_prev=has_more)
+        
+        if after is not None:
+            query = query.filter(cls.member_number > after)
+        rows = query.order_by(cls.member_number).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        return KeysetPage(rows[:per_page], per_page, has_next=has_more, has_prev=after is not None)
+    
+    @classmethod
+    def query_payment_status(cls, month, year):
+        """استعلام واحد مجمّع يعيد لكل عضو حالة شهر معين مع إجمالي المدفوع وعدد الأشهر المدفوعة
+        
+        كل صف: (العضو، هل الشهر مدفوع، مبلغ الشهر أو None، إجمالي المدفوع، عدد الأشهر المدفوعة)
+        """
+        in_month = db.and_(Payment.month == month, Payment.year == year)
+        paid_amount = db.case((Payment.is_paid == True, Payment.amount), else_=0)
+        paid_flag = db.case((Payment.is_paid == True, 1), else_=0)
+        return db.session.query(
+            cls,
+            db.func.coalesce(db.func.max(db.case((in_month, paid_flag))), 0).label('month_is_paid'),
+            db.func.max(db.case((in_month, Payment.amount))).label('month_amount'),
+            db.func.coalesce(db.func.sum(paid_amount), 0).label('total_paid'),
+            db.func.coalesce(db.func.sum(paid_flag), 0).label('months_paid'),
+        ).outerjoin(Payment, Payment.member_id == cls.id).group_by(cls.id).order_by(cls.id)
+    
     def get_monthly_payments_dict(self):
         """إرجاع المدفوعات الشهرية كـ dictionary للعرض في جدول Excel-like"""
         payments_dict = {}
@@ -91,7 +169,38 @@ class Member(db.Model):
             }
         return payments_dict
 
+class KeysetPage:
+    """صفحة نتائج مرقّمة بالمفتاح مع روابط الصفحة السابقة والتالية"""
+    
+    def __init__(self, items, per_page, has_next, has_prev):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next and bool(items)
+        self.has_prev = has_prev and bool(items)
+    
+    @property
+    def next_after(self):
+        """رقم آخر عضو في الصفحة (معامل after للصفحة التالية)"""
+        return self.items[-1].member_number if self.has_next else None
+    
+    @property
+    def prev_before(self):
+        """رقم أول عضو في الصفحة (معامل before للصفحة السابقة)"""
+        return self.items[0].member_number if self.has_prev else None
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+
 class Payment(db.Model):
+    # فهرس مركب فريد: دفعة واحدة لكل عضو في كل شهر
+    __table_args__ = (
+        db.Index('ix_payment_member_period', 'member_id', 'year', 'month', unique=True),
+        db.Index('ix_payment_period', 'period'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
     month = db.Column(db.Integer, nullable=False)  # 1-12
@@ -99,9 +208,52 @@ class Payment(db.Model):
     amount = db.Column(db.Float, default=1000.0)
     is_paid = db.Column(db.Boolean, default=False)
     payment_date = db.Column(db.DateTime, nullable=True)
+    period = db.Column(db.Integer, default=_payment_period_default)  # YYYYMM من year و month
     
     def __repr__(self):
         return f'<Payment {self.month}/{self.year} - {self.is_paid}>'
+    
+    @classmethod
+    def find(cls, member_id, month, year):
+        """البحث عن دفعة عضو لشهر معين عبر الفهرس المركب"""
+        return cls.query.filter_by(member_id=member_id, year=year, month=month).first()
+
+class PaymentLookup:
+    """فهرس في الذاكرة للمدفوعات مفتاحه (member_id, year, month)
+    
+    يُبنى مرة واحدة لكل طلب باستعلام واحد بدلاً من استعلام لكل عضو أو لكل شهر.
+    """
+    
+    def __init__(self, payments=()):
+        self._payments = {}
+        for payment in payments:
+            self.add(payment)
+    
+    @classmethod
+    def load(cls, member_ids=None, years=None, for_update=False):
+        """تحميل المدفوعات المطلوبة باستعلام واحد (مع قفل الصفوف حيث تدعمه القاعدة)"""
+        query = Payment.query
+        if member_ids is not None:
+            member_ids = list(member_ids)
+            if not member_ids:
+                return cls()
+            query = query.filter(Payment.member_id.in_(member_ids))
+        if years is not None:
+            query = query.filter(Payment.year.in_(list(years)))
+        if for_update:
+            query = query.with_for_update()
+        return cls(query.all())
+    
+    def add(self, payment):
+        """إضافة دفعة (جديدة أو محمّلة) إلى الفهرس"""
+        self._payments[(payment.member_id, payment.year, payment.month)] = payment
+    
+    def get(self, member_id, month, year):
+        """الحصول على دفعة عضو لشهر معين أو None"""
+        return self._payments.get((member_id, year, month))
+    
+    def __len__(self):
+        return len(self._payments)
 
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -120,6 +272,7 @@ class Expense(db.Model):
     amount = db.Column(db.Float, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     category = db.Column(db.String(50), nullable=True)
+    period = db.Column(db.Integer, index=True, default=_period_default('date'))  # YYYYMM من date
     
     def __repr__(self):
         return f'<Expense {self.description}: {self.amount}>'
@@ -135,6 +288,7 @@ class Assistance(db.Model):
     date_received = db.Column(db.DateTime, default=datetime.utcnow)  # تاريخ الاستلام
     status = db.Column(db.String(50), default='مستلمة')  # حالة المساعدة
     notes = db.Column(db.Text, nullable=True)  # ملاحظات إضافية
+    period = db.Column(db.Integer, index=True, default=_period_default('date_received'))  # YYYYMM من تاريخ الاستلام
     
     def __repr__(self):
         return f'<Assistance {self.title}: {self.amount}>'
@@ -151,20 +305,36 @@ class Spoilage(db.Model):
     category = db.Column(db.String(50), nullable=True)  # فئة الصنف (كراسي، ألواح شمسية، بطاريات، إلخ)
     status = db.Column(db.String(50), default='تالف')  # حالة الصنف
     notes = db.Column(db.Text, nullable=True)  # ملاحظات إضافية
+    period = db.Column(db.Integer, index=True, default=_period_default('spoilage_date'))  # YYYYMM من تاريخ التلف
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id', ondelete='SET NULL'), nullable=True, index=True)  # الأصل المخصوم منه
     
     def __repr__(self):
         return f'<Spoilage {self.item_name}: {self.spoilage_value}>'
 
+# إبقاء period متزامناً مع التاريخ عند تعديل السجلات عبر الـ ORM
+PERIOD_DATE_COLUMNS = {Expense: 'date', Assistance: 'date_received', Spoilage: 'spoilage_date'}
+
+def _sync_period(mapper, connection, target):
+    if isinstance(target, Payment):
+        target.period = target.year * 100 + target.month
+    else:
+        value = getattr(target, PERIOD_DATE_COLUMNS[type(target)])
+        target.period = period_key(value) if value else None
+
+for _model in (Payment, *PERIOD_DATE_COLUMNS):
+    event.listen(_model, 'before_update', _sync_period)
+
 class Asset(db.Model):
     """نموذج الأصول الثابتة"""
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)  # اسم الأصل
+    name = db.Column(db.String(200), nullable=False, index=True)  # اسم الأصل
     description = db.Column(db.Text, nullable=True)  # وصف الأصل
     category = db.Column(db.String(50), nullable=True)  # فئة الأصل
     purchase_value = db.Column(db.Float, nullable=False)  # قيمة الشراء
-    current_value = db.Column(db.Float, nullable=False)  # القيمة الحالية
+    current_value = db.Column(db.Float, nullable=False)  # القيمة الحالية (يحسبها depreciation.py)
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)  # تاريخ الشراء
     depreciation_rate = db.Column(db.Float, default=0.0)  # معدل الاستهلاك السنوي
+    depreciation_method = db.Column(db.String(20), default='straight_line')  # straight_line أو declining_balance
     status = db.Column(db.String(50), default='فعال')  # حالة الأصل
     location = db.Column(db.String(100), nullable=True)  # موقع الأصل
     notes = db.Column(db.Text, nullable=True)  # ملاحظات
@@ -172,16 +342,177 @@ class Asset(db.Model):
     def __repr__(self):
         return f'<Asset {self.name}: {self.current_value}>'
     
-    def calculate_depreciation(self):
-        """حساب الاستهلاك السنوي"""
-        if self.depreciation_rate > 0:
-            years_since_purchase = (datetime.utcnow() - self.purchase_date).days / 365.25
-            depreciation_amount = self.purchase_value * (self.depreciation_rate / 100) * years_since_purchase
-            return min(depreciation_amount, self.purchase_value)
-        return 0
+    @classmethod
+    def find_by_name(cls, name):
+        """أول أصل بهذا الاسم (عبر فهرس الاسم) لربط التوالف القديمة أو المدخلة بالاسم"""
+        if not name:
+            return None
+        return db.session.execute(db.select(cls.id).where(cls.name == name).order_by(cls.id).limit(1)).scalar()
+    
+    @classmethod
+    def refresh_status(cls, asset_id, revive=False):
+        """تحديث حالة الأصل بعد تعديل توالفه بجملة UPDATE ذرية
+        
+        current_value يحسبها depreciation.py عند الـ flush (الشراء - الاستهلاك - التوالف)، ثم يصبح
+        الأصل تالفاً إن وصلت قيمته إلى صفر، ومع revive يعود الأصل التالف فعالاً إن بقيت له قيمة.
+        """
+        db.session.flush()
+        statuses = [(cls.current_value <= 0, 'تالف')]
+        if revive:
+            statuses.append((cls.status == 'تالف', 'فعال'))
+        return db.session.execute(
+            db.update(cls).where(cls.id == asset_id)
+            .values(status=db.case(*statuses, else_=cls.status))
+            .execution_options(synchronize_session='fetch')
+        ).rowcount
+    
+    def calculate_depreciation(self, as_of=None):
+        """الاستهلاك المتراكم حتى تاريخ معين (بنفس معادلات depreciation.py)"""
+        from depreciation import depreciation_amounts
+        as_of = as_of or datetime.utcnow()
+        years = max(0, (as_of - (self.purchase_date or as_of)).days / 365.25)
+        return float(depreciation_amounts([self.purchase_value], [self.depreciation_rate or 0],
+                                          [years], [self.depreciation_method == 'declining_balance'])[0])
+    
+    def get_current_value(self, as_of=None):
+        """القيمة بعد الاستهلاك فقط؛ التقييم الكامل مع التوالف في asset_snapshots.asset_valuations"""
+        return max(0, self.purchase_value - self.calculate_depreciation(as_of))
+
+class AssetSnapshot(db.Model):
+    """قيمة كل أصل في نهاية شهر (period بصيغة YYYYMM): الشراء - الاستهلاك - التوالف
+    
+    تُحسب لكل الأصول دفعة واحدة عبر depreciation.py (flask snapshot-assets)، وتُعاد أسطر الأصل
+    داخل نفس المعاملة عند تعديله أو تعديل توالفه.
+    """
+    __table_args__ = (
+        db.Index('ix_asset_snapshot_period', 'period', 'asset_id', unique=True),
+    )
     
-    def get_current_value(self):
-        """حساب القيمة الحالية بعد الاستهلاك"""
-        depreciation = self.calculate_depreciation()
-        return max(0, self.purchase_value - depreciation)
+    id = db.Column(db.Integer, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id', ondelete='CASCADE'), nullable=False, index=True)
+    period = db.Column(db.Integer, nullable=False)
+    purchase_value = db.Column(db.Float, nullable=False)
+    depreciation = db.Column(db.Float, nullable=False, default=0.0)  # الاستهلاك المتراكم
+    spoilage = db.Column(db.Float, nullable=False, default=0.0)  # التوالف المخصومة حتى نهاية الشهر
+    value = db.Column(db.Float, nullable=False)  # القيمة الدفترية
+    
+    def __repr__(self):
+        return f'<AssetSnapshot {self.asset_id} {self.period}: {self.value}>'
 
+class FinancialSummary(db.Model):
+    """الملخص المالي المجمّع لكل شهر (السطر year=0, month=0 هو الإجمالي العام)
+    
+    يُحدَّث تلقائياً عند كل حفظ عبر financial_summary.py ويمكن إعادة بنائه بالكامل.
+    """
+    __table_args__ = (
+        db.Index('ix_financial_summary_period', 'year', 'month', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    collected = db.Column(db.Float, nullable=False, default=0.0)  # المدفوعات المحصلة
+    expected = db.Column(db.Float, nullable=False, default=0.0)  # إجمالي المستحق من المدفوعات
+    paid_count = db.Column(db.Integer, nullable=False, default=0)  # عدد الدفعات المسددة
+    expenses = db.Column(db.Float, nullable=False, default=0.0)
+    assistance = db.Column(db.Float, nullable=False, default=0.0)
+    spoilage = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<FinancialSummary {self.month}/{self.year}: {self.collected}>'
+    
+    @property
+    def balance(self):
+        return self.collected - self.expenses
+
+class MemberArrears(db.Model):
+    """فهرس المتأخرات: سطر لكل مشترك عليه أشهر غير مدفوعة
+    
+    يُحدَّث تلقائياً لكل مشترك تتغير مدفوعاته عبر arrears.py ويمكن إعادة بنائه بالكامل.
+    """
+    __tablename__ = 'member_arrears'
+    __table_args__ = (
+        db.Index('ix_member_arrears_rank', 'amount_owed', 'unpaid_count', 'member_id'),
+    )
+    
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id', ondelete='CASCADE'), primary_key=True)
+    unpaid_count = db.Column(db.Integer, nullable=False, default=0)  # عدد الأشهر غير المدفوعة
+    oldest_period = db.Column(db.Integer, nullable=False)  # أقدم شهر غير مدفوع بصيغة YYYYMM
+    amount_owed = db.Column(db.Float, nullable=False, default=0.0)  # إجمالي المبالغ المستحقة
+    
+    member = db.relationship('Member', lazy='joined', innerjoin=True)
+    
+    def __repr__(self):
+        return f'<MemberArrears {self.member_id}: {self.unpaid_count}>'
+    
+    @property
+    def oldest_month(self):
+        return self.oldest_period % 100
+    
+    @property
+    def oldest_year(self):
+        return self.oldest_period // 100
+    
+    def to_dict(self):
+        return {
+            'member_id': self.member_id,
+            'member_number': self.member.member_number,
+            'name': self.member.name,
+            'village': self.member.village,
+            'unpaid_count': self.unpaid_count,
+            'oldest_period': f'{self.oldest_month}/{self.oldest_year}',
+            'amount_owed': self.amount_owed,
+        }
+
+class DataVersion(db.Model):
+    """رقم إصدار البيانات (سطر واحد) يزداد مع كل معاملة تكتب بيانات
+    
+    يُحدَّث عبر data_version.py، وتستخدمه http_cache.py لإبطال الصفحات العامة في كل العمال.
+    """
+    __tablename__ = 'data_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class TableVersion(db.Model):
+    """رقم إصدار لكل جدول يزداد مع كل معاملة تكتب فيه (لإعادة نشر الصفحات المتأثرة فقط)"""
+    __tablename__ = 'table_version'
+    
+    name = db.Column(db.String(64), primary_key=True)  # اسم الجدول، أو * لجمل SQL خام غير معروفة الجدول
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    """مهمة خلفية (استيراد، تصدير، تقارير) تنفذها عمليات العمال خارج مسار الطلب"""
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # نوع المهمة (مفتاح المعالج)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # نسبة الإنجاز 0-100
+    message = db.Column(db.String(500), nullable=True)
+    params = db.Column(db.Text, nullable=True)  # معاملات المهمة بصيغة JSON
+    result = db.Column(db.Text, nullable=True)  # نتيجة المهمة بصيغة JSON
+    result_path = db.Column(db.String(300), nullable=True)  # ملف النتيجة للتنزيل
+    result_name = db.Column(db.String(200), nullable=True)  # اسم الملف عند التنزيل
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind}: {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': json.loads(self.result) if self.result else None,
+            'has_file': bool(self.result_path),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,86 @@
+import numpy as np
+from collections import namedtuple
+from functools import cached_property
+from models import db, Payment
+
+# خلية واحدة في جدول المدفوعات (نفس الحقول التي تستخدمها القوالب من Payment)
+PaymentCell = namedtuple('PaymentCell', ['amount', 'is_paid'])
+
+class PaymentMatrix:
+    """مصفوفة المدفوعات (الأعضاء × الأشهر) تُبنى مرة واحدة لكل طلب
+    
+    تُخزن المبالغ والحالات في مصفوفات NumPy بدلاً من البحث في member.payments لكل خلية،
+    وتُحسب إجماليات الصفوف والأعمدة دفعة واحدة.
+    """
+    
+    def __init__(self, members, periods):
+        self.members = list(members)
+        self.periods = list(periods)  # [(month, year), ...]
+        self._rows = {member.id: i for i, member in enumerate(self.members)}
+        self._cols = {period: j for j, period in enumerate(self.periods)}
+        
+        shape = (len(self.members), len(self.periods))
+        self.amounts = np.zeros(shape, dtype=np.float64)
+        self.paid = np.zeros(shape, dtype=bool)
+        self.present = np.zeros(shape, dtype=bool)
+    
+    @classmethod
+    def build(cls, members, periods):
+        """بناء المصفوفة باستعلام واحد لمدفوعات الأعضاء في الأشهر المطلوبة"""
+        matrix = cls(members, periods)
+        if not matrix._rows or not matrix._cols:
+            return matrix
+        
+        rows = db.session.query(
+            Payment.member_id, Payment.month, Payment.year, Payment.amount, Payment.is_paid
+        ).filter(
+            Payment.member_id.in_(list(matrix._rows)),
+            Payment.year.in_({year for _, year in matrix.periods})
+        ).all()
+        
+        for member_id, month, year, amount, is_paid in rows:
+            j = matrix._cols.get((month, year))
+            if j is None:
+                continue
+            i = matrix._rows[member_id]
+            matrix.amounts[i, j] = amount or 0
+            matrix.paid[i, j] = bool(is_paid)
+            matrix.present[i, j] = True
+        return matrix
+    
+    def cell(self, member_id, month, year):
+        """الحصول على خلية عضو لشهر معين أو None إن لم تكن هناك دفعة"""
+        i = self._rows.get(member_id)
+        j = self._cols.get((month, year))
+        if i is None or j is None or not self.present[i, j]:
+            return None
+        return PaymentCell(float(self.amounts[i, j]), bool(self.paid[i, j]))
+    
+    @cached_property
+    def paid_amounts(self):
+        """المبالغ المدفوعة فقط (غير المدفوع = 0)"""
+        return np.where(self.paid, self.amounts, 0.0)
+    
+    @cached_property
+    def row_totals(self):
+        """إجمالي المدفوع لكل عضو"""
+        return self.paid_amounts.sum(axis=1)
+    
+    @cached_property
+    def column_totals(self):
+        """إجمالي المدفوع لكل شهر"""
+        return self.paid_amounts.sum(axis=0)
+    
+    def row_total(self, member_id):
+        return float(self.row_totals[self._rows[member_id]])
+    
+    def column_total(self, month, year):
+        return float(self.column_totals[self._cols[(month, year)]])
+    
+    @property
+    def total_paid(self):
+        return float(self.paid_amounts.sum())
+    
+    @property
+    def paid_count(self):
+        return int(self.paid.sum())
@@ -0,0 +1,232 @@
+"""تقارير PDF للمشتركين والمدفوعات عبر reportlab
+
+الصفوف تُقرأ من مؤشر على دفعات وتُبنى جداول صغيرة (REPORT_CHUNK_ROWS صفاً) تُغذّى للمستند عند
+الحاجة، فلا يُحمّل التقرير كاملاً في الذاكرة. الخط العربي يُسجل مرة واحدة لكل عملية، والملفات
+المولدة تُحفظ في PDF_CACHE_DIR باسم يتضمن إصدار الجداول التي يعتمد عليها التقرير، فالتنزيل المتكرر
+لتقرير لم تتغير بياناته يُقدَّم من الملف مباشرة.
+"""
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from flask import current_app
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from fiscal_calendar import current_fiscal_year, get_fiscal_periods
+from data_version import tables_signature
+from reports import member_report_rows, payment_report_rows
+
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+except ImportError:  # اختياري: بدونهما تظهر الحروف العربية منفصلة ومعكوسة
+    arabic_reshaper = None
+
+FONT_NAME = 'Arabic'
+FALLBACK_FONT = 'Helvetica'
+# أماكن الخط العربي إن لم يُحدد PDF_FONT_PATH (DejaVu يأتي مع حزمة fonts-dejavu-core)
+FONT_CANDIDATES = ('static/fonts/Amiri-Regular.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+PdfReport = namedtuple('PdfReport', ['name', 'title', 'tables', 'landscape'])
+
+REPORTS = {
+    'members': PdfReport('members', 'تقرير المشتركين', ('member', 'payment', 'member_arrears'), False),
+    'payments': PdfReport('payments', 'تقرير المدفوعات', ('member', 'payment'), True),
+}
+
+
+@lru_cache(maxsize=8192)
+def rtl(text):
+    """تشكيل النص العربي وترتيبه للعرض من اليمين (reportlab يرسم الحروف بالترتيب المنطقي)"""
+    text = '' if text is None else str(text)
+    if arabic_reshaper is None or not text:
+        return text
+    return get_display(arabic_reshaper.reshape(text))
+
+
+def _amount(value):
+    return f'{value:,.0f}' if value else '-'
+
+
+class _LazyStory(list):
+    """قائمة عناصر المستند تُملأ من مولّد كلما قاربت على النفاد
+
+    حلقة build في reportlab تستدعي len() قبل كل عنصر وتحذف العنصر الأول بعد رسمه، فيبقى في
+    الذاكرة جدول أو اثنان فقط بدل التقرير كاملاً.
+    """
+
+    def __init__(self, flowables, low_water=2):
+        super().__init__()
+        self._source = iter(flowables)
+        self._low_water = low_water
+
+    def __len__(self):
+        while list.__len__(self) < self._low_water:
+            flowable = next(self._source, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return list.__len__(self)
+
+
+class PdfReportBuilder:
+    """توليد تقارير PDF مع ذاكرة ملفات مفتاحها إصدار البيانات
+
+    الوحدة تُستورد عند أول طلب تقرير فقط (reportlab ثقيلة)، والإعداد وتسجيل الخط يجريان مرة
+    واحدة لكل عملية عند أول استخدام.
+    """
+
+    def __init__(self):
+        self.font = None
+        self.lock = threading.Lock()
+
+    def _setup(self):
+        if self.font is not None:
+            return
+        with self.lock:
+            if self.font is None:
+                app = current_app._get_current_object()
+                self.directory = app.config.get('PDF_CACHE_DIR', 'pdf_cache')
+                self.chunk_rows = app.config.get('REPORT_CHUNK_ROWS', 200)
+                self.font = self._register_font(app)
+
+    @staticmethod
+    def _register_font(app):
+        """تسجيل الخط العربي (مرة واحدة لكل عملية)"""
+        if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+            return FONT_NAME
+        font_path = app.config.get('PDF_FONT_PATH')
+        candidates = [font_path] if font_path else FONT_CANDIDATES
+        for path in candidates:
+            if os.path.exists(path):
+                pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+                return FONT_NAME
+        app.logger.warning('لم يُعثر على خط عربي لتقارير PDF (PDF_FONT_PATH)، سيُستخدم %s', FALLBACK_FONT)
+        return FALLBACK_FONT
+
+    # --- ذاكرة الملفات ---
+
+    def _cache_path(self, report, fiscal_year):
+        return os.path.join(self.directory, f'{report.name}-{fiscal_year}-{tables_signature(report.tables)}.pdf')
+
+    def _purge(self, report, fiscal_year, keep):
+        """حذف نسخ التقرير السابقة لنفس السنة (أفضل جهد)"""
+        prefix = f'{report.name}-{fiscal_year}-'
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(prefix) and name.endswith('.pdf') and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def cached(self, name, fiscal_year=None):
+        """مسار ملف التقرير إن كان محفوظاً لبياناته الحالية، وإلا None (بدون توليد)"""
+        self._setup()
+        path = self._cache_path(REPORTS[name], fiscal_year or current_fiscal_year())
+        return path if os.path.exists(path) else None
+
+    def get(self, name, fiscal_year=None):
+        """مسار ملف التقرير: من الذاكرة إن لم تتغير بياناته، وإلا يُولَّد ويُحفظ"""
+        self._setup()
+        report = REPORTS[name]
+        fiscal_year = fiscal_year or current_fiscal_year()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._cache_path(report, fiscal_year)
+        if os.path.exists(path):
+            return path
+        temp = f'{path}.{os.getpid()}.tmp'
+        try:
+            self.build(report, fiscal_year, temp)
+            os.replace(temp, path)  # كتابة ذرية: لا يُقدَّم ملف ناقص لطلب متزامن
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        self._purge(report, fiscal_year, path)
+        return path
+
+    # --- التوليد ---
+
+    def _styles(self):
+        return {
+            'title': ParagraphStyle('title', fontName=self.font, fontSize=16, leading=22, alignment=1),
+            'subtitle': ParagraphStyle('subtitle', fontName=self.font, fontSize=9, leading=12, alignment=1,
+                                       textColor=colors.grey),
+        }
+
+    def _table(self, rows, widths, header):
+        table = Table([header] + rows, colWidths=widths, repeatRows=1)
+        table.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), self.font),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f7fafc')]),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#cbd5e0')),
+        ]))
+        return table
+
+    def _chunks(self, rows, widths, header):
+        """جداول متتالية من REPORT_CHUNK_ROWS صفاً، كل منها يكرر سطر العناوين عند انقسامه"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_rows:
+                yield self._table(chunk, widths, header)
+                chunk = []
+        if chunk:
+            yield self._table(chunk, widths, header)
+
+    def _members_rows(self, periods):
+        rows = member_report_rows(periods, self.chunk_rows)
+        for number, name, village, fee, paid_count, paid_total, owed in rows:
+            yield [_amount(owed), _amount(paid_total), f'{paid_count}/12', _amount(fee), rtl(village or '-'),
+                   rtl(name), number]
+
+    def _payments_rows(self, periods):
+        for number, name, *amounts in payment_report_rows(periods, self.chunk_rows):
+            yield [_amount(sum(amounts))] + [_amount(amount) for amount in reversed(amounts)] + [rtl(name), number]
+
+    def _story(self, report, fiscal_year):
+        styles = self._styles()
+        periods = get_fiscal_periods(fiscal_year)
+        yield Paragraph(rtl(f'{report.title} - السنة المالية {fiscal_year}/{fiscal_year + 1}'), styles['title'])
+        yield Paragraph(rtl(f'تاريخ الإنشاء: {datetime.now().strftime("%Y-%m-%d %H:%M")}'), styles['subtitle'])
+        yield Spacer(1, 0.2 * inch)
+        # الأعمدة من اليسار إلى اليمين، فالرقم والاسم في آخرها ليظهرا يمين الصفحة
+        if report.name == 'members':
+            header = [rtl(label) for label in ('المتأخرات', 'المدفوع', 'الأشهر', 'الرسوم', 'القرية', 'الاسم', 'الرقم')]
+            widths = [0.9 * inch, 0.9 * inch, 0.6 * inch, 0.8 * inch, 1.1 * inch, 2.2 * inch, 0.5 * inch]
+            rows = self._members_rows(periods)
+        else:
+            header = [rtl('الإجمالي')] + [rtl(f'{period.month}/{period.year % 100}') for period in reversed(periods)] \
+                + [rtl('الاسم'), rtl('الرقم')]
+            widths = [0.75 * inch] + [0.55 * inch] * len(periods) + [2.0 * inch, 0.45 * inch]
+            rows = self._payments_rows(periods)
+        yield from self._chunks(rows, widths, header)
+
+    def build(self, report, fiscal_year, target):
+        """كتابة التقرير إلى target (مسار أو ملف) دون تحميل كل صفوفه في الذاكرة"""
+        pagesize = landscape(A4) if report.landscape else A4
+        doc = SimpleDocTemplate(target, pagesize=pagesize, title=report.title,
+                                leftMargin=0.4 * inch, rightMargin=0.4 * inch,
+                                topMargin=0.5 * inch, bottomMargin=0.5 * inch)
+        doc.build(_LazyStory(self._story(report, fiscal_year)), onFirstPage=self._footer,
+                  onLaterPages=self._footer)
+
+    def _footer(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFont(self.font, 8)
+        canvas.drawCentredString(doc.pagesize[0] / 2, 0.3 * inch, str(doc.page))
+        canvas.restoreState()
+
+
+pdf_reports = PdfReportBuilder()
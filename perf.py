@@ -0,0 +1,173 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# توحيد شكل الاستعلام لاكتشاف N+1: المسافات وقوائم IN والأرقام الحرفية
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+PERCENTILES = (50, 95, 99)
+
+def statement_shape(statement):
+    """شكل الاستعلام بعد إزالة ما يتغير بين التكرارات"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _NUMBER.sub('N', shape)
+
+def percentile(sorted_values, pct):
+    """النسبة المئوية بطريقة أقرب رتبة لقائمة مرتبة"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class PerfRecorder:
+    """تسجيل تكلفة كل طلب (الاستعلامات، زمن القاعدة، زمن القوالب، الحجم) في حلقة لكل مسار
+
+    السجلات خاصة بكل عملية؛ مع عدة عمّال gunicorn يعرض كل عامل طلباته فقط.
+    """
+
+    def __init__(self, app=None):
+        self.buffers = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PERF_ENABLED', True)
+        app.config.setdefault('PERF_BUFFER_SIZE', 500)
+        app.config.setdefault('PERF_N_PLUS_ONE_THRESHOLD', 10)
+        app.extensions['perf'] = self
+        self.app = app
+        if not app.config['PERF_ENABLED']:
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        event.listen(Engine, 'before_cursor_execute', self._query_started)
+        event.listen(Engine, 'after_cursor_execute', self._query_finished)
+
+    # --- جمع القياسات أثناء الطلب ---
+
+    def _start(self):
+        if request.endpoint in (None, 'static'):
+            return
+        g.perf = {
+            'started': time.perf_counter(),
+            'queries': 0,
+            'db_time': 0.0,
+            'template_time': 0.0,
+            'template_started': [],
+            'shapes': Counter(),
+        }
+
+    @staticmethod
+    def _current():
+        return g.get('perf') if has_request_context() else None
+
+    def _query_started(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        if stats is not None:
+            conn.info.setdefault('perf_started', []).append(time.perf_counter())
+
+    def _query_finished(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        if stats is None or not conn.info.get('perf_started'):
+            return
+        stats['db_time'] += time.perf_counter() - conn.info['perf_started'].pop()
+        stats['queries'] += 1
+        stats['shapes'][statement_shape(statement)] += 1
+
+    def _template_started(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None:
+            stats['template_started'].append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None and stats['template_started']:
+            started = stats['template_started'].pop()
+            # القوالب المتداخلة (include/extends) تُحسب مرة واحدة ضمن القالب الخارجي
+            if not stats['template_started']:
+                stats['template_time'] += time.perf_counter() - started
+
+    def _finish(self, response):
+        stats = g.pop('perf', None)
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats['started']
+        threshold = self.app.config['PERF_N_PLUS_ONE_THRESHOLD']
+        repeated = [{'statement': shape, 'count': count}
+                    for shape, count in stats['shapes'].most_common() if count > threshold]
+        record = {
+            'time': time.time(),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(stats['db_time'] * 1000, 2),
+            'template_ms': round(stats['template_time'] * 1000, 2),
+            'queries': stats['queries'],
+            # الاستجابات المتدفقة لا يُعرف حجمها قبل الإرسال
+            'size': None if response.is_streamed else response.calculate_content_length(),
+            'n_plus_one': repeated,
+        }
+        if repeated:
+            self.app.logger.warning('اشتباه N+1 في %s: %s مكرر %d مرة',
+                                    request.endpoint, repeated[0]['statement'][:200], repeated[0]['count'])
+        with self.lock:
+            buffer = self.buffers.get(request.endpoint)
+            if buffer is None:
+                buffer = self.buffers[request.endpoint] = deque(maxlen=self.app.config['PERF_BUFFER_SIZE'])
+            buffer.append(record)
+        response.headers['Server-Timing'] = 'db;dur=%.2f, tpl;dur=%.2f, total;dur=%.2f' % (
+            record['db_ms'], record['template_ms'], record['total_ms'])
+        response.headers['X-Query-Count'] = str(record['queries'])
+        return response
+
+    # --- القراءة والتجميع ---
+
+    def reset(self):
+        with self.lock:
+            self.buffers.clear()
+
+    def recent(self, endpoint, limit=20):
+        with self.lock:
+            records = list(self.buffers.get(endpoint, ()))
+        return records[-limit:][::-1]
+
+    def summary(self):
+        """ملخص لكل مسار: العدد ومتوسط الاستعلامات ونسب p50/p95/p99 للزمن"""
+        with self.lock:
+            snapshot = {endpoint: list(buffer) for endpoint, buffer in self.buffers.items()}
+        rows = []
+        for endpoint, records in snapshot.items():
+            totals = sorted(r['total_ms'] for r in records)
+            db_times = sorted(r['db_ms'] for r in records)
+            queries = sorted(r['queries'] for r in records)
+            sizes = [r['size'] for r in records if r['size'] is not None]
+            row = {
+                'endpoint': endpoint,
+                'count': len(records),
+                'queries_avg': round(sum(queries) / len(queries), 1),
+                'queries_max': queries[-1],
+                'template_avg_ms': round(sum(r['template_ms'] for r in records) / len(records), 2),
+                'size_avg': int(sum(sizes) / len(sizes)) if sizes else None,
+                'n_plus_one': sum(1 for r in records if r['n_plus_one']),
+            }
+            for pct in PERCENTILES:
+                row[f'p{pct}_ms'] = percentile(totals, pct)
+                row[f'db_p{pct}_ms'] = percentile(db_times, pct)
+            rows.append(row)
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+        return rows
+
+
+perf = PerfRecorder()
@@ -0,0 +1,171 @@
+"""نشر الصفحات العامة كملفات ثابتة يقدمها gunicorn أو الخادم الأمامي دون قاعدة البيانات
+
+تُكتب الصفحات في PUBLISH_DIR (index.html و members.html ...) مع نسخ .gz و .br (إن توفرت
+مكتبة brotli)، ويحفظ manifest.json إصدار كل جدول عند آخر نشر لكل صفحة، فلا يُعاد توليد
+إلا الصفحات التي تغيرت جداولها. صفحة المشتركين الثابتة هي الصفحة الأولى؛ الطلبات التي تحمل
+معاملات (الترقيم والتصفية) تمر إلى التطبيق كالمعتاد.
+
+مثال nginx:
+    location = /         { try_files /published/index.html @app; }
+    location ~ ^/(members|projects|expenses)$ {
+        if ($args) { proxy_pass http://app; }
+        gzip_static on;
+        try_files /published/$1.html @app;
+    }
+"""
+import fcntl
+import gzip
+import json
+import os
+import threading
+from collections import namedtuple
+from flask import request, send_file, session
+from sqlalchemy import event
+from models import db
+from data_version import RAW_SQL, table_versions
+
+try:
+    import brotli
+except ImportError:  # اختياري: بدون brotli تُنشر نسخ gzip فقط
+    brotli = None
+
+PublishedPage = namedtuple('PublishedPage', ['name', 'path', 'tables'])
+
+# الصفحات المنشورة والجداول التي تعتمد عليها
+PAGES = (
+    PublishedPage('index', '/', ('member', 'project', 'payment', 'expense', 'financial_summary')),
+    PublishedPage('members', '/members', ('member', 'payment')),
+    PublishedPage('projects', '/projects', ('project',)),
+    PublishedPage('expenses', '/expenses', ('expense',)),
+)
+PAGES_BY_PATH = {page.path: page for page in PAGES}
+MANIFEST = 'manifest.json'
+# يميز طلبات التوليد الداخلية حتى لا تُقدَّم لها النسخة المنشورة القديمة
+RENDER_ENVIRON_KEY = 'publish.render'
+
+
+class SitePublisher:
+    """توليد الصفحات الثابتة يدوياً (flask publish) أو تلقائياً بعد كل commit
+
+    النشر التلقائي يجري في خيط خلفي بعد PUBLISH_DELAY ثانية من آخر commit، فتُجمع
+    دفعات الكتابة المتتالية (مثل الاستيراد) في نشر واحد.
+    """
+
+    def __init__(self, app=None):
+        self.pending = threading.Event()
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PUBLISH_DIR', 'published')
+        app.config.setdefault('PUBLISH_ON_COMMIT', False)
+        app.config.setdefault('PUBLISH_SERVE', False)
+        app.config.setdefault('PUBLISH_DELAY', 2.0)
+        app.extensions['publisher'] = self
+        self.app = app
+        self.directory = app.config['PUBLISH_DIR']
+        if app.config['PUBLISH_ON_COMMIT']:
+            event.listen(db.session, 'after_commit', self._schedule)
+        if app.config['PUBLISH_SERVE']:
+            app.before_request(self._serve)
+
+    # --- التوليد ---
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self):
+        try:
+            with open(self._path(MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, name, data):
+        """كتابة ذرية حتى لا يقدم الخادم ملفاً ناقصاً"""
+        path = self._path(name)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def _render(self, page):
+        """تصيير الصفحة عبر التطبيق نفسه كزائر (بدون جلسة مدير)"""
+        response = self.app.test_client().get(page.path, environ_base={RENDER_ENVIRON_KEY: True})
+        if response.status_code != 200:
+            raise RuntimeError(f'فشل تصيير {page.path}: {response.status_code}')
+        return response.get_data()
+
+    def publish(self, force=False):
+        """نشر الصفحات التي تغيرت جداولها منذ آخر نشر (أو كلها مع force)، ويعيد أسماءها"""
+        os.makedirs(self.directory, exist_ok=True)
+        # قفل ملف حتى لا ينشر عاملان في نفس الوقت؛ الثاني يجد manifest محدثاً فلا يعيد شيئاً
+        with open(self._path('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._read_manifest()
+            versions = table_versions()
+            published = []
+            for page in PAGES:
+                dependencies = {table: versions.get(table, 0) for table in page.tables + (RAW_SQL,)}
+                if not force and manifest.get(page.name) == dependencies \
+                        and os.path.exists(self._path(f'{page.name}.html')):
+                    continue
+                body = self._render(page)
+                self._write(f'{page.name}.html', body)
+                self._write(f'{page.name}.html.gz', gzip.compress(body, 9))
+                if brotli is not None:
+                    self._write(f'{page.name}.html.br', brotli.compress(body))
+                manifest[page.name] = dependencies
+                published.append(page.name)
+            if published:
+                self._write(MANIFEST, json.dumps(manifest, indent=2).encode())
+        return published
+
+    # --- النشر التلقائي ---
+
+    def _schedule(self, session):
+        self.pending.set()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='site-publisher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.pending.wait()
+            # انتظار هدوء الكتابة قبل النشر
+            while self.pending.wait(self.app.config['PUBLISH_DELAY']):
+                self.pending.clear()
+            with self.app.app_context():
+                try:
+                    self.publish()
+                except Exception:
+                    self.app.logger.exception('فشل نشر الصفحات الثابتة')
+                finally:
+                    db.session.remove()
+
+    # --- تقديم الصفحات من gunicorn ---
+
+    def _serve(self):
+        """تقديم الصفحة المنشورة للزوار قبل الوصول إلى المسار (بدون أي استعلام)"""
+        page = PAGES_BY_PATH.get(request.path)
+        if page is None or request.method != 'GET' or request.query_string \
+                or request.environ.get(RENDER_ENVIRON_KEY) \
+                or session.get('admin_logged_in') or session.get('_flashes'):
+            return None
+        path = self._path(f'{page.name}.html')
+        encoding = None
+        if 'gzip' in request.headers.get('Accept-Encoding', '') and os.path.exists(path + '.gz'):
+            path, encoding = path + '.gz', 'gzip'
+        if not os.path.exists(path):
+            return None
+        response = send_file(os.path.abspath(path), mimetype='text/html', conditional=True, max_age=0)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.vary.add('Cookie')
+        response.headers['X-Published'] = '1'
+        return response
+
+
+publisher = SitePublisher()
@@ -0,0 +1,94 @@
+from models import db, Assistance, Spoilage, Member, Payment, MemberArrears
+
+def _year_key(period_column):
+    """السنة كنص من عمود period (YYYYMM) بقسمة صحيحة تعمل على أي قاعدة بيانات"""
+    return db.cast(period_column // 100, db.String)
+
+def grouped_report(model, values, dimensions):
+    """إحصائيات تقرير كاملة باستعلام واحد (UNION ALL لعدة GROUP BY)
+
+    values: {اسم: عمود رقمي يُجمع}، dimensions: {اسم: عمود التجميع}.
+    يعيد {'total_count', 'total_<اسم>', <البعد>: {المفتاح: {'count', <اسم>...}}}
+    """
+    metrics = [db.func.count().label('count')] + [
+        db.func.coalesce(db.func.sum(column), 0).label(name) for name, column in values.items()
+    ]
+    parts = [db.select(db.literal('total').label('dimension'),
+                       db.cast(db.null(), db.String).label('key'), *metrics).select_from(model)]
+    for name, key in dimensions.items():
+        parts.append(db.select(db.literal(name), db.cast(key, db.String), *metrics)
+                     .select_from(model).group_by(key))
+
+    stats = {name: {} for name in dimensions}
+    stats['total_count'] = 0
+    for name in values:
+        stats[f'total_{name}'] = 0
+    for row in db.session.execute(db.union_all(*parts)).mappings():
+        if row['dimension'] == 'total':
+            stats['total_count'] = row['count']
+            for name in values:
+                stats[f'total_{name}'] = row[name]
+        else:
+            stats[row['dimension']][row['key']] = {'count': row['count'], **{name: row[name] for name in values}}
+    return stats
+
+UNSPECIFIED = 'غير محدد'
+
+def _sorted_by(groups, field):
+    return {key if key is not None else UNSPECIFIED: data
+            for key, data in sorted(groups.items(), key=lambda item: item[1][field], reverse=True)}
+
+def _by_year(groups):
+    """مفاتيح السنوات كأعداد مرتبة تصاعدياً، مع استبعاد السجلات بلا تاريخ"""
+    return {int(year): data for year, data in sorted(groups.items(), key=lambda item: int(item[0] or 0))
+            if year is not None}
+
+def assistance_stats():
+    stats = grouped_report(Assistance, {'amount': Assistance.amount}, {
+        'by_type': Assistance.assistance_type,
+        'by_source': Assistance.source,
+        'by_year': _year_key(Assistance.period),
+    })
+    stats['by_type'] = _sorted_by(stats['by_type'], 'amount')
+    stats['by_source'] = _sorted_by(stats['by_source'], 'amount')
+    stats['by_year'] = _by_year(stats['by_year'])
+    return stats
+
+def spoilage_stats():
+    stats = grouped_report(Spoilage, {'value': Spoilage.spoilage_value, 'original': Spoilage.original_value}, {
+        'by_category': Spoilage.category,
+        'by_reason': Spoilage.spoilage_reason,
+        'by_year': _year_key(Spoilage.period),
+    })
+    stats['total_spoilage'] = stats.pop('total_value')
+    stats['by_category'] = _sorted_by(stats['by_category'], 'value')
+    stats['by_reason'] = _sorted_by(stats['by_reason'], 'value')
+    stats['by_year'] = _by_year(stats['by_year'])
+    # حساب نسبة التلف
+    stats['spoilage_percentage'] = (stats['total_spoilage'] / stats['total_original'] * 100) if stats['total_original'] > 0 else 0
+    return stats
+
+def member_report_rows(periods, fetch_size):
+    """صف لكل مشترك لتقارير PDF و Word: (الرقم، الاسم، القرية، الرسوم، عدد الأشهر المدفوعة،
+    المدفوع في أشهر periods، المتأخرات) باستعلام واحد يُقرأ على دفعات"""
+    paid = db.and_(Payment.period.in_([period.year * 100 + period.month for period in periods]),
+                   Payment.is_paid == True)
+    return db.session.query(
+        Member.member_number, Member.name, Member.village, Member.membership_fee,
+        db.func.count(db.case((paid, Payment.id))),
+        db.func.coalesce(db.func.sum(db.case((paid, Payment.amount), else_=0)), 0),
+        db.func.coalesce(db.func.max(MemberArrears.amount_owed), 0),
+    ).outerjoin(Payment, Payment.member_id == Member.id) \
+        .outerjoin(MemberArrears, MemberArrears.member_id == Member.id) \
+        .group_by(Member.id).order_by(Member.member_number) \
+        .execution_options(yield_per=fetch_size)
+
+def payment_report_rows(periods, fetch_size):
+    """صف لكل مشترك: (الرقم، الاسم، المبلغ المدفوع في كل شهر من periods...) محوّلاً إلى أعمدة في SQL"""
+    monthly = [db.func.coalesce(db.func.sum(db.case(
+        (db.and_(Payment.month == period.month, Payment.year == period.year, Payment.is_paid == True),
+         Payment.amount), else_=0)), 0) for period in periods]
+    return db.session.query(Member.member_number, Member.name, *monthly) \
+        .outerjoin(Payment, Payment.member_id == Member.id) \
+        .group_by(Member.id).order_by(Member.member_number) \
+        .execution_options(yield_per=fetch_size)
@@ -0,0 +1,333 @@
+import math
+import re
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from models import db, Expense, Assistance, Spoilage, Project
+
+# ===== تطبيع النص العربي =====
+# نفس الجداول تُستخدم في بايثون (SQLite) وفي دالة ar_normalize على PostgreSQL
+# حتى يتطابق تطبيع النص المفهرس مع تطبيع نص البحث
+_FROM = 'أإآٱةىؤئ' + '٠١٢٣٤٥٦٧٨٩'
+_TO = 'اااا' + 'هيوي' + '0123456789'
+_DROP = 'ـ' + ''.join(chr(code) for code in range(0x064B, 0x0653)) + 'ٰ'  # التطويل والتشكيل
+_TRANSLATION = str.maketrans(_FROM, _TO, _DROP)
+_ARTICLE = re.compile(r'(^|\s)ال(?=\S\S)')  # "ال" التعريف في أول الكلمة
+_SPACES = re.compile(r'\s+')
+_TERM = re.compile(r'\w+')
+
+def normalize_arabic(value):
+    """توحيد الألف والهمزات والتاء المربوطة والياء، وحذف التطويل والتشكيل و"ال" التعريف"""
+    if not value:
+        return ''
+    value = _SPACES.sub(' ', str(value).lower().translate(_TRANSLATION)).strip()
+    return _ARTICLE.sub(r'\1', value)
+
+# ===== مصادر الفهرس =====
+# rowid في الفهرس = id * KIND_SLOTS + code، فيُحذف ويُحدَّث السطر بالمفتاح مباشرة
+KIND_SLOTS = 8
+
+SearchSource = namedtuple('SearchSource', ['kind', 'code', 'model', 'title', 'body', 'label'])
+
+SOURCES = (
+    SearchSource('expense', 1, Expense, 'description', (), 'مصروف'),
+    SearchSource('assistance', 2, Assistance, 'title', ('description', 'notes'), 'مساعدة'),
+    SearchSource('spoilage', 3, Spoilage, 'item_name', ('description',), 'تالف'),
+    SearchSource('project', 4, Project, 'title', ('description',), 'مشروع'),
+)
+SOURCES_BY_KIND = {source.kind: source for source in SOURCES}
+SOURCES_BY_CODE = {source.code: source for source in SOURCES}
+SOURCES_BY_MODEL = {source.model: source for source in SOURCES}
+
+def _text_sql(prefix, columns):
+    """تعبير SQL يجمع أعمدة نصية (مع تجاهل NULL) ثم يطبّعها"""
+    if not columns:
+        return "''"
+    joined = " || ' ' || ".join(f"coalesce({prefix}{column}, '')" for column in columns)
+    return f'ar_normalize({joined})'
+
+def _source_values(source, prefix):
+    table = source.model.__tablename__
+    return (f'{prefix}id * {KIND_SLOTS} + {source.code}',
+            _text_sql(prefix, (source.title,)),
+            _text_sql(prefix, source.body),
+            table)
+
+# ===== SQLite: جدول FTS5 يُحدَّث من بايثون =====
+# لا مشغلات على SQLite: دالة ar_normalize لا توجد إلا على اتصالات التطبيق، فكانت مشغلاتها تُفشل
+# كتابة أي برنامج آخر في القاعدة. النص يُطبَّع في بايثون داخل ربط after_flush، وما يُكتب من خارج
+# التطبيق لا يظهر في البحث حتى flask rebuild-search
+
+_INSERT_SQLITE = db.text('INSERT INTO search_index(rowid, title, body) VALUES (:key, :title, :body)')
+_DELETE_SQLITE = db.text('DELETE FROM search_index WHERE rowid = :key')
+
+def _sqlite_ddl():
+    statements = ["CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(title, body, tokenize='unicode61')"]
+    for source in SOURCES:
+        table = source.model.__tablename__
+        statements += [f'DROP TRIGGER IF EXISTS search_{table}_{event_name}' for event_name in ('ai', 'au', 'ad')]
+    return statements
+
+def _index_values(source, record):
+    """مفتاح السطر في الفهرس ونصاه المطبّعان (من كائن أو سطر استعلام)"""
+    body = ' '.join(getattr(record, column) or '' for column in source.body)
+    return {'key': record.id * KIND_SLOTS + source.code,
+            'title': normalize_arabic(getattr(record, source.title)),
+            'body': normalize_arabic(body)}
+
+def _index_rows(connection, source, *conditions):
+    table = source.model.__table__
+    columns = [table.c.id] + [table.c[column] for column in (source.title,) + source.body]
+    rows = connection.execute(db.select(*columns).where(*conditions)).all()
+    if rows:
+        connection.execute(_INSERT_SQLITE, [_index_values(source, row) for row in rows])
+
+def _sqlite_index_ready(connection):
+    """هل جدول الفهرس موجود؟ مع حذف مشغلات الإصدار السابق إن بقيت في قاعدة قديمة"""
+    global _ready
+    if _ready:
+        return True
+    names = set(connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE name = 'search_index' "
+        "OR (type = 'trigger' AND name LIKE 'search%')").scalars())
+    for name in sorted(names - {'search_index'}):
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+    # بعد حذف المشغلات لا تُحفظ النتيجة، فيُعاد الفحص في الاستدعاء التالي
+    _ready = names == {'search_index'}
+    return 'search_index' in names
+
+def index_inserted(connection, model, count):
+    """فهرسة آخر count سطراً من الإدخال المجمع (لا يمر بأحداث الجلسة)
+
+    أرقامها متتالية في آخر الجدول لأن القاعدة مقفلة للكتابة حتى نهاية المعاملة. على PostgreSQL
+    تتولى المشغلات ذلك.
+    """
+    if not count or connection.dialect.name != 'sqlite' or not _sqlite_index_ready(connection):
+        return
+    table = model.__table__
+    last_id = connection.execute(db.select(db.func.max(table.c.id))).scalar()
+    _index_rows(connection, SOURCES_BY_MODEL[model], table.c.id > last_id - count)
+
+def _text_changed(obj, source):
+    state = inspect(obj)
+    return any(state.attrs[column].history.has_changes() for column in (source.title,) + source.body)
+
+def _changed_sources(session):
+    return [obj for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+            if type(obj) in SOURCES_BY_MODEL]
+
+@event.listens_for(db.session, 'before_flush')
+def _drop_old_triggers(session, flush_context, instances):
+    """مشغلات الإصدار السابق تُحذف قبل الكتابة، وإلا فشل الإدخال نفسه لغياب ar_normalize"""
+    if not _ready and _changed_sources(session):
+        connection = session.connection()
+        if connection.dialect.name == 'sqlite':
+            _sqlite_index_ready(connection)
+
+@event.listens_for(db.session, 'after_flush')
+def _sync_search_index(session, flush_context):
+    """SQLite: تحديث الفهرس للسجلات المضافة والمعدلة والمحذوفة"""
+    changed = _changed_sources(session)
+    if not changed:
+        return
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite' or not _sqlite_index_ready(connection):
+        return
+    removed, added = [], []
+    for obj in changed:
+        source = SOURCES_BY_MODEL[type(obj)]
+        if obj in session.new:
+            added.append(_index_values(source, obj))
+        elif obj in session.deleted:
+            removed.append({'key': obj.id * KIND_SLOTS + source.code})
+        elif _text_changed(obj, source):
+            values = _index_values(source, obj)
+            removed.append({'key': values['key']})
+            added.append(values)
+    if removed:
+        connection.execute(_DELETE_SQLITE, removed)
+    if added:
+        connection.execute(_INSERT_SQLITE, added)
+
+# ===== PostgreSQL: جدول tsvector مع فهرس GIN ومشغلات =====
+
+def _postgresql_ddl():
+    statements = [
+        f"""CREATE OR REPLACE FUNCTION ar_normalize(value text) RETURNS text AS $$
+            SELECT regexp_replace(
+                btrim(regexp_replace(translate(lower(coalesce(value, '')), '{_FROM}{_DROP}', '{_TO}'), '\\s+', ' ', 'g')),
+                '(^|\\s)ال(?=\\S\\S)', '\\1', 'g')
+        $$ LANGUAGE sql IMMUTABLE""",
+        """CREATE TABLE IF NOT EXISTS search_document (
+            id bigint PRIMARY KEY,
+            title text NOT NULL DEFAULT '',
+            body text NOT NULL DEFAULT '',
+            document tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+            ) STORED
+        )""",
+        'CREATE INDEX IF NOT EXISTS ix_search_document ON search_document USING gin (document)',
+    ]
+    for source in SOURCES:
+        new_key, new_title, new_body, table = _source_values(source, 'NEW.')
+        statements += [
+            f"""CREATE OR REPLACE FUNCTION search_{table}_sync() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM search_document WHERE id = OLD.id * {KIND_SLOTS} + {source.code};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO search_document (id, title, body) VALUES ({new_key}, {new_title}, {new_body});
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql""",
+            f'DROP TRIGGER IF EXISTS search_{table}_sync ON {table}',
+            f'CREATE TRIGGER search_{table}_sync AFTER INSERT OR UPDATE OR DELETE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION search_{table}_sync()',
+        ]
+    return statements
+
+_INDEX_TABLE = {'sqlite': 'search_index', 'postgresql': 'search_document'}
+_DDL = {'sqlite': _sqlite_ddl, 'postgresql': _postgresql_ddl}
+_ready = False
+
+def _dialect():
+    name = db.engine.dialect.name
+    if name not in _DDL:
+        raise RuntimeError(f'البحث النصي غير مدعوم على قاعدة البيانات {name}')
+    return name
+
+def install_search_index():
+    """إنشاء فهرس البحث ومشغلاته (آمن للتكرار) ثم تعبئته من الجداول الحالية"""
+    global _ready
+    with db.engine.begin() as connection:
+        for statement in _DDL[_dialect()]():
+            connection.exec_driver_sql(statement)
+    rebuild_search_index()
+    _ready = True
+
+def rebuild_search_index():
+    """إعادة تعبئة فهرس البحث بالكامل من الجداول الأصلية"""
+    table = _INDEX_TABLE[_dialect()]
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f'DELETE FROM {table}')
+        for source in SOURCES:
+            if table == 'search_index':
+                _index_rows(connection, source)
+            else:
+                key, title, body, source_table = _source_values(source, '')
+                connection.exec_driver_sql(f'INSERT INTO {table} (id, title, body) '
+                                           f'SELECT {key}, {title}, {body} FROM {source_table}')
+
+def ensure_search_index():
+    """تثبيت الفهرس عند أول بحث إن لم يكن مثبتاً (مرة واحدة لكل عملية)"""
+    global _ready
+    if _ready:
+        return
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        with db.engine.begin() as connection:
+            exists = _sqlite_index_ready(connection)
+    else:
+        exists = db.session.execute(db.text("SELECT to_regclass('search_document')")).scalar()
+    if exists:
+        _ready = True
+    else:
+        install_search_index()
+
+# ===== تنفيذ البحث =====
+
+def _terms(query):
+    return _TERM.findall(normalize_arabic(query))
+
+def _match_clause(terms, kinds):
+    """شرط المطابقة وتعبير الترتيب والمعاملات حسب نوع القاعدة"""
+    params = {}
+    if _dialect() == 'sqlite':
+        params['match'] = ' '.join(f'"{term}"*' for term in terms)
+        key, rank = 'rowid', 'bm25(search_index, 2.0, 1.0)'
+        source = 'search_index WHERE search_index MATCH :match'
+    else:
+        params['match'] = ' & '.join(f'{term}:*' for term in terms)
+        key, rank = 'id', 'ts_rank(document, to_tsquery(\'simple\', :match)) * -1'
+        source = "search_document WHERE document @@ to_tsquery('simple', :match)"
+    if kinds:
+        codes = [SOURCES_BY_KIND[kind].code for kind in kinds]
+        source += f" AND {key} % {KIND_SLOTS} IN ({', '.join(str(code) for code in codes)})"
+    return key, rank, source, params
+
+def matching_ids(query, kind):
+    """استعلام فرعي بمعرّفات سجلات نوع واحد المطابقة للبحث (للاستخدام مع in_)"""
+    ensure_search_index()
+    terms = _terms(query)
+    if not terms:
+        return db.select(db.literal(0)).where(db.false())
+    key, _, source, params = _match_clause(terms, [kind])
+    matches = db.text(f'SELECT {key} / {KIND_SLOTS} AS id FROM {source}').bindparams(**params) \
+        .columns(id=db.Integer).subquery()
+    return db.select(matches.c.id)
+
+SearchHit = namedtuple('SearchHit', ['kind', 'label', 'id', 'title', 'summary', 'record'])
+
+class SearchPage:
+    """صفحة نتائج بحث بنفس واجهة Query.paginate (items, page, pages, has_prev ...)"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return math.ceil(self.total / self.per_page) if self.total else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+def search(query, kinds=None, page=1, per_page=20):
+    """بحث مرتب بالصلة في كل المصادر (أو أنواع محددة) مع ترقيم الصفحات"""
+    ensure_search_index()
+    terms = _terms(query)
+    page = max(1, page)
+    if not terms:
+        return SearchPage([], page, per_page, 0)
+    key, rank, source, params = _match_clause(terms, kinds)
+    total = db.session.execute(db.text(f'SELECT count(*) FROM {source}'), params).scalar()
+    rows = db.session.execute(db.text(
+        f'SELECT {key} FROM {source} ORDER BY {rank}, {key} LIMIT :limit OFFSET :offset'),
+        dict(params, limit=per_page, offset=(page - 1) * per_page)).scalars().all()
+
+    # تحميل السجلات الأصلية باستعلام واحد لكل نوع
+    wanted = {}
+    for row_key in rows:
+        wanted.setdefault(row_key % KIND_SLOTS, []).append(row_key // KIND_SLOTS)
+    records = {}
+    for code, ids in wanted.items():
+        model = SOURCES_BY_CODE[code].model
+        for record in model.query.filter(model.id.in_(ids)):
+            records[(code, record.id)] = record
+
+    hits = []
+    for row_key in rows:
+        source_def = SOURCES_BY_CODE[row_key % KIND_SLOTS]
+        record = records.get((source_def.code, row_key // KIND_SLOTS))
+        if record is None:
+            continue
+        summary = ' '.join(str(getattr(record, column)) for column in source_def.body if getattr(record, column))
+        hits.append(SearchHit(source_def.kind, source_def.label, record.id,
+                              getattr(record, source_def.title), summary[:200], record))
+    return SearchPage(hits, page, per_page, total)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """التطبيق على قاعدة SQLite ومجلدات ملفات مؤقتة (تُقرأ عند استيراد config)"""
+    directory = tmp_path_factory.mktemp('app')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(directory / 'test.db')
+    os.environ['PDF_CACHE_DIR'] = str(directory / 'pdf_cache')
+    os.environ['JOB_RESULTS_FOLDER'] = str(directory / 'job_results')
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """جداول فارغة لكل اختبار داخل سياق التطبيق"""
+    from models import db
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
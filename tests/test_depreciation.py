@@ -0,0 +1,49 @@
+"""معادلات الاستهلاك وأسطر تقييم الأصول المحدَّثة عند الحفظ"""
+from datetime import datetime
+
+import pytest
+
+from asset_snapshots import current_period, valuation_totals
+from depreciation import depreciation_amounts, period_end, rebuild_asset_snapshots
+from models import Asset, AssetSnapshot, Spoilage
+
+
+def test_depreciation_amounts():
+    amounts = depreciation_amounts([1000, 1000, 1000, 1000], [10, 10, 50, 150], [2, 2, 3, 1],
+                                   [False, True, False, False])
+    assert amounts.tolist() == pytest.approx([200, 190, 1000, 1000])
+    # السنوات السالبة (شراء بعد التاريخ) لا تستهلك شيئاً
+    assert depreciation_amounts([1000], [10], [-1], [False]).tolist() == [0]
+
+
+def test_period_end():
+    assert period_end(202503) == datetime(2025, 4, 1)
+    assert period_end(202512) == datetime(2026, 1, 1)
+
+
+def test_snapshots_follow_spoilage(db):
+    asset = Asset(name='مضخة', purchase_value=10000, current_value=0, depreciation_rate=10,
+                  purchase_date=datetime(2020, 1, 1))
+    db.session.add(asset)
+    db.session.commit()
+    depreciated = asset.get_current_value(period_end(current_period()))
+    assert asset.current_value == pytest.approx(depreciated)
+    assert rebuild_asset_snapshots(3) == 3
+
+    spoilage = Spoilage(item_name='مضخة', asset_id=asset.id, original_value=10000, spoilage_value=1500)
+    db.session.add(spoilage)
+    db.session.commit()
+    totals = valuation_totals()
+    assert (totals.count, totals.spoilage) == (1, 1500)
+    assert totals.value == pytest.approx(depreciated - 1500)
+    assert db.session.get(Asset, asset.id).current_value == pytest.approx(totals.value)
+
+    spoilage.spoilage_value = depreciated
+    db.session.commit()
+    Asset.refresh_status(asset.id)
+    db.session.commit()
+    assert (asset.current_value, asset.status) == (0, 'تالف')
+
+    db.session.delete(asset)
+    db.session.commit()
+    assert AssetSnapshot.query.count() == 0
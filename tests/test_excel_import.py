@@ -0,0 +1,32 @@
+"""استيراد ورقة الأعضاء والمدفوعات من Excel"""
+import pandas as pd
+
+from fiscal_calendar import get_fiscal_periods
+from models import Member, Payment
+
+
+def test_import_from_excel(app, db, tmp_path, monkeypatch):
+    from excel_utils import ExcelManager
+    monkeypatch.setitem(app.config, 'MONTHLY_PAYMENT_AMOUNT', 1200)
+    periods = get_fiscal_periods(2025)
+    first, second = periods[0], periods[1]
+    # عضو موجود في الورقة وآخر خارجها: مدفوعات الثاني لا تتغير
+    members = [Member(member_number=1, name='قديم'), Member(member_number=9, name='خارج الورقة')]
+    db.session.add_all(members)
+    db.session.flush()
+    db.session.add_all([Payment(member_id=members[0].id, month=first.month, year=first.year, amount=1000, is_paid=False),
+                        Payment(member_id=members[1].id, month=first.month, year=first.year, amount=1000, is_paid=False)])
+    db.session.commit()
+
+    path = tmp_path / 'members.xlsx'
+    pd.DataFrame({'الرقم': [1, 2], 'الاســـــــــــم': ['قديم', 'جديد'], 'رسوم العضوية': [5000, 6000],
+                  first.label: [1000, 0], second.label: [None, 0]}).to_excel(path, index=False)
+    result = ExcelManager.import_from_excel(str(path), chunk_size=1, fiscal_year=2025)
+
+    assert result['success'], result['message']
+    assert (result['imported'], result['updated']) == (1, 1)
+    assert (result['payments_inserted'], result['payments_updated']) == (2, 1)
+    assert Payment.find(members[0].id, first.month, first.year).is_paid
+    assert not Payment.find(members[1].id, first.month, first.year).is_paid
+    new_member = Member.query.filter_by(member_number=2).one()
+    assert [payment.amount for payment in Payment.query.filter_by(member_id=new_member.id)] == [1200, 1200]
@@ -0,0 +1,33 @@
+"""التحقق من صفوف المصروفات قبل الإدخال المجمع"""
+from expense_import import DEFAULT_CATEGORY, frame_from_json, import_expenses, validate_expenses
+from models import Expense, FinancialSummary
+
+
+def test_validate_expenses():
+    df = frame_from_json([
+        {'description': 'وقود', 'amount': '250', 'date': '2025-03-04'},
+        {'description': ' ', 'amount': '100'},
+        {'description': 'صيانة', 'amount': 'abc'},
+        {'description': 'قطع', 'amount': '-5', 'date': '04/2025'},
+        {'description': 'نقل', 'amount': 75, 'category': 'نقل'},
+    ])
+    valid, errors = validate_expenses(df, first_row=2)
+    assert valid['row'].tolist() == [2, 6]
+    assert valid['category'].tolist() == [DEFAULT_CATEGORY, 'نقل']
+    assert valid['period'].iloc[0] == 202503
+    assert {error['row']: error['errors'] for error in errors} == {
+        3: ['الوصف مطلوب'],
+        4: ['المبلغ غير صالح'],
+        5: ['المبلغ يجب أن يكون أكبر من صفر', 'التاريخ غير صالح (YYYY-MM-DD)'],
+    }
+
+
+def test_import_updates_summary(db):
+    df = frame_from_json([{'description': 'وقود', 'amount': 100, 'date': '2025-01-02'},
+                          {'description': 'زيت', 'amount': 50, 'date': '2025-02-02'},
+                          {'description': '', 'amount': 10}])
+    result = import_expenses(df, chunk_size=1)
+    assert (result['inserted'], result['failed']) == (2, 1)
+    assert Expense.query.count() == 2
+    expenses = {(row.year, row.month): row.expenses for row in FinancialSummary.query}
+    assert expenses[(0, 0)] == 150 and expenses[(2025, 2)] == 50
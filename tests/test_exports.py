@@ -0,0 +1,53 @@
+"""مسارات التنزيل المباشر للتقارير"""
+import io
+
+import pytest
+
+from models import Member, Payment
+
+
+@pytest.fixture
+def admin(app, db):
+    for number in (1, 2, 3):
+        member = Member(member_number=number, name=f'عضو {number}', village='قرية')
+        db.session.add(member)
+        db.session.flush()
+        db.session.add(Payment(member_id=member.id, month=1, year=2025, amount=1000, is_paid=number != 2))
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+def test_members_excel_is_streamed(admin):
+    from openpyxl import load_workbook
+    response = admin.get('/export/members?fiscal_year=2024')
+    assert response.status_code == 200 and response.is_streamed
+    assert response.mimetype == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    rows = list(load_workbook(io.BytesIO(response.get_data())).active.values)
+    assert [row[:2] for row in rows[1:4]] == [(1, 'عضو 1'), (2, 'عضو 2'), (3, 'عضو 3')]
+    assert rows[-1][1] == 'الجمالــــــــــــــــــــــــــي'
+
+
+@pytest.mark.parametrize('url', ['/export/members_pdf', '/export/payments_report'])
+def test_pdf_served_from_cache(app, admin, url):
+    from jobs import work
+    # أول طلب يبني التقرير في مهمة خلفية
+    response = admin.get(url)
+    assert response.status_code == 302 and '/admin/jobs/' in response.headers['Location']
+    work(app, once=True)
+    # التكرار بلا تغيير في البيانات يُرسل ملف الذاكرة مباشرة
+    response = admin.get(url)
+    assert response.status_code == 200 and response.mimetype == 'application/pdf'
+    assert response.get_data().startswith(b'%PDF')
+
+
+def test_word_served_from_memory(admin):
+    from docx import Document
+    response = admin.get('/export/members_word?fiscal_year=2024')
+    assert response.status_code == 200 and response.headers['ETag']
+    document = Document(io.BytesIO(response.get_data()))
+    assert len(document.tables[0].rows) == 4
+    # التكرار بلا تغيير في البيانات يعيد نفس المستند من الذاكرة
+    assert admin.get('/export/members_word?fiscal_year=2024').get_data() == response.get_data()
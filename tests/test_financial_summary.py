@@ -0,0 +1,97 @@
+"""الملخص المالي والمتأخرات المحدَّثة عند الحفظ تطابق إعادة البناء الكاملة من الجداول الأصلية"""
+from datetime import datetime
+
+import pytest
+
+from arrears import rebuild_arrears
+from financial_summary import SUMMARY_FIELDS, TOTAL_KEY, get_financial_totals, rebuild_financial_summary
+from models import Expense, FinancialSummary, Member, MemberArrears, Payment, Spoilage
+
+
+def summary(db):
+    return {(row.year, row.month): tuple(getattr(row, field) for field in SUMMARY_FIELDS)
+            for row in FinancialSummary.query if any(getattr(row, field) for field in SUMMARY_FIELDS)}
+
+
+def arrears(db):
+    return {row.member_id: (row.unpaid_count, row.oldest_period, row.amount_owed) for row in MemberArrears.query}
+
+
+def assert_matches_rebuild(db):
+    """القيم المحدَّثة تدريجياً قبل إعادة البناء مساوية لما بعدها"""
+    db.session.expire_all()
+    incremental = summary(db), arrears(db)
+    rebuild_financial_summary()
+    rebuild_arrears()
+    db.session.expire_all()
+    assert incremental == (summary(db), arrears(db))
+
+
+@pytest.fixture
+def members(db):
+    members = [Member(member_number=number, name=f'عضو {number}') for number in (1, 2)]
+    db.session.add_all(members)
+    db.session.flush()
+    for member in members:
+        for month in (1, 2, 3):
+            db.session.add(Payment(member_id=member.id, month=month, year=2025, amount=1000,
+                                   is_paid=month == 1, payment_date=datetime(2025, month, 5)))
+    db.session.add(Expense(description='وقود', amount=300, date=datetime(2025, 2, 10)))
+    db.session.add(Spoilage(item_name='لوح', original_value=500, spoilage_value=200,
+                            spoilage_date=datetime(2025, 3, 1)))
+    db.session.commit()
+    return members
+
+
+def test_insert(db, members):
+    db.session.expire_all()
+    total = FinancialSummary.query.filter_by(year=TOTAL_KEY[0], month=TOTAL_KEY[1]).one()
+    assert (total.collected, total.expected, total.paid_count) == (2000, 6000, 2)
+    assert (total.expenses, total.spoilage) == (300, 200)
+    assert arrears(db) == {member.id: (2, 202502, 2000) for member in members}
+    assert_matches_rebuild(db)
+
+
+def test_update(db, members):
+    payment = Payment.find(members[0].id, 2, 2025)
+    payment.is_paid = True
+    payment.amount = 1500
+    db.session.commit()
+    assert arrears(db)[members[0].id] == (1, 202503, 1000)
+
+    # نقل دفعة غير مدفوعة إلى شهر ومشترك آخرين
+    moved = Payment.find(members[1].id, 3, 2025)
+    moved.member_id, moved.month = members[0].id, 4
+    expense = Expense.query.one()
+    expense.amount, expense.date = 450, datetime(2025, 5, 1)
+    db.session.commit()
+    assert arrears(db) == {members[0].id: (2, 202503, 2000), members[1].id: (1, 202502, 1000)}
+    assert_matches_rebuild(db)
+
+
+def test_delete(db, members):
+    db.session.delete(Payment.find(members[0].id, 2, 2025))
+    db.session.delete(Expense.query.one())
+    db.session.commit()
+    assert arrears(db)[members[0].id] == (1, 202503, 1000)
+    assert_matches_rebuild(db)
+
+    db.session.delete(db.session.get(Member, members[1].id))
+    db.session.commit()
+    assert members[1].id not in arrears(db)
+    assert_matches_rebuild(db)
+
+
+def test_cold_table_is_not_rebuilt_on_read(app, db, members):
+    FinancialSummary.query.delete()
+    db.session.commit()
+    assert get_financial_totals().collected == 0
+    assert app.test_client().get('/').status_code == 200
+    assert FinancialSummary.query.count() == 0
+
+
+def test_excel_summary_uses_monthly_amount(app, db, members, monkeypatch):
+    from excel_utils import ExcelManager
+    monkeypatch.setitem(app.config, 'MONTHLY_PAYMENT_AMOUNT', 1500)
+    summary = ExcelManager.get_financial_summary(2025)
+    assert summary['total_expected'] == 2 * 12 * 1500 + 2 * 5000
@@ -0,0 +1,74 @@
+"""تطبيق تغييرات جدول المدفوعات مع التزامن التفاؤلي"""
+import pytest
+
+from financial_summary import TOTAL_KEY
+from grid_changes import ChangeSet
+from models import FinancialSummary, Member, MemberArrears, Payment
+
+
+@pytest.fixture
+def member(db):
+    member = Member(member_number=1, name='عضو', village='قرية', membership_fee=5000)
+    db.session.add(member)
+    db.session.flush()
+    db.session.add(Payment(member_id=member.id, month=1, year=2025, amount=1000, is_paid=True))
+    db.session.commit()
+    return member
+
+
+def apply(db, changes):
+    change_set = ChangeSet(changes)
+    results = change_set.apply()
+    db.session.commit()
+    return [result['status'] for result in results]
+
+
+def payment(member, month, is_paid, **extra):
+    return {'type': 'payment', 'member_id': member.id, 'year': 2025, 'month': month, 'is_paid': is_paid, **extra}
+
+
+def test_payment_conflict(db, member):
+    # العميل رأى الشهر غير مدفوع لكنه أصبح مدفوعاً في القاعدة
+    assert apply(db, [payment(member, 1, False, was_paid=False)]) == ['conflict']
+    assert Payment.find(member.id, 1, 2025).is_paid
+    assert apply(db, [payment(member, 1, False, was_paid=True)]) == ['updated']
+    assert not Payment.find(member.id, 1, 2025).is_paid
+
+
+def test_payment_insert_and_duplicates(app, db, member):
+    statuses = apply(db, [payment(member, 2, True, was_paid=False), payment(member, 2, False),
+                          payment(member, 2, True), payment(member, 13, True)])
+    assert statuses == ['superseded', 'superseded', 'inserted', 'invalid']
+    inserted = Payment.find(member.id, 2, 2025)
+    assert inserted.is_paid and inserted.amount == app.config['MONTHLY_PAYMENT_AMOUNT']
+    assert apply(db, [payment(member, 2, True, was_paid=False)]) == ['unchanged']
+
+
+def test_changes_update_summary_and_arrears(app, db, member):
+    # إدخال مجمع لدفعة جديدة وتعديل دفعة موجودة في نفس التغييرات
+    assert apply(db, [payment(member, 2, True), payment(member, 1, False)]) == ['inserted', 'updated']
+    total = FinancialSummary.query.filter_by(year=TOTAL_KEY[0], month=TOTAL_KEY[1]).one()
+    assert (total.collected, total.paid_count) == (app.config['MONTHLY_PAYMENT_AMOUNT'], 1)
+    row = db.session.get(MemberArrears, member.id)
+    assert (row.unpaid_count, row.oldest_period) == (1, 202501)
+
+
+def test_member_conflict(db, member):
+    original = {'name': 'عضو', 'village': 'قرية', 'membership_fee': '5000'}
+    change = {'type': 'member', 'id': member.id, 'name': 'عضو جديد', 'village': 'قرية',
+              'membership_fee': '6000', 'original': original}
+    # مدير آخر غيّر الاسم بعد تحميل الصفحة
+    member.name = 'اسم آخر'
+    db.session.commit()
+    assert apply(db, [change]) == ['conflict']
+    assert db.session.get(Member, member.id).membership_fee == 5000
+
+    # تغيير حقل لم يعدّله الآخر لا يتعارض
+    assert apply(db, [{**change, 'name': 'اسم آخر'}]) == ['updated']
+    assert db.session.get(Member, member.id).membership_fee == 6000
+
+
+def test_not_found(db, member):
+    assert apply(db, [payment(member, 1, False, member_id=member.id + 1),
+                      {'type': 'member', 'id': member.id + 1, 'name': 'x', 'membership_fee': 1}]) == \
+        ['not_found', 'not_found']
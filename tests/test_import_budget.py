@@ -0,0 +1,53 @@
+"""زمن استيراد التطبيق عند إقلاع العامل والمكتبات التي يجب ألا تُستورد حينها
+
+يُستورد app في عملية مستقلة مع python -X importtime (كما يفعل عامل gunicorn عند الإقلاع). الحد
+الزمني قابل للتعديل بمتغير IMPORT_BUDGET (بالثواني).
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# مكتبات التصدير والتقارير والحساب: تُستورد داخل مسارات التصدير والمهام عند أول استخدام فقط
+LAZY_MODULES = ('numpy', 'pandas', 'openpyxl', 'docx', 'reportlab', 'excel_utils', 'expense_import',
+                'pdf_reports', 'word_reports', 'payment_matrix', 'depreciation')
+
+PROBE = '''
+import time
+start = time.perf_counter()
+import app
+print(f"{time.perf_counter() - start:.4f}")
+'''
+
+
+def parse_importtime(stderr):
+    """[(الوحدة، الزمن التراكمي بالمايكروثانية)] من مخرجات -X importtime"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def import_app(tmp_path):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(tmp_path / 'budget.db'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], env=env, cwd=ROOT,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return float(result.stdout.split()[-1]), parse_importtime(result.stderr)
+
+
+def test_heavy_modules_are_lazy(tmp_path):
+    _, modules = import_app(tmp_path)
+    loaded = sorted({name.split('.')[0] for name, _ in modules} & set(LAZY_MODULES))
+    assert not loaded, f'وحدات يجب أن تُستورد عند الحاجة فقط: {", ".join(loaded)}'
+
+
+def test_import_time_budget(tmp_path):
+    budget = float(os.environ.get('IMPORT_BUDGET', 1.0))
+    elapsed, modules = import_app(tmp_path)
+    heaviest = sorted(modules, key=lambda module: module[1], reverse=True)[:10]
+    assert elapsed <= budget, f'import app: {elapsed:.3f} ثانية > {budget}، الأثقل: {heaviest}'
@@ -0,0 +1,52 @@
+"""تنفيذ المهام الخلفية وتنظيف المهام المنتهية وملفاتها"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from jobs import enqueue_job, get_results_folder, job_handler, purge_finished_jobs, work
+from models import Job
+
+
+@job_handler('test_write_file')
+def write_file_job(job, name):
+    from flask import current_app
+    path = os.path.join(get_results_folder(current_app), name)
+    with open(path, 'w') as f:
+        f.write('ok')
+    return {'message': 'done', 'file': (path, name)}
+
+
+def test_inline_without_workers(app, db):
+    job = enqueue_job('test_write_file', name='inline.txt')
+    assert job.status == 'done' and os.path.exists(job.result_path)
+
+
+def test_queued_for_workers(app, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOBS_INLINE', False)
+    job_id = enqueue_job('test_write_file', name='queued.txt').id
+    assert db.session.get(Job, job_id).status == 'queued'
+    work(app, once=True)
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'done'
+
+
+def test_purge_finished_jobs(app, db, monkeypatch):
+    old, recent = (enqueue_job('test_write_file', name=name) for name in ('old.txt', 'recent.txt'))
+    old.finished_at = datetime.utcnow() - timedelta(hours=48)
+    monkeypatch.setitem(app.config, 'JOBS_INLINE', False)
+    waiting = enqueue_job('import_expenses', path=os.path.join(get_results_folder(app), 'upload.json'))
+    db.session.commit()
+    stale = time.time() - 48 * 3600
+    for name in ('upload.json', 'orphan.xlsx'):
+        path = os.path.join(get_results_folder(app), name)
+        open(path, 'w').close()
+        os.utime(path, (stale, stale))
+    old_path, recent_path = old.result_path, recent.result_path
+
+    assert purge_finished_jobs(app) == 1
+    assert {job.id for job in Job.query} == {recent.id, waiting.id}
+    assert not os.path.exists(old_path) and os.path.exists(recent_path)
+    # ملف مهمة لم تُنفذ بعد يبقى، والملف اليتيم القديم يُحذف
+    folder = get_results_folder(app)
+    assert os.path.exists(os.path.join(folder, 'upload.json'))
+    assert not os.path.exists(os.path.join(folder, 'orphan.xlsx'))
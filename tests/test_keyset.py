@@ -0,0 +1,32 @@
+"""ترقيم المشتركين بالمفتاح (رقم العضو)"""
+from models import Member
+
+
+def test_keyset_pages(db):
+    db.session.add_all(Member(member_number=number, name=f'عضو {number}') for number in range(1, 26))
+    db.session.commit()
+
+    first = Member.keyset_page(Member.query, 10)
+    assert [member.member_number for member in first] == list(range(1, 11))
+    assert (first.has_prev, first.next_after) == (False, 10)
+
+    second = Member.keyset_page(Member.query, 10, after=first.next_after)
+    assert [member.member_number for member in second] == list(range(11, 21))
+    assert (second.prev_before, second.next_after) == (11, 20)
+
+    last = Member.keyset_page(Member.query, 10, after=second.next_after)
+    assert [member.member_number for member in last] == list(range(21, 26))
+    assert not last.has_next
+
+    back = Member.keyset_page(Member.query, 10, before=last.prev_before)
+    assert [member.member_number for member in back] == list(range(11, 21))
+    assert back.has_next and back.has_prev
+
+
+def test_keyset_filtered(db):
+    db.session.add_all(Member(member_number=number, name=f'عضو {number}', village='قرية' if number % 2 else 'وادي')
+                       for number in range(1, 8))
+    db.session.commit()
+    page = Member.keyset_page(Member.filtered(village='قرية'), 2, after=3)
+    assert [member.member_number for member in page] == [5, 7]
+    assert not page.has_next
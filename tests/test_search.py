@@ -0,0 +1,57 @@
+"""فهرس البحث على SQLite: يُحدَّث من بايثون ولا يعتمد على دوال معرّفة في الاتصال"""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from expense_import import frame_from_json, import_expenses
+from models import Expense, Project
+from search import install_search_index, search
+
+
+@pytest.fixture
+def index(db):
+    install_search_index()
+    return db
+
+
+def found(query):
+    return [(hit.kind, hit.id) for hit in search(query).items]
+
+
+def test_index_follows_session_writes(index):
+    expense = Expense(description='صيانة المضخة', amount=100, date=datetime(2025, 1, 5), category='صيانة')
+    project = Project(title='قناة الري', description='تبطين القناة الرئيسية', cost=500)
+    index.session.add_all([expense, project])
+    index.session.commit()
+    # التطبيع: "القناه" تطابق "القناة" بعد حذف "ال" وتوحيد التاء المربوطة
+    assert found('القناه') == [('project', project.id)]
+    assert found('مضخه') == [('expense', expense.id)]
+
+    expense.description = 'شراء سماد'
+    index.session.commit()
+    assert found('مضخه') == [] and found('سماد') == [('expense', expense.id)]
+
+    index.session.delete(project)
+    index.session.commit()
+    assert found('قناة') == []
+
+
+def test_other_writers_do_not_fail(index):
+    index.session.commit()
+    with sqlite3.connect(index.engine.url.database) as connection:
+        connection.execute("INSERT INTO expense (description, amount, date, category, period) "
+                           "VALUES ('ديزل', 20, '2025-02-01', 'وقود', 202502)")
+    assert found('ديزل') == []
+    install_search_index()
+    assert found('ديزل') == [('expense', Expense.query.one().id)]
+
+
+def test_bulk_import_is_indexed(index):
+    index.session.add(Expense(description='قديم', amount=5, date=datetime(2025, 1, 1), category='أخرى'))
+    index.session.commit()
+    df = frame_from_json([{'description': 'أسمدة عضوية', 'amount': 10, 'date': '2025-03-01'},
+                          {'description': 'إصلاح بوابة', 'amount': 20, 'date': '2025-03-02'}])
+    assert import_expenses(df, chunk_size=1)['inserted'] == 2
+    assert {kind for kind, _ in found('اسمده')} == {'expense'}
+    assert len(found('بوابه')) == 1 and len(found('قديم')) == 1
@@ -0,0 +1,45 @@
+"""تلفيات متزامنة على نفس الأصل: لا يضيع أي خصم من قيمته"""
+import threading
+from datetime import datetime
+
+import pytest
+
+from models import Asset, Spoilage
+
+THREADS = 4
+ADDITIONS = 5
+
+
+def test_concurrent_spoilage_keeps_every_decrement(app, db):
+    asset = Asset(name='مضخة', purchase_value=1000, current_value=0, depreciation_rate=0,
+                  purchase_date=datetime(2024, 1, 1))
+    db.session.add(asset)
+    db.session.commit()
+    asset_id, start_value = asset.id, asset.current_value
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def add_spoilage(by_name):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+        # نصف الخيوط تربط التلف بالأصل بالاسم (قراءة قبل الكتابة)، والنصف الآخر بالمعرّف
+        data = {'item_name': 'مضخة', 'original_value': 1, 'spoilage_value': 10}
+        if not by_name:
+            data['asset_id'] = asset_id
+        barrier.wait()
+        for _ in range(ADDITIONS):
+            response = client.post('/admin/spoilage/add', data=data, follow_redirects=True)
+            if 'حدث خطأ' in response.get_data(as_text=True):
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=add_spoilage, args=(index % 2 == 0,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.session.expire_all()
+    assert errors == []
+    assert Spoilage.query.filter_by(asset_id=asset_id).count() == THREADS * ADDITIONS
+    assert db.session.get(Asset, asset_id).current_value == pytest.approx(start_value - THREADS * ADDITIONS * 10)
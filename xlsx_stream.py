@@ -0,0 +1,122 @@
+"""كتابة ملف xlsx كمولّد أجزاء بايت أثناء قراءة الصفوف
+
+ملف xlsx أرشيف zip فيه أجزاء XML؛ الورقة تُكتب صفاً بصف داخل أرشيف zip متدفق (بدون seek)،
+وبعد كل دفعة من الصفوف تُعاد البايتات المضغوطة حتى الآن. لا ملف مؤقت ولا مصنف في الذاكرة،
+فالذاكرة ثابتة مهما كان عدد الصفوف وأول بايت يُرسل بعد أول دفعة.
+"""
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name={name} sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+SHEET_END = '</sheetData></worksheet>'
+
+# محارف التحكم غير المسموحة في XML
+_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ChunkBuffer:
+    """ملف للكتابة فقط يجمع ما يكتبه zipfile حتى يُسحب كجزء واحد"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        chunk = bytes(self.data)
+        self.data.clear()
+        return chunk
+
+
+def column_letter(index):
+    """حرف العمود لفهرس يبدأ من صفر (0 -> A، 26 -> AA)"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _cell(reference, value):
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    text = escape(_ILLEGAL.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def row_xml(number, values, letters):
+    """سطر <row> بترقيم يبدأ من 1 (القيم الفارغة لا تُكتب)"""
+    cells = ''.join(_cell(f'{letters[i]}{number}', value) for i, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+def iter_xlsx(rows, sheet_name='Sheet1', columns=64, batch_rows=500):
+    """مولّد أجزاء ملف xlsx بورقة واحدة من مكرر صفوف (قوائم قيم)
+
+    الصفوف تُستهلك أثناء الكتابة، فيمكن أن تأتي مباشرة من مؤشر قاعدة البيانات.
+    """
+    letters = [column_letter(i) for i in range(columns)]
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK.format(name=quoteattr(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', STYLES)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            pending = []
+            for number, values in enumerate(rows, start=1):
+                if len(values) > len(letters):
+                    letters = [column_letter(i) for i in range(len(values))]
+                pending.append(row_xml(number, values, letters))
+                if len(pending) >= batch_rows:
+                    sheet.write(''.join(pending).encode())
+                    pending = []
+                    chunk = buffer.take()
+                    if chunk:  # قد يحتفظ الضاغط بالبايتات حتى تكتمل كتلته
+                        yield chunk
+            sheet.write((''.join(pending) + SHEET_END).encode())
+    yield buffer.take()